@@ -9,15 +9,135 @@ import sys
 import os
 import cv2  # OpenCV库，用于图像处理
 import numpy as np
-from typing import Optional, Tuple, Dict, Any  # 类型提示
+from typing import Optional, Tuple, Dict, Any, List, Iterable  # 类型提示
 import toml
 import pprint
+import settings_migrate  # 旧版 setting.ini 的ROI迁移
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # 与分组版本共用上级目录的模块
+from roi_index import GridIndex, normalize  # ROI外接矩形的空间索引
+
+
+class RoiTableModel(QtCore.QAbstractTableModel):
+    """
+    ROI列表模型，数据存放在NumPy结构化数组中，每行一个ROI (ID、名称、几何、灰度统计)。
+    不为单元格创建QStandardItem，视图只取可见行的数据；
+    统计量批量更新后对变化的行范围只发一次dataChanged。
+    """
+    name_edited = pyqtSignal(int, str)  # 用户在视图中修改了ROI名称 (roi_id, 新名称)
+
+    # (字段名, 表头)，字段顺序即列顺序
+    COLUMNS = [("id", "ID"), ("name", "ROI名称"), ("x", "X"), ("y", "Y"), ("w", "宽"), ("h", "高"),
+               ("GrayMax", "最大灰度"), ("GrayMin", "最小灰度"), ("GrayMean", "平均灰度"), ("GrayRange", "灰度极差")]
+    DTYPE = np.dtype([("id", np.int64), ("name", "U64")] +
+                     [(field, np.float64) for field, _ in COLUMNS[2:]])
+    NAME_COLUMN = 1
+    FIRST_LIVE_COLUMN = 2  # 从这一列开始随ROI几何和统计量变化
+
+    def __init__(self, parent: Optional[QtCore.QObject] = None):
+        super().__init__(parent)
+        self._data = np.zeros(64, dtype=self.DTYPE)  # 容量按需翻倍，前 _count 行有效
+        self._count = 0
+        self._row_of: Dict[int, int] = {}  # roi_id -> 行号
+
+    def rowCount(self, parent: QtCore.QModelIndex = QtCore.QModelIndex()) -> int:
+        return 0 if parent.isValid() else self._count
+
+    def columnCount(self, parent: QtCore.QModelIndex = QtCore.QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def data(self, index: QtCore.QModelIndex, role: int = QtCore.Qt.DisplayRole) -> Any:
+        if not index.isValid() or role not in (QtCore.Qt.DisplayRole, QtCore.Qt.EditRole):
+            return None
+        value = self._data[index.row()][index.column()]
+        if index.column() < self.FIRST_LIVE_COLUMN:
+            return int(value) if index.column() == 0 else str(value)
+        return f"{value:.2f}"
+
+    def headerData(self, section: int, orientation: QtCore.Qt.Orientation, role: int = QtCore.Qt.DisplayRole) -> Any:
+        if role == QtCore.Qt.DisplayRole and orientation == QtCore.Qt.Horizontal:
+            return self.COLUMNS[section][1]
+        return super().headerData(section, orientation, role)
+
+    def flags(self, index: QtCore.QModelIndex) -> QtCore.Qt.ItemFlags:
+        flags = super().flags(index)
+        if index.column() == self.NAME_COLUMN:
+            flags |= QtCore.Qt.ItemIsEditable  # ROI名称可在视图中修改
+        return flags
+
+    def setData(self, index: QtCore.QModelIndex, value: Any, role: int = QtCore.Qt.EditRole) -> bool:
+        if role != QtCore.Qt.EditRole or index.column() != self.NAME_COLUMN:
+            return False
+        self._data["name"][index.row()] = str(value)
+        self.dataChanged.emit(index, index)
+        self.name_edited.emit(self.roi_id(index.row()), str(value))
+        return True
+
+    def roi_id(self, row: int) -> int:
+        """某行的ROI ID"""
+        return int(self._data["id"][row])
+
+    def row_of(self, roi_id: int) -> Optional[int]:
+        """ROI所在行，O(1)"""
+        return self._row_of.get(roi_id)
+
+    def add_roi(self, roi: 'RectROI') -> None:
+        """在末尾添加一行"""
+        if self._count == len(self._data):
+            self._data = np.resize(self._data, 2 * len(self._data))
+        row = self._count
+        self.beginInsertRows(QtCore.QModelIndex(), row, row)
+        self._data[row] = (roi.unique_id, roi.name) + (0.0,) * (len(self.COLUMNS) - 2)
+        self._fill_live(np.array([row]), [roi])
+        self._row_of[roi.unique_id] = row
+        self._count += 1
+        self.endInsertRows()
+
+    def remove_roi(self, roi_id: int) -> None:
+        """删除一行，其后各行整体前移"""
+        row = self._row_of.pop(roi_id, None)
+        if row is None:
+            return
+        self.beginRemoveRows(QtCore.QModelIndex(), row, row)
+        self._data[row:self._count - 1] = self._data[row + 1:self._count]
+        self._count -= 1
+        for moved_row in range(row, self._count):
+            self._row_of[int(self._data["id"][moved_row])] = moved_row
+        self.endRemoveRows()
+
+    def clear(self) -> None:
+        """删除所有行"""
+        self.beginResetModel()
+        self._count = 0
+        self._row_of.clear()
+        self.endResetModel()
+
+    def update_rois(self, rois: Iterable['RectROI']) -> None:
+        """按ROI当前的几何和统计量刷新对应行，只对变化的行范围发一次dataChanged"""
+        rois = [roi for roi in rois if roi.unique_id in self._row_of]
+        if not rois:
+            return
+        rows = np.array([self._row_of[roi.unique_id] for roi in rois])
+        self._fill_live(rows, rois)
+        self.dataChanged.emit(self.index(int(rows.min()), self.FIRST_LIVE_COLUMN),
+                              self.index(int(rows.max()), len(self.COLUMNS) - 1),
+                              [QtCore.Qt.DisplayRole])
+
+    def _fill_live(self, rows: np.ndarray, rois: List['RectROI']) -> None:
+        """按列写入几何和统计量，每个字段一次向量化赋值"""
+        data = self._data
+        data["x"][rows] = [roi.pos().x() for roi in rois]
+        data["y"][rows] = [roi.pos().y() for roi in rois]
+        data["w"][rows] = [roi.size().x() for roi in rois]
+        data["h"][rows] = [roi.size().y() for roi in rois]
+        for field, _ in self.COLUMNS[6:]:
+            data[field][rows] = [roi.image_stats.get(field, 0) for roi in rois]
+
 
 class ROIManager(QtCore.QObject):
     """ROI管理器，负责ROI的创建、删除和状态跟踪"""
     roi_selected = pyqtSignal(object)  # 当ROI被选中时发射信号
 
-    def __init__(self, plot_widget: pg.PlotWidget, list_model: QStandardItemModel, image_item: pg.ImageItem):
+    def __init__(self, plot_widget: pg.PlotWidget, list_model: RoiTableModel, image_item: pg.ImageItem):
         super().__init__()
         self.plot = plot_widget  # 绘图区域
         self.list_model = list_model  # ROI列表的数据模型
@@ -25,6 +145,8 @@ class ROIManager(QtCore.QObject):
         self.current_image: Optional[np.ndarray] = None  # 当前显示的图像
         self.active_roi: Optional[RectROI] = None  # 当前活动的ROI
         self.rois: Dict[int, RectROI] = {}  # 存储所有ROI的字典，键是ROI的ID
+        self.spatial = GridIndex()  # ROI外接矩形的网格索引，用于点选
+        self.plot.scene().sigMouseClicked.connect(self._on_plot_clicked)  # 点选经空间索引，不再由各ROI自己响应
 
     def add_roi(self,x=50,y=50,w=100,h=100, unique_id: Optional[int] = None, name: Optional[str] = None) -> None:
         """添加新的ROI"""
@@ -55,50 +177,74 @@ class ROIManager(QtCore.QObject):
         """连接ROI的信号槽"""
         roi.sigRegionChanged.connect(lambda: self._on_roi_changed(roi))  # ROI区域变化信号
         roi.sigRemoveRequested.connect(lambda: self.remove_roi(roi))  # ROI移除请求信号
-        roi.sigClicked.connect(lambda: self._on_roi_changed(roi))  # ROI点击信号
         
 
     def _update_roi_list(self, roi: 'RectROI') -> None:
         """更新ROI列表"""
         self.rois[roi.unique_id] = roi  # 将ROI添加到字典
-        # 在列表模型中添加ROI的名称和ID
-        self.list_model.appendRow([
-            QStandardItem(roi.name),
-            QStandardItem(str(roi.unique_id))
-        ])
+        self.spatial.insert(roi.unique_id, roi.bounds())
+        self.list_model.add_roi(roi)  # 在列表模型末尾添加一行
 
     def remove_roi(self, roi: 'RectROI') -> None:
         """删除指定ROI"""
         self.plot.removeItem(roi)  # 从绘图区域移除
         del self.rois[roi.unique_id]  # 从字典中删除
+        self.spatial.remove(roi.unique_id)
+        if self.active_roi is roi:
+            self.active_roi = None
         self._remove_from_list(roi.unique_id)  # 从列表模型中删除
 
     def _remove_from_list(self, roi_id: int) -> None:
         """从列表模型中移除指定ROI"""
-        for row in range(self.list_model.rowCount()):
-            if self.list_model.item(row, 1).text() == str(roi_id):
-                self.list_model.removeRow(row)  # 删除对应行
-                break
+        self.list_model.remove_roi(roi_id)  # 按ID直接定位行
 
     def clear_all_rois(self) -> None:
         """清除所有ROI"""
         for roi in list(self.rois.values()):
             self.plot.removeItem(roi)  # 逐个移除
         self.rois.clear()  # 清空字典
+        self.spatial.clear()
+        self.active_roi = None
         self.list_model.clear()  # 清空列表模型
 
     def _on_roi_changed(self, roi: 'RectROI') -> None:
         """处理ROI变化事件"""
+        self.spatial.insert(roi.unique_id, roi.bounds())
         if self.current_image is not None:
             roi.update_image_stats(self.current_image)  # 更新ROI内的图像统计信息
+        self.list_model.update_rois([roi])  # 刷新该行的几何和统计列
         self._update_selection(roi)  # 更新选中状态
 
+    def rois_at(self, x: float, y: float) -> List['RectROI']:
+        """图像坐标 (x, y) 处的ROI，按ID排序"""
+        return [self.rois[roi_id] for roi_id in self.spatial.query_point(x, y)]
+
+    def _on_plot_clicked(self, ev) -> None:
+        """
+        图像区域的左键单击：用 rois_at 找出点击处的ROI并选中。
+        先选中最上层 (ID最大) 的ROI；点击处已有选中的ROI时，依次切换到其下重叠的ROI。
+        """
+        if ev.button() != QtCore.Qt.MouseButton.LeftButton or ev.double():
+            return
+        view_box = self.plot.getPlotItem().getViewBox()
+        if not view_box.sceneBoundingRect().contains(ev.scenePos()):
+            return
+        point = view_box.mapSceneToView(ev.scenePos())
+        hits = self.rois_at(point.x(), point.y())
+        if not hits:
+            return
+        index = hits.index(self.active_roi) - 1 if self.active_roi in hits else -1
+        self._update_selection(hits[index])
+
     def _update_selection(self, selected_roi: 'RectROI') -> None:
         """更新选中状态"""
+        previous = self.active_roi
         self.active_roi = selected_roi  # 设置当前活动ROI
-        # 遍历所有ROI，设置边框颜色（选中为绿色，未选中为红色）
-        for roi in self.rois.values():
-            roi.setPen('g' if roi == selected_roi else 'r')
+        # 只重设前后两个ROI的边框颜色（选中为绿色，未选中为红色），拖动时选中的ROI不变则不重设
+        if previous is not None and previous is not selected_roi:
+            previous.setPen('r')
+        if selected_roi is not None and previous is not selected_roi:
+            selected_roi.setPen('g')
         self.roi_selected.emit(selected_roi)  # 发射选中信号
 
     def update_image_data(self, image: np.ndarray) -> None:
@@ -107,6 +253,7 @@ class ROIManager(QtCore.QObject):
         # 更新所有ROI的图像统计信息
         for roi in self.rois.values():
             roi.update_image_stats(image)
+        self.list_model.update_rois(self.rois.values())  # 所有行一次刷新
 
 
 
@@ -216,6 +363,11 @@ class RectROI(pg.RectROI):
         """当前ROI尺寸"""
         return self._dimensions
 
+    def bounds(self) -> Tuple[float, float, float, float]:
+        """图像坐标下的外接矩形 (x0, y0, x1, y1)，供ROIManager的空间索引使用"""
+        pos, size = self.pos(), self.size()
+        return normalize(pos.x(), pos.y(), size.x(), size.y())
+
     def to_dict(self) -> Dict[str, Any]:
         """
         返回 ROI 可序列化的字典表示，用于保存到 TOML 文件。
@@ -271,10 +423,15 @@ class MainWindow(QtWidgets.QMainWindow):
         self.horizontalLayout.addWidget(self.image_viewer)  # 添加到布局
         self.horizontalLayout.setStretch(1, 4)  # 设置布局拉伸因子
 
-        # 初始化ROI列表模型
-        self.roi_list_model = QStandardItemModel()
-        self.roi_list_model.setHorizontalHeaderLabels(["ROI名称", "ID"])
-        self.listView.setModel(self.roi_list_model)
+        # 初始化ROI列表模型：ROI较多时用表格视图显示各列，行高固定，只绘制可见行
+        self.roi_list_model = RoiTableModel(self)
+        self.roiTable = QtWidgets.QTableView()
+        self.verticalLayout_2.replaceWidget(self.listView, self.roiTable)
+        self.listView.deleteLater()
+        self.roiTable.setModel(self.roi_list_model)
+        self.roiTable.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        self.roiTable.verticalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Fixed)
+        self.roiTable.verticalHeader().hide()
 
         # 初始化属性表格模型
         self.property_model = QStandardItemModel()
@@ -303,27 +460,18 @@ class MainWindow(QtWidgets.QMainWindow):
         self.actionLoadRoi.triggered.connect(self.load_roi)  # 加载ROI配置菜单
         self.pushButton_1.clicked.connect(self.roi_manager.add_roi)  # 添加ROI按钮
         self.pushButton_2.clicked.connect(self.roi_manager.clear_all_rois)  # 清除所有ROI按钮
-        self.listView.clicked.connect(self._on_list_clicked)  # ROI列表点击事件
-        self.roi_list_model.itemChanged.connect(self._on_roi_name_changed)  # 列表项变化事件
+        self.roiTable.clicked.connect(self._on_list_clicked)  # ROI列表点击事件
+        self.roi_list_model.name_edited.connect(self._on_roi_name_changed)  # ROI名称修改事件
 
-    def _on_roi_name_changed(self, topLeft: QtCore.QModelIndex) -> None:
+    def _on_roi_name_changed(self, roi_id: int, new_name: str) -> None:
         """
-        处理ROI名称在QListView中被手动修改的事件。
+        处理ROI名称在列表中被手动修改的事件，模型直接给出ROI ID。
         """
-        # 仅处理第一列（ROI名称）的数据变化
-        if topLeft.column() == 0:
-            new_name = topLeft.data(QtCore.Qt.DisplayRole) # 获取新的名称
-            
-            # 获取同一行第二列的ROI ID
-            roi_id_item = self.roi_list_model.item(topLeft.row(), 1)
-            if roi_id_item:
-                roi_id = int(roi_id_item.text())
-                
-                # 在ROIManager中找到对应的RectROI对象并更新其名称
-                if roi_id in self.roi_manager.rois:
-                    roi = self.roi_manager.rois[roi_id]
-                    roi.name = new_name
-                    print(f"ROI ID {roi_id} 的名称已更新为: {new_name}")
+        # 在ROIManager中找到对应的RectROI对象并更新其名称
+        if roi_id in self.roi_manager.rois:
+            roi = self.roi_manager.rois[roi_id]
+            roi.name = new_name
+            print(f"ROI ID {roi_id} 的名称已更新为: {new_name}")
 
     def save_roi(self) -> None:
         #self.roi_manager.rois 是一个字典，其值是 RectROI 类的实例,无法直接序列化为 TOML 格式
@@ -351,14 +499,21 @@ class MainWindow(QtWidgets.QMainWindow):
     def load_roi(self) -> None:
         """加载ROI配置文件"""
         path, _ = QtWidgets.QFileDialog.getOpenFileName(
-            self, "加载ROI配置", "", "ROI配置文件 (*.toml)"
+            self, "加载ROI配置", "", "ROI配置文件 (*.toml *.ini *.npy)"
         )
         if not path:
             print("未选择加载路径")
         else:
             try:
-                with open(path, "r", encoding="utf-8") as f:
-                    rois = toml.load(f)
+                ext = os.path.splitext(path)[1].lower()
+                if ext == ".ini":
+                    # 旧版QSettings配置：不经过pickle反序列化GUI对象，直接解码为TOML结构
+                    rois = settings_migrate.to_toml_dict(settings_migrate.load_settings_rois(path))
+                elif ext == ".npy":
+                    rois = settings_migrate.to_toml_dict(np.load(path))
+                else:
+                    with open(path, "r", encoding="utf-8") as f:
+                        rois = toml.load(f)
                 print("ROI配置文件读取成功")
                 self.roi_manager.clear_all_rois()
                 RectROI._counter = 0 #在加载之前重置 RectROI 的计数器，这样可以确保新生成的 ROI ID 在加载的 ROI ID 之后
@@ -439,10 +594,8 @@ class MainWindow(QtWidgets.QMainWindow):
 
     def _on_list_clicked(self, index: QtCore.QModelIndex) -> None:
         """处理列表点击事件"""
-        # 获取点击项的ID列数据
-        item = self.roi_list_model.itemFromIndex(index.siblingAtColumn(1))
-        if item:
-            roi_id = int(item.text())  # 获取ROI ID
+        if index.isValid():
+            roi_id = self.roi_list_model.roi_id(index.row())  # 获取ROI ID
             if roi_id in self.roi_manager.rois:
                 # 更新选中状态
                 self.roi_manager._update_selection(self.roi_manager.rois[roi_id])
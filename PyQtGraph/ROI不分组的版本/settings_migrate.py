@@ -0,0 +1,206 @@
+"""
+旧版 setting.ini (QSettings) 中ROI配置的迁移。
+旧版用 QSettings 保存ROI，[ROIs] 节下每个ROI有 N\\pos、N\\size 两个键，
+值是 @Variant(...) 包装的 PyQt_PyObject，即 pyqtgraph.Point 或 (x, y) 元组的 pickle。
+这里直接按文本解析ini并解码这些二进制值：不创建 QSettings/QApplication，不导入 pyqtgraph，
+pickle 只允许元组、浮点数和 pyqtgraph.Point（解码为 (x, y) 元组），其他类一律拒绝。
+结果可以写成 save_roi/load_roi 使用的扁平TOML，或打包为结构化数组 (.npy)。
+用法: python settings_migrate.py setting.ini [更多.ini ...] [-o 输出目录] [--format toml|npy]
+"""
+import argparse
+import io
+import os
+import pickle
+import re
+import struct
+import numpy as np
+import toml
+from typing import Optional, Tuple, Dict, Any, List  # 类型提示
+
+SECTION = "ROIs"  # 旧版保存ROI的节名
+VARIANT_PREFIX = "@Variant("
+PYOBJECT_TYPE = b"PyQt_PyObject\0"  # QDataStream 中用户类型的类型名
+# 迁移结果的打包格式，字段与 RectROI.to_dict 相同
+DTYPE = np.dtype([("unique_id", np.int64), ("name", "U64"), ("pos_x", np.float64), ("pos_y", np.float64),
+                  ("size_x", np.float64), ("size_y", np.float64)])
+
+_SIMPLE_ESCAPES = {'a': '\a', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t', 'v': '\v',
+                   'e': '\x1b', '"': '"', "'": "'", '\\': '\\', '?': '?', ';': ';', ',': ','}
+_HEX_DIGITS = "0123456789abcdefABCDEF"
+_KEY_PATTERN = re.compile(r"^(\d+)[\\/](\w+)$")  # 数组形式的键，如 0\pos
+
+
+def unescape_value(text: str) -> str:
+    """
+    按 QSettings 的ini转义规则还原值：去掉双引号，处理 \\n、\\xNN、\\0 等转义。
+    \\x 后的十六进制位和 \\0 后的八进制位按最长匹配读取（QSettings 写入时会转义紧随其后的数字）。
+    """
+    out = []
+    i, n = 0, len(text)
+    while i < n:
+        ch = text[i]
+        i += 1
+        if ch == '"':
+            continue
+        if ch != '\\' or i >= n:
+            out.append(ch)
+            continue
+        ch = text[i]
+        i += 1
+        if ch in _SIMPLE_ESCAPES:
+            out.append(_SIMPLE_ESCAPES[ch])
+        elif ch in 'xX':
+            start = i
+            while i < n and text[i] in _HEX_DIGITS:
+                i += 1
+            out.append(chr(int(text[start:i] or '0', 16)))
+        elif '0' <= ch <= '7':
+            start = i - 1
+            while i < n and '0' <= text[i] <= '7':
+                i += 1
+            out.append(chr(int(text[start:i], 8)))
+        else:
+            out.append(ch)
+    return ''.join(out)
+
+
+def read_ini(path: str) -> Dict[str, Dict[str, str]]:
+    """读取ini的各节 {节名: {键: 未转义的原始值}}，不经过 QSettings"""
+    sections: Dict[str, Dict[str, str]] = {}
+    current = sections.setdefault("General", {})
+    with open(path, "r", encoding="utf-8", errors="surrogateescape") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line[0] in ";#":
+                continue
+            if line.startswith("[") and line.endswith("]"):
+                current = sections.setdefault(line[1:-1], {})
+                continue
+            key, sep, value = line.partition("=")
+            if sep:
+                current[key.strip()] = value.strip()
+    return sections
+
+
+def _point(*args) -> Tuple[float, float]:
+    """代替 pyqtgraph.Point 的构造，pickle 中以 Point((x, y)) 或 Point(x, y) 形式出现"""
+    if len(args) == 1:
+        args = tuple(args[0])
+    if len(args) != 2:
+        raise pickle.UnpicklingError(f"Point 参数个数错误: {args!r}")
+    return float(args[0]), float(args[1])
+
+
+class _SafeUnpickler(pickle.Unpickler):
+    """只允许 pyqtgraph.Point 的受限反序列化，不导入任何模块"""
+    ALLOWED = {("pyqtgraph.Point", "Point"): _point, ("pyqtgraph", "Point"): _point}
+
+    def find_class(self, module: str, name: str):
+        try:
+            return self.ALLOWED[(module, name)]
+        except KeyError:
+            raise pickle.UnpicklingError(f"不允许的类型: {module}.{name}") from None
+
+
+def variant_pickle(value: str) -> bytes:
+    """从 @Variant(...) 值中取出 PyQt_PyObject 的pickle数据"""
+    text = unescape_value(value)
+    if not text.startswith(VARIANT_PREFIX) or not text.endswith(")"):
+        raise ValueError(f"不是 @Variant 值: {value[:40]!r}")
+    blob = text[len(VARIANT_PREFIX):-1].encode("latin-1")
+    start = blob.find(PYOBJECT_TYPE)
+    if start < 0:
+        raise ValueError("@Variant 不是 PyQt_PyObject 类型")
+    start += len(PYOBJECT_TYPE)
+    (size,) = struct.unpack_from(">I", blob, start)  # QDataStream 为大端
+    data = blob[start + 4:start + 4 + size]
+    if len(data) != size:
+        raise ValueError("PyQt_PyObject 数据被截断")
+    return data
+
+
+def decode_point(value: str) -> Tuple[float, float]:
+    """把一个 pos/size 值解码为 (x, y)"""
+    obj = _SafeUnpickler(io.BytesIO(variant_pickle(value))).load()
+    if isinstance(obj, (tuple, list)):
+        return _point(*obj)
+    raise ValueError(f"不是二维坐标: {obj!r}")
+
+
+def load_settings_rois(path: str, section: str = SECTION) -> np.ndarray:
+    """
+    解码 setting.ini 中的全部ROI，返回按序号排序的 DTYPE 数组。
+    旧版不保存ID和名称：unique_id 按顺序从1编号，名称与 RectROI 的默认名称相同；
+    若节中有 N\\unique_id、N\\name 则优先使用。缺少 pos 或 size 的序号跳过。
+    """
+    entries: Dict[int, Dict[str, str]] = {}
+    for key, value in read_ini(path).get(section, {}).items():
+        match = _KEY_PATTERN.match(key)
+        if match:
+            entries.setdefault(int(match.group(1)), {})[match.group(2)] = value
+
+    rois = np.zeros(len(entries), dtype=DTYPE)
+    count = 0
+    for index in sorted(entries):
+        entry = entries[index]
+        if "pos" not in entry or "size" not in entry:
+            print(f"警告: {path} 中第 {index} 个ROI缺少 pos 或 size。跳过。")
+            continue
+        unique_id = int(unescape_value(entry["unique_id"])) if "unique_id" in entry else count + 1
+        name = unescape_value(entry["name"]) if "name" in entry else f"ROI{unique_id}"
+        rois[count] = (unique_id, name) + decode_point(entry["pos"]) + decode_point(entry["size"])
+        count += 1
+    return rois[:count]
+
+
+def to_toml_dict(rois: np.ndarray) -> Dict[str, Dict[str, Any]]:
+    """转换为 save_roi 写出的扁平结构 {ID: {unique_id, name, pos_x, ...}}，坐标保留两位小数"""
+    return {
+        str(int(roi["unique_id"])): {
+            "unique_id": int(roi["unique_id"]),
+            "name": str(roi["name"]),
+            "pos_x": round(float(roi["pos_x"]), 2),
+            "pos_y": round(float(roi["pos_y"]), 2),
+            "size_x": round(float(roi["size_x"]), 2),
+            "size_y": round(float(roi["size_y"]), 2),
+        }
+        for roi in rois
+    }
+
+
+def migrate(path: str, output_dir: Optional[str] = None, fmt: str = "toml") -> str:
+    """迁移一个ini文件，返回写出的文件路径"""
+    rois = load_settings_rois(path)
+    base = os.path.splitext(os.path.basename(path))[0]
+    target = os.path.join(output_dir or os.path.dirname(os.path.abspath(path)), f"{base}.{fmt}")
+    if fmt == "npy":
+        np.save(target, rois)
+    else:
+        with open(target, "w", encoding="utf-8") as f:
+            toml.dump(to_toml_dict(rois), f)
+    return target
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="把旧版 setting.ini 中的ROI迁移为TOML或打包数组")
+    parser.add_argument("inputs", nargs="+", help="旧版ini文件")
+    parser.add_argument("-o", "--output-dir", default=None, help="输出目录，默认与输入文件相同")
+    parser.add_argument("--format", choices=("toml", "npy"), default="toml", help="输出格式")
+    args = parser.parse_args()
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    failed: List[str] = []
+    for path in args.inputs:
+        try:
+            target = migrate(path, args.output_dir, args.format)
+            print(f"{path} -> {target}")
+        except (OSError, ValueError, pickle.UnpicklingError, struct.error) as e:
+            failed.append(path)
+            print(f"{path} 迁移失败: {e}")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
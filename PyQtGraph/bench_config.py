@@ -0,0 +1,60 @@
+"""
+ROI配置加载基准：纯Python toml解析 vs 列式 .roi.npz 缓存。
+生成多摄像头的大型配置写到临时目录，分别计时两种加载方式，并校验结果一致。
+用法: python bench_config.py [摄像头数] [每个摄像头的组数] [每组ROI数]
+"""
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import toml
+import roi_config
+
+REPEAT = 5  # 取最快的一次
+
+
+def make_config(cameras: int, groups: int, rois: int) -> dict:
+    """构造与 setting.toml 同结构的配置"""
+    rng = np.random.default_rng(0)
+    config_data = {}
+    for c in range(1, cameras + 1):
+        section = {"address": f"rtsp://192.168.1.{c}/stream", "ROI": {}}
+        for g in range(1, groups + 1):
+            group_data = {"model_type": "shitu", "model_name": f"model_{g}"}
+            for r in range(1, rois + 1):
+                group_data[f"ROI{r}"] = [int(v) for v in rng.integers(0, 1000, 4)]
+            section["ROI"][f"Group {g}"] = group_data
+        config_data[f"camera{c}"] = section
+    return config_data
+
+
+def best_time(func) -> float:
+    times = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+if __name__ == "__main__":
+    cameras, groups, rois = (int(v) for v in (sys.argv[1:] + ["8", "20", "50"])[:3])
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "setting.toml")
+        roi_config.save_config(path, make_config(cameras, groups, rois))
+
+        def load_toml():
+            with open(path, "rb") as f:
+                return roi_config.groups_from_config(toml.loads(f.read().decode("utf-8")))
+
+        expected = load_toml()
+        actual, cached = roi_config.load_groups(path)
+        assert cached and actual == expected, "缓存内容与TOML解析结果不一致"
+
+        t_toml = best_time(load_toml)
+        t_npz = best_time(lambda: roi_config.load_groups(path))
+        print(f"{cameras}个摄像头 x {groups}组 x {rois}个ROI = {cameras * groups * rois}个ROI")
+        print(f"TOML大小 {os.path.getsize(path) / 1024:.0f} KB, 缓存大小 {os.path.getsize(roi_config.sidecar_path(path)) / 1024:.0f} KB")
+        print(f"toml解析: {t_toml * 1000:.1f} ms")
+        print(f"列式缓存: {t_npz * 1000:.1f} ms  ({t_toml / t_npz:.1f}x)")
@@ -0,0 +1,42 @@
+"""
+GLCM纹理特征微基准：roi_stats中的专用共生计数内核 vs skimage graycomatrix/graycoprops。
+每种ROI尺寸先校验四个特征的数值一致性，再分别计时。
+用法: python bench_glcm.py
+"""
+import timeit
+import numpy as np
+from skimage.feature import graycomatrix, graycoprops  # 对照组
+from roi_stats import GLCM_LEVELS, TEXTURE_KEYS, glcm_features
+
+ROI_SIZES = [8, 16, 32, 64, 128, 256, 512, 1024]  # 方形ROI边长（像素）
+REPEAT = 5  # 取最快的一次，减少调度抖动
+
+
+def skimage_features(quantized: np.ndarray) -> dict:
+    """与 RectROI.update_image_stats 原实现相同的skimage调用方式"""
+    glcm = graycomatrix(quantized, distances=[1], angles=[0], levels=GLCM_LEVELS, symmetric=True, normed=True)
+    return {k: graycoprops(glcm, k.lower())[0, 0] for k in TEXTURE_KEYS}
+
+
+def best_time(func, number: int) -> float:
+    """单次调用耗时（秒）"""
+    return min(timeit.repeat(func, number=number, repeat=REPEAT)) / number
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    print(f"{'尺寸':>8} {'skimage(us)':>12} {'kernel(us)':>13} {'加速比':>8}")
+    for size in ROI_SIZES:
+        region = rng.integers(0, 256, size=(size, size), dtype=np.uint8)
+        quantized = (region // (256 // GLCM_LEVELS)).astype(np.uint8)
+
+        expected = skimage_features(quantized)
+        actual = glcm_features(quantized)
+        for key in TEXTURE_KEYS:
+            if not np.isclose(expected[key], actual[key], rtol=1e-10, atol=1e-12):
+                raise AssertionError(f"{size}x{size} {key}: skimage={expected[key]} kernel={actual[key]}")
+
+        number = max(1, 20000 // size)
+        t_sk = best_time(lambda: skimage_features(quantized), number)
+        t_bc = best_time(lambda: glcm_features(quantized), number)
+        print(f"{size:>4}x{size:<3} {t_sk * 1e6:>12.1f} {t_bc * 1e6:>13.1f} {t_sk / t_bc:>7.1f}x")
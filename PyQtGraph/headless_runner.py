@@ -0,0 +1,328 @@
+"""
+无界面ROI检测：读取与GUI相同的 setting.toml，对视频文件或图片目录逐帧计算
+GrayMax/GrayMin/GrayMean/GrayRange 和 GLCM 纹理特征，结果流式写入 CSV 或 Parquet。
+帧按块分给多个进程并行处理，结果按帧顺序写出，结束时报告处理帧率。
+加 --infer 时按组的 model_type/model_name 批量调用已注册的模型 (见 roi_models)，
+结果写入 model_output 列。
+用法: python headless_runner.py setting.toml 视频文件或图片目录 -o result.csv [-j 进程数] [--infer]
+"""
+import argparse
+import csv
+import glob
+import importlib
+import os
+import sys
+import time
+import multiprocessing as mp
+import cv2  # OpenCV库，用于读取视频和图片
+import numpy as np
+from typing import Optional, Tuple, Dict, Any, List, Iterable  # 类型提示
+import roi_config  # ROI配置读写（TOML + 列式缓存）
+import roi_models  # 按组批量调度模型
+from roi_stats import BatchRoiStats, GRAY_KEYS, TEXTURE_KEYS, STAT_KEYS, Rect, Mask, texture_features_batch, \
+    shape_vertices, polygon_mask
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff")
+COLUMNS = ("frame", "camera", "group", "model_type", "model_name", "roi", "x", "y", "w", "h") + STAT_KEYS
+MODEL_COLUMN = "model_output"  # --infer 时追加的模型输出列
+CHUNK_FRAMES = 32  # 每个任务处理的连续帧数，视频按块定位后顺序解码
+
+RoiEntry = Tuple[str, str, str, str, str, Rect, Optional[np.ndarray]]  # 最后一项为形状ROI的顶点
+
+# 子进程内的ROI表和模型调度参数，由 _init_worker 设置，避免每个任务重复传输
+_worker_rois: List[RoiEntry] = []
+_worker_groups: List[Dict[str, Any]] = []
+_worker_infer: Optional[Dict[str, Any]] = None  # ModelDispatcher的参数，None表示不做推理
+_mask_cache: Dict[Tuple[bytes, int, int], Optional[Mask]] = {}  # (顶点, 宽, 高) -> 掩码，几何固定只算一次
+
+
+def roi_table(groups: List[Dict[str, Any]]) -> List[RoiEntry]:
+    """
+    把组列表展开为 (camera, group, model_type, model_name, roi_name, (x, y, w, h), 顶点) 列表，
+    坐标取整与GUI保存时一致；轴对齐矩形的顶点为None，形状ROI按掩码统计。
+    """
+    rois = []
+    for group in groups:
+        for name, x, y, w, h, spec in group["rois"]:
+            rect = (int(x), int(y), int(w), int(h))
+            vertices = shape_vertices(x, y, w, h, spec) if spec is not None else None
+            rois.append((group["camera"], group["name"], group["model_type"], group["model_name"], name, rect, vertices))
+    return rois
+
+
+def list_images(folder: str) -> List[str]:
+    """目录下的图片文件，按文件名排序作为帧顺序"""
+    paths = [p for p in glob.glob(os.path.join(folder, "*")) if p.lower().endswith(IMAGE_EXTENSIONS)]
+    return sorted(paths)
+
+
+def _padded_region(gray: np.ndarray, rect: Rect) -> Optional[np.ndarray]:
+    """
+    部分越界的ROI按getArrayRegion的方式处理：越界部分补零。
+    返回 (x, y) 方向的灰度区域，与GUI中row-major模式下的区域方向一致；尺寸无效时返回None。
+    """
+    x, y, w, h = rect
+    if w <= 0 or h <= 0:
+        return None
+    region = np.zeros((h, w), dtype=np.uint8)
+    r0, r1 = max(y, 0), min(y + h, gray.shape[0])
+    c0, c1 = max(x, 0), min(x + w, gray.shape[1])
+    if r1 > r0 and c1 > c0:
+        region[r0 - y:r1 - y, c0 - x:c1 - x] = gray[r0:r1, c0:c1]
+    return region.T
+
+
+def _shape_mask(vertices: np.ndarray, width: int, height: int) -> Optional[Mask]:
+    key = (vertices.tobytes(), width, height)
+    if key not in _mask_cache:
+        _mask_cache[key] = polygon_mask(vertices, width, height)
+    return _mask_cache[key]
+
+
+def frame_rows(index: int, image: np.ndarray, rois: List[RoiEntry]) -> List[tuple]:
+    """计算一帧所有ROI的统计量，返回按 COLUMNS 排列的行"""
+    engine = BatchRoiStats(axis_order='row-major')  # 直接使用OpenCV的 image[y, x] 缓冲区
+    engine.set_frame(image)
+    rects = {k: roi[5] for k, roi in enumerate(rois) if roi[6] is None}
+    stats = engine.compute(rects)
+    regions: Dict[int, np.ndarray] = {}
+
+    # 形状ROI：掩码批量归约；完全在图像外的记为0
+    width, height = engine.size()
+    masks = {}
+    for k, roi in enumerate(rois):
+        if roi[6] is not None:
+            mask = _shape_mask(roi[6], width, height)
+            if mask is None:
+                stats[k] = {key: 0 for key in GRAY_KEYS}
+            else:
+                masks[k] = mask
+                regions[k] = engine.masked_crop(mask)
+    stats.update(engine.compute_masked(masks))
+
+    for k, rect in rects.items():
+        if k in stats:
+            regions[k] = engine.crop(rect)
+            continue
+        region = _padded_region(engine.gray, rect)  # 越界ROI，逐个计算
+        if region is None:
+            stats[k] = {key: 0 for key in GRAY_KEYS}
+            continue
+        stats[k] = {
+            'GrayMax': region.max(),
+            'GrayMin': region.min(),
+            'GrayMean': region.mean(),
+            'GrayRange': int(region.max()) - int(region.min())
+        }
+        regions[k] = region
+    textures = texture_features_batch(regions)
+
+    rows = []
+    for k, (camera, group, model_type, model_name, name, rect, _) in enumerate(rois):
+        values = {**stats[k], **textures.get(k, {key: 0 for key in TEXTURE_KEYS})}
+        rows.append((index, camera, group, model_type, model_name, name) + rect +
+                    tuple(float(values[key]) for key in STAT_KEYS))
+    return rows
+
+
+def _format_output(value: Any) -> Any:
+    """模型输出为标量时写数值，否则写成字符串"""
+    value = np.asarray(value)
+    return float(value) if value.ndim == 0 else str(value.tolist())
+
+
+def _init_worker(rois: List[RoiEntry], groups: List[Dict[str, Any]],
+                 infer: Optional[Dict[str, Any]], plugins: List[str]) -> None:
+    global _worker_rois, _worker_groups, _worker_infer
+    _worker_rois, _worker_groups, _worker_infer = rois, groups, infer
+    for module in plugins:
+        importlib.import_module(module)  # 插件模块在导入时用 register_model 注册模型
+    cv2.setNumThreads(1)  # 并行已在进程级完成，避免OpenCV线程池过度订阅
+
+
+def _process_frames(frames: Iterable[Tuple[int, np.ndarray]]) -> List[tuple]:
+    """处理一段连续帧 (帧号, RGB图像)，需要推理时在段内按组攒批调用模型"""
+    if _worker_infer is None:
+        rows = []
+        for index, image in frames:
+            rows.extend(frame_rows(index, image, _worker_rois))
+        return rows
+
+    dispatcher = roi_models.ModelDispatcher(_worker_groups, **_worker_infer)
+    offsets = np.cumsum([0] + [len(group["rois"]) for group in _worker_groups]).tolist()  # 组内下标 -> ROI表下标
+    frame_tables: List[Tuple[int, List[tuple]]] = []
+    outputs: Dict[Tuple[int, int], Any] = {}
+    for index, image in frames:
+        frame_tables.append((index, frame_rows(index, image, _worker_rois)))
+        for frame, g, k, value in dispatcher.submit(index, image):
+            outputs[(frame, offsets[g] + k)] = value
+    for frame, g, k, value in dispatcher.flush():  # 段结束时调用不足一批的组
+        outputs[(frame, offsets[g] + k)] = value
+
+    rows = []
+    for index, table in frame_tables:
+        for k, row in enumerate(table):
+            value = outputs.get((index, k))
+            rows.append(row + (None if value is None else _format_output(value),))
+    return rows
+
+
+def _process_images(task: Tuple[int, List[str]]) -> List[tuple]:
+    """处理一段图片文件，task = (起始帧号, 路径列表)"""
+    start, paths = task
+
+    def frames():
+        for offset, path in enumerate(paths):
+            image = cv2.imread(path)
+            if image is None:
+                print(f"警告: 无法读取图片 '{path}'，跳过。", file=sys.stderr)
+                continue
+            yield start + offset, cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    return _process_frames(frames())
+
+
+def _process_video(task: Tuple[str, int, int]) -> List[tuple]:
+    """处理视频中的一段连续帧，task = (路径, 起始帧号, 帧数)"""
+    path, start, count = task
+
+    def frames():
+        cap = cv2.VideoCapture(path)
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        try:
+            for index in range(start, start + count):
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                yield index, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        finally:
+            cap.release()
+    return _process_frames(frames())
+
+
+def make_tasks(source: str, chunk: int):
+    """按来源类型切分任务，返回 (处理函数, 任务列表)"""
+    if os.path.isdir(source):
+        paths = list_images(source)
+        return _process_images, [(i, paths[i:i + chunk]) for i in range(0, len(paths), chunk)]
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        raise ValueError(f"无法打开视频 '{source}'")
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    if total <= 0:
+        # 帧数未知（例如视频流），无法按帧号切分，整个来源作为一个任务顺序处理
+        return _process_video, [(source, 0, sys.maxsize)]
+    return _process_video, [(source, i, min(chunk, total - i)) for i in range(0, total, chunk)]
+
+
+class CsvSink:
+    """逐块追加写入CSV"""
+    def __init__(self, path: str, infer: bool = False):
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(COLUMNS + ((MODEL_COLUMN,) if infer else ()))
+
+    def write(self, rows: List[tuple]) -> None:
+        self._writer.writerows(rows)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ParquetSink:
+    """逐块写入Parquet的row group，需要安装pyarrow"""
+    def __init__(self, path: str, infer: bool = False):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("写出Parquet需要安装pyarrow (pip install pyarrow)，或改用 .csv 输出") from e
+        self._pa = pa
+        types = [pa.int64()] + [pa.string()] * 5 + [pa.int32()] * 4 + [pa.float64()] * len(STAT_KEYS)
+        columns = COLUMNS
+        if infer:
+            # 标量输出为数值、向量输出为字符串，统一按字符串列保存
+            columns, types = columns + (MODEL_COLUMN,), types + [pa.string()]
+        self._schema = pa.schema(list(zip(columns, types)))
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def write(self, rows: List[tuple]) -> None:
+        if not rows:
+            return
+        columns = list(zip(*rows))
+        if len(columns) > len(COLUMNS):
+            columns[-1] = [None if v is None else str(v) for v in columns[-1]]
+        arrays = [self._pa.array(col, type=field.type) for col, field in zip(columns, self._schema)]
+        self._writer.write_table(self._pa.Table.from_arrays(arrays, schema=self._schema))
+
+    def close(self) -> None:
+        self._writer.close()
+
+
+def open_sink(path: str, infer: bool = False):
+    """按扩展名选择输出格式"""
+    if path.lower().endswith(".parquet"):
+        return ParquetSink(path, infer)
+    return CsvSink(path, infer)
+
+
+def run(config_path: str, source: str, output: str, workers: int = 0,
+        camera: Optional[str] = None, chunk: int = CHUNK_FRAMES,
+        infer: Optional[Dict[str, Any]] = None, plugins: Tuple[str, ...] = ()) -> Tuple[int, float]:
+    """
+    执行无界面检测，返回 (处理帧数, 帧率)。
+    camera 指定只使用某个 [cameraN] 段的ROI，默认使用配置中的全部ROI。
+    workers <= 0 时使用CPU核数。
+    infer 为 ModelDispatcher 的参数 (input_size/batch_size/max_latency)，None 表示不做推理；
+    plugins 为注册模型的模块名，在每个子进程中导入。
+    """
+    groups, _ = roi_config.load_groups(config_path)
+    if camera is not None:
+        groups = [group for group in groups if group["camera"] == camera]
+    rois = roi_table(groups)
+    if not rois:
+        raise ValueError("配置中没有可用的ROI")
+    func, tasks = make_tasks(source, chunk)
+    workers = workers if workers > 0 else (os.cpu_count() or 1)
+
+    sink = open_sink(output, infer is not None)
+    frames = set()
+    start = time.perf_counter()
+    try:
+        with mp.Pool(workers, initializer=_init_worker, initargs=(rois, groups, infer, list(plugins))) as pool:
+            # imap保持任务顺序，结果按帧号顺序写出，同时不必等全部任务完成
+            for rows in pool.imap(func, tasks):
+                sink.write(rows)
+                frames.update(row[0] for row in rows)
+                elapsed = time.perf_counter() - start
+                print(f"\r已处理 {len(frames)} 帧  {len(frames) / elapsed:.1f} fps", end="", file=sys.stderr)
+    finally:
+        sink.close()
+    elapsed = time.perf_counter() - start
+    fps = len(frames) / elapsed if elapsed > 0 else 0.0
+    print(f"\r共处理 {len(frames)} 帧, {len(rois)} 个ROI, 耗时 {elapsed:.2f} s, {fps:.1f} fps", file=sys.stderr)
+    return len(frames), fps
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="无界面ROI检测")
+    parser.add_argument("config", help="ROI配置文件 (setting.toml)")
+    parser.add_argument("source", help="视频文件或图片目录")
+    parser.add_argument("-o", "--output", default="result.csv", help="输出文件，扩展名为 .parquet 时写Parquet，否则写CSV")
+    parser.add_argument("-j", "--workers", type=int, default=0, help="进程数，默认使用CPU核数")
+    parser.add_argument("-c", "--camera", default=None, help="只使用指定摄像头段 (如 camera1) 的ROI")
+    parser.add_argument("--chunk", type=int, default=CHUNK_FRAMES, help="每个任务处理的连续帧数")
+    parser.add_argument("--infer", action="store_true", help="按组的 model_type/model_name 调用已注册的模型")
+    parser.add_argument("--plugin", action="append", default=[], help="导入时注册模型的模块，可重复指定")
+    parser.add_argument("--input-size", type=int, nargs=2, default=roi_models.DEFAULT_INPUT_SIZE,
+                        metavar=("W", "H"), help="送入模型的裁剪图尺寸")
+    parser.add_argument("--batch-size", type=int, default=1, help="每个组攒够多少帧调用一次模型")
+    parser.add_argument("--max-latency-ms", type=float, default=0.0, help="攒批的最长等待时间（毫秒），0 表示不限制")
+    args = parser.parse_args()
+    infer = None
+    if args.infer:
+        infer = {"input_size": tuple(args.input_size), "batch_size": args.batch_size,
+                 "max_latency": args.max_latency_ms / 1000.0}
+    for module in args.plugin:
+        importlib.import_module(module)  # 主进程中也导入一次，尽早发现插件错误
+    run(args.config, args.source, args.output, args.workers, args.camera, args.chunk, infer, tuple(args.plugin))
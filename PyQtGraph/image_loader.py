@@ -0,0 +1,237 @@
+"""图像文件的内存映射加载
+未压缩的格式 (.npy、RAW单色/Bayer数据、未压缩且条带连续的TIFF) 通过 numpy.memmap 打开，
+不把整幅图读入内存；颜色转换（去马赛克、高位深缩放）推迟到显示时按块进行，
+ROI统计使用的uint8灰度图尽量是映射缓冲区本身或其零拷贝视图。
+其他格式仍用 cv2.imread 解码，颜色顺序在原缓冲区上就地转换。
+"""
+import os
+import struct
+import cv2  # OpenCV库，用于解码和去马赛克
+import numpy as np
+from typing import Optional, Tuple, Dict, List, NamedTuple  # 类型提示
+from image_pyramid import Convert, to_display
+
+RAW_EXTENSIONS = ('.raw', '.bin')  # 需要用户给出宽高和像素格式的裸数据
+GRAY_STRIP_ROWS = 1024  # 逐条带计算灰度图时每次处理的行数
+
+# Bayer排列（左上角2x2）对应的OpenCV转换码，OpenCV按第二行第二、三个像素命名
+BAYER_CODES = {
+    'rggb': cv2.COLOR_BayerBG2RGB,
+    'bggr': cv2.COLOR_BayerRG2RGB,
+    'grbg': cv2.COLOR_BayerGB2RGB,
+    'gbrg': cv2.COLOR_BayerGR2RGB,
+}
+
+
+class RawFormat(NamedTuple):
+    """RAW文件的布局：宽、高、像素格式 (mono 或 Bayer排列)、有效位深、文件头字节数"""
+    width: int
+    height: int
+    pattern: str = 'mono'  # 'mono' 或 BAYER_CODES 中的排列
+    bits: int = 8  # 8 为uint8，其余 (10/12/14/16) 按小端uint16存放
+    offset: int = 0
+
+
+class LoadedImage(NamedTuple):
+    """
+    data: image[y, x] 原始缓冲区（可能是内存映射）
+    convert: 原始数据块 -> uint8显示数据块
+    gray: ROI统计使用的uint8灰度图 image[y, x]
+    """
+    data: np.ndarray
+    convert: Convert
+    gray: np.ndarray
+
+
+def parse_raw_format(text: str) -> RawFormat:
+    """
+    解析 "宽x高 像素格式 [文件头字节数]"，例如 "4096x3000 mono8"、"4096x3000 bayer_rggb12 512"。
+    像素格式为 mono 或 bayer_<排列>，后接有效位深。
+    """
+    parts = text.split()
+    if len(parts) not in (2, 3):
+        raise ValueError(f"RAW格式应为 '宽x高 像素格式 [文件头字节数]'：{text!r}")
+    width, height = (int(v) for v in parts[0].lower().split('x'))
+    name = parts[1].lower()
+    digits = len(name) - len(name.rstrip('0123456789'))
+    if digits == 0:
+        raise ValueError(f"像素格式缺少位深：{parts[1]!r}")
+    pattern, bits = name[:-digits].rstrip('_'), int(name[-digits:])
+    if pattern.startswith('bayer'):
+        pattern = pattern[len('bayer'):].lstrip('_')
+        if pattern not in BAYER_CODES:
+            raise ValueError(f"不支持的Bayer排列：{pattern!r}，可选 {', '.join(BAYER_CODES)}")
+    elif pattern != 'mono':
+        raise ValueError(f"不支持的像素格式：{parts[1]!r}")
+    if not 8 <= bits <= 16:
+        raise ValueError(f"位深应在8到16之间：{bits}")
+    offset = int(parts[2]) if len(parts) == 3 else 0
+    return RawFormat(width, height, pattern, bits, offset)
+
+
+def _scale_to_uint8(block: np.ndarray, bits: int) -> np.ndarray:
+    """高位深数据缩放到uint8"""
+    if block.dtype == np.uint8:
+        return block
+    return (block >> max(bits - 8, 0)).astype(np.uint8)
+
+
+def make_convert(bits: int = 8, pattern: str = 'mono') -> Convert:
+    """按位深和Bayer排列生成显示转换，块的起点需落在偶数行列上（金字塔块满足）"""
+    code = BAYER_CODES.get(pattern)
+
+    def convert(block: np.ndarray) -> np.ndarray:
+        block = _scale_to_uint8(block, bits)
+        if code is not None and min(block.shape[:2]) >= 2:
+            block = cv2.cvtColor(np.ascontiguousarray(block), code)
+        return block
+    return convert
+
+
+def gray_view(data: np.ndarray, bits: int = 8) -> np.ndarray:
+    """
+    ROI统计用的uint8灰度图。
+    uint8单通道直接返回原缓冲区；小端uint16且有效位深为16时返回高字节的零拷贝跨步视图；
+    其余情况（多通道、10/12/14位）逐条带转换到一个uint8数组，每像素只占1字节。
+    Bayer数据按原始马赛克值统计。
+    """
+    if data.ndim == 2 and data.dtype == np.uint8:
+        return data
+    if data.ndim == 2 and bits == 16 and data.dtype.itemsize == 2 and data.flags.c_contiguous:
+        high = 1 if data.dtype.byteorder == '<' or (data.dtype.byteorder == '=' and np.little_endian) else 0
+        return data.view(np.uint8)[:, high::2]
+    gray = np.empty(data.shape[:2], dtype=np.uint8)
+    for y0 in range(0, data.shape[0], GRAY_STRIP_ROWS):
+        strip = _scale_to_uint8(data[y0:y0 + GRAY_STRIP_ROWS], bits)
+        if strip.ndim == 3:
+            strip = cv2.cvtColor(np.ascontiguousarray(strip[..., :3]), cv2.COLOR_RGB2GRAY)
+        gray[y0:y0 + GRAY_STRIP_ROWS] = strip
+    return gray
+
+
+def _mapped(data: np.ndarray, bits: int = 8, pattern: str = 'mono') -> LoadedImage:
+    convert = make_convert(bits, pattern) if (bits, pattern) != (8, 'mono') else to_display
+    return LoadedImage(data, convert, gray_view(data, bits))
+
+
+def open_raw(path: str, fmt: RawFormat) -> LoadedImage:
+    """内存映射RAW文件"""
+    dtype = np.uint8 if fmt.bits == 8 else np.dtype('<u2')
+    expected = fmt.offset + fmt.width * fmt.height * np.dtype(dtype).itemsize
+    if os.path.getsize(path) < expected:
+        raise ValueError(f"文件大小 {os.path.getsize(path)} 字节小于格式所需的 {expected} 字节")
+    data = np.memmap(path, dtype=dtype, mode='r', offset=fmt.offset, shape=(fmt.height, fmt.width))
+    return _mapped(data, fmt.bits, fmt.pattern)
+
+
+def open_npy(path: str) -> LoadedImage:
+    """内存映射 .npy，数组按 image[y, x] 或 image[y, x, RGB] 解释"""
+    data = np.load(path, mmap_mode='r')
+    if data.ndim not in (2, 3) or not np.issubdtype(data.dtype, np.integer):
+        raise ValueError(f"不支持的数组：形状 {data.shape}，类型 {data.dtype}")
+    return _mapped(data, data.dtype.itemsize * 8)
+
+
+_TIFF_TYPES = {3: 'H', 4: 'I', 16: 'Q'}  # SHORT、LONG、LONG8
+
+
+def _tiff_tags(f, big: bool, endian: str, ifd: int) -> Dict[int, List[int]]:
+    """读取第一个IFD中的整数型标签"""
+    f.seek(ifd)
+    count_fmt, entry_size = ('Q', 20) if big else ('H', 12)
+    (count,) = struct.unpack(endian + count_fmt, f.read(struct.calcsize(count_fmt)))
+    entries = f.read(count * entry_size)
+    tags: Dict[int, List[int]] = {}
+    for k in range(count):
+        entry = entries[k * entry_size:(k + 1) * entry_size]
+        if big:
+            tag, typ, n = struct.unpack(endian + 'HHQ', entry[:12])
+            payload, inline = entry[12:], 8
+        else:
+            tag, typ, n = struct.unpack(endian + 'HHI', entry[:8])
+            payload, inline = entry[8:], 4
+        if typ not in _TIFF_TYPES:
+            continue
+        fmt = endian + _TIFF_TYPES[typ] * n
+        size = struct.calcsize(fmt)
+        if size > inline:
+            (pointer,) = struct.unpack(endian + ('Q' if big else 'I'), payload)
+            pos = f.tell()
+            f.seek(pointer)
+            data = f.read(size)
+            f.seek(pos)
+        else:
+            data = payload[:size]
+        tags[tag] = list(struct.unpack(fmt, data))
+    return tags
+
+
+def tiff_layout(path: str) -> Optional[Tuple[int, np.dtype, Tuple[int, ...]]]:
+    """
+    未压缩、按像素交错、条带在文件中首尾相接的TIFF返回 (数据偏移, dtype, 形状)，
+    可以整体映射；其他情况（压缩、分块、条带不连续等）返回None。
+    """
+    with open(path, 'rb') as f:
+        header = f.read(16)
+        endian = {b'II': '<', b'MM': '>'}.get(header[:2])
+        if endian is None:
+            return None
+        (version,) = struct.unpack(endian + 'H', header[2:4])
+        if version == 42:
+            big, (ifd,) = False, struct.unpack(endian + 'I', header[4:8])
+        elif version == 43:
+            big, (ifd,) = True, struct.unpack(endian + 'Q', header[8:16])
+        else:
+            return None
+        tags = _tiff_tags(f, big, endian, ifd)
+
+    width, height = tags.get(256, [0])[0], tags.get(257, [0])[0]
+    bits = tags.get(258, [1])
+    samples = tags.get(277, [1])[0]
+    offsets, counts = tags.get(273), tags.get(279)
+    if tags.get(259, [1])[0] != 1 or tags.get(284, [1])[0] != 1 or tags.get(339, [1])[0] != 1:
+        return None  # 压缩、平面存储或非无符号整数
+    if not width or not height or not offsets or not counts or len(set(bits)) != 1 or bits[0] not in (8, 16):
+        return None
+    if any(o + c != n for o, c, n in zip(offsets, counts, offsets[1:])):
+        return None  # 条带不连续
+    dtype = np.dtype(endian + ('u1' if bits[0] == 8 else 'u2'))
+    shape = (height, width) if samples == 1 else (height, width, samples)
+    if sum(counts) < int(np.prod(shape)) * dtype.itemsize:
+        return None
+    return offsets[0], dtype, shape
+
+
+def open_tiff(path: str) -> Optional[LoadedImage]:
+    """内存映射TIFF，不能映射时返回None"""
+    layout = tiff_layout(path)
+    if layout is None:
+        return None
+    offset, dtype, shape = layout
+    data = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape)
+    return _mapped(data, dtype.itemsize * 8)
+
+
+def decode_image(path: str) -> LoadedImage:
+    """用OpenCV解码压缩格式，BGR在原缓冲区上就地转成RGB，不产生第二份整图拷贝"""
+    image = cv2.imread(path)
+    if image is None:
+        raise ValueError("无法读取图像文件")
+    cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image)
+    return LoadedImage(image, to_display, gray_view(image))
+
+
+def open_image(path: str, raw_format: Optional[RawFormat] = None) -> LoadedImage:
+    """按扩展名选择加载方式；RAW文件必须给出 raw_format"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in RAW_EXTENSIONS:
+        if raw_format is None:
+            raise ValueError("RAW文件需要指定宽高和像素格式")
+        return open_raw(path, raw_format)
+    if ext == '.npy':
+        return open_npy(path)
+    if ext in ('.tif', '.tiff'):
+        loaded = open_tiff(path)
+        if loaded is not None:
+            return loaded
+    return decode_image(path)
@@ -0,0 +1,221 @@
+"""大图的分块多分辨率显示
+ImagePyramid 对 image[y, x] 原始缓冲区（可以是 numpy.memmap）逐条带构建一次2倍降采样金字塔，
+各级存放在临时目录的内存映射文件中，整图不会同时驻留内存；
+TiledImageLayer 根据视图缩放选择金字塔级别，只为可见的块创建 pg.ImageItem，
+块数据按需从映射数组读取并缓存最近使用的若干块。
+"""
+import math
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+import cv2  # OpenCV库，用于降采样
+import numpy as np
+import pyqtgraph as pg
+from PyQt5 import QtCore
+from typing import Optional, Tuple, Dict, List, Callable  # 类型提示
+
+TILE_SIZE = 512  # 块边长（像素），各级相同
+TILE_CACHE = 256  # 缓存的块数
+TILED_PIXELS = 20_000_000  # 超过此像素数的图像使用分块显示
+
+Convert = Callable[[np.ndarray], np.ndarray]  # 原始数据块 -> uint8 显示数据块
+
+
+def to_display(block: np.ndarray) -> np.ndarray:
+    """默认的显示转换：uint8原样返回，其他整数类型按位宽缩放到uint8"""
+    if block.dtype == np.uint8:
+        return block
+    if np.issubdtype(block.dtype, np.integer):
+        shift = max(block.dtype.itemsize * 8 - 8, 0)
+        return (block >> shift).astype(np.uint8)
+    return np.clip(block, 0, 255).astype(np.uint8)
+
+
+class ImagePyramid:
+    """
+    分块多分辨率图像。
+    source: image[y, x] 或 image[y, x, c] 原始数据，只按块切片读取
+    convert: 原始数据块到uint8显示数据的转换（如Bayer去马赛克、BGR转RGB），只作用于读取的块
+    第0级直接读 source，第k级宽高为第k-1级的一半（向下取整），直到不超过一个块。
+    """
+
+    def __init__(self, source: np.ndarray, convert: Convert = to_display, tile: int = TILE_SIZE,
+                 workdir: Optional[str] = None):
+        self.source = source
+        self.convert = convert
+        self.tile = tile
+        self.height, self.width = source.shape[:2]
+        self._tmpdir = tempfile.mkdtemp(prefix="pyramid_", dir=workdir)
+        self.levels: List[np.ndarray] = [source]
+        try:
+            self._build()
+        except BaseException:
+            self.close()
+            raise
+
+    def _build(self) -> None:
+        """逐条带降采样，每次只处理 2*tile 行"""
+        rows = 2 * self.tile
+        level = 0
+        h, w = self.height, self.width
+        while max(h, w) > self.tile and min(h, w) >= 2:
+            prev = self.levels[level]
+            h2, w2 = h // 2, w // 2
+            sample = self._display(prev, level, 0, 0, min(2, h), min(2, w))
+            out = np.lib.format.open_memmap(os.path.join(self._tmpdir, f"level{level + 1}.npy"), mode="w+",
+                                            dtype=np.uint8, shape=(h2, w2) + sample.shape[2:])
+            for y0 in range(0, h2 * 2, rows):
+                y1 = min(y0 + rows, h2 * 2)
+                strip = self._display(prev, level, y0, 0, y1, w2 * 2)
+                out[y0 // 2:y1 // 2] = cv2.resize(strip, (w2, (y1 - y0) // 2), interpolation=cv2.INTER_AREA) \
+                    .reshape(out[y0 // 2:y1 // 2].shape)
+            out.flush()
+            self.levels.append(out)
+            level += 1
+            h, w = h2, w2
+
+    def _display(self, array: np.ndarray, level: int, y0: int, x0: int, y1: int, x1: int) -> np.ndarray:
+        """读取某级的一块显示数据，只有第0级需要转换"""
+        block = array[y0:y1, x0:x1]
+        if level == 0:
+            block = self.convert(block)
+        return np.ascontiguousarray(block)
+
+    @property
+    def depth(self) -> int:
+        return len(self.levels)
+
+    def level_shape(self, level: int) -> Tuple[int, int]:
+        """某级的 (宽, 高)"""
+        h, w = self.levels[level].shape[:2]
+        return w, h
+
+    def level_for(self, pixel_size: float) -> int:
+        """每个屏幕像素对应 pixel_size 个原图像素时应使用的级别"""
+        if pixel_size <= 1:
+            return 0
+        return min(int(math.log2(pixel_size)), self.depth - 1)
+
+    def tile_grid(self, level: int) -> Tuple[int, int]:
+        """某级的块数 (列, 行)"""
+        w, h = self.level_shape(level)
+        return -(-w // self.tile), -(-h // self.tile)
+
+    def tile_rect(self, level: int, col: int, row: int) -> Tuple[float, float, float, float]:
+        """块在原图坐标下的 (x, y, w, h)，各级按实际缩放比例对齐原图"""
+        w, h = self.level_shape(level)
+        sx, sy = self.width / w, self.height / h
+        x0, y0 = col * self.tile, row * self.tile
+        x1, y1 = min(x0 + self.tile, w), min(y0 + self.tile, h)
+        return x0 * sx, y0 * sy, (x1 - x0) * sx, (y1 - y0) * sy
+
+    def read_tile(self, level: int, col: int, row: int) -> np.ndarray:
+        """读取一个块的显示数据 (行, 列[, 通道])"""
+        w, h = self.level_shape(level)
+        x0, y0 = col * self.tile, row * self.tile
+        return self._display(self.levels[level], level, y0, x0, min(y0 + self.tile, h), min(x0 + self.tile, w))
+
+    def read_level(self, level: int) -> np.ndarray:
+        """读取整级的显示数据，用于最粗一级"""
+        w, h = self.level_shape(level)
+        return self._display(self.levels[level], level, 0, 0, h, w)
+
+    def visible_tiles(self, level: int, x0: float, y0: float, x1: float, y1: float) -> List[Tuple[int, int]]:
+        """原图坐标矩形 [x0, x1) x [y0, y1) 覆盖的 (列, 行)"""
+        w, h = self.level_shape(level)
+        span_x, span_y = self.tile * self.width / w, self.tile * self.height / h
+        cols, rows = self.tile_grid(level)
+        c0, c1 = max(int(x0 // span_x), 0), min(int(math.ceil(x1 / span_x)), cols)
+        r0, r1 = max(int(y0 // span_y), 0), min(int(math.ceil(y1 / span_y)), rows)
+        return [(c, r) for r in range(r0, r1) for c in range(c0, c1)]
+
+    def close(self) -> None:
+        """释放各级映射并删除临时文件"""
+        self.levels = self.levels[:1]
+        shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+
+class TiledImageLayer(QtCore.QObject):
+    """
+    在 ViewBox 中按可见范围显示 ImagePyramid 的块。
+    最粗一级始终作为整图底图显示，切换级别或块尚未加载时不会露出空白；
+    视图范围变化时只增删可见块对应的 ImageItem，块数据经LRU缓存复用。
+    """
+
+    def __init__(self, view_box: pg.ViewBox, pyramid: ImagePyramid, z: float = -10,
+                 cache_size: int = TILE_CACHE):
+        super().__init__()
+        self.view_box = view_box
+        self.pyramid = pyramid
+        self.z = z
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[int, int, int], np.ndarray]" = OrderedDict()
+        self._items: Dict[Tuple[int, int, int], pg.ImageItem] = {}  # 当前显示的块
+        self._spare: List[pg.ImageItem] = []  # 移出视图的ImageItem，供下次复用
+        self._base = self._make_item(z - 1)
+        self._show_tile(self._base, None)
+        self.view_box.sigRangeChanged.connect(self.refresh)
+        self.view_box.sigResized.connect(self.refresh)
+
+    def _make_item(self, z: float) -> pg.ImageItem:
+        item = pg.ImageItem(axisOrder='row-major')
+        item.setZValue(z)
+        self.view_box.addItem(item, ignoreBounds=True)
+        return item
+
+    def _tile_data(self, key: Tuple[int, int, int]) -> np.ndarray:
+        data = self._cache.get(key)
+        if data is not None:
+            self._cache.move_to_end(key)
+            return data
+        data = self.pyramid.read_tile(*key)
+        self._cache[key] = data
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return data
+
+    def _show_tile(self, item: pg.ImageItem, key: Optional[Tuple[int, int, int]]) -> None:
+        if key is None:
+            # 底图：最粗一级整级显示，边长不超过一个块
+            data = self.pyramid.read_level(self.pyramid.depth - 1)
+            rect = (0, 0, self.pyramid.width, self.pyramid.height)
+        else:
+            data = self._tile_data(key)
+            rect = self.pyramid.tile_rect(*key)
+        item.setImage(data, autoLevels=False, levels=(0, 255))
+        item.setRect(QtCore.QRectF(*rect))
+        item.show()
+
+    def refresh(self, *args) -> None:
+        """按当前视图范围和缩放更新显示的块"""
+        (x0, x1), (y0, y1) = self.view_box.viewRange()
+        px, py = self.view_box.viewPixelSize()
+        level = self.pyramid.level_for(max(px, py))
+        if level == self.pyramid.depth - 1:
+            wanted = set()  # 最粗一级由底图显示
+        else:
+            wanted = {(level, c, r) for c, r in self.pyramid.visible_tiles(level, x0, y0, x1, y1)}
+        for key in list(self._items.keys() - wanted):
+            item = self._items.pop(key)
+            item.hide()
+            self._spare.append(item)
+        for key in wanted - self._items.keys():
+            item = self._spare.pop() if self._spare else self._make_item(self.z)
+            self._show_tile(item, key)
+            self._items[key] = item
+
+    def visible_count(self) -> int:
+        """当前显示的块数（不含底图）"""
+        return len(self._items)
+
+    def close(self) -> None:
+        """从视图移除所有块并释放金字塔"""
+        self.view_box.sigRangeChanged.disconnect(self.refresh)
+        self.view_box.sigResized.disconnect(self.refresh)
+        for item in list(self._items.values()) + self._spare + [self._base]:
+            self.view_box.removeItem(item)
+        self._items.clear()
+        self._spare.clear()
+        self._cache.clear()
+        self.pyramid.close()
@@ -1,16 +1,26 @@
 # 导入必要的库
 from PyQt5 import QtWidgets, QtCore, QtGui
-from PyQt5.QtCore import pyqtSignal, QTimer, QModelIndex
+from PyQt5.QtCore import pyqtSignal, QTimer, QModelIndex, QPersistentModelIndex, QThreadPool, QRunnable
 from PyQt5.QtGui import QStandardItemModel, QStandardItem
-from skimage.feature import graycomatrix, graycoprops #计算灰度共生矩阵
 from PyQt5.uic import loadUi
 import pyqtgraph as pg  # 强大的绘图库
 import sys
 import os
+import time
 import cv2  # OpenCV库，用于图像处理
 import numpy as np
 from typing import Optional, Tuple, Dict, Any, List  # 类型提示
-import toml
+import roi_config  # ROI配置读写（TOML + 列式缓存）
+from collections import deque  # 采集线程与GUI之间的有界帧队列
+from roi_stats import BatchRoiStats, TileChangeTracker, texture_features_batch, STAT_KEYS, GRAY_KEYS, TEXTURE_KEYS, CHANGE_THRESHOLD, \
+    Mask, shape_vertices, polygon_mask  # ROI批量统计引擎
+from roi_history import RoiHistory  # ROI统计量时间序列
+import stage_profiler  # 分阶段耗时统计
+from image_pyramid import ImagePyramid, TiledImageLayer, TILED_PIXELS, to_display, Convert  # 大图分块显示
+import image_loader  # 图像文件的内存映射加载
+from session_replay import SessionWriter  # 会话录制
+from roi_index import GridIndex, normalize  # ROI外接矩形的空间索引
+from stage_profiler import StageProfiler
 # import pprint # 移除不必要的pprint导入
 
 # QStandardItem的自定义数据角色
@@ -21,20 +31,147 @@ class CustomRoles:
     GroupModelTypeRole = QtCore.Qt.UserRole + 3 # 新增：组的模型类型
     GroupModelNameRole = QtCore.Qt.UserRole + 4 # 新增：组的模型名称
 
+class _TextureSignals(QtCore.QObject):
+    """QRunnable不是QObject，借助此对象把后台结果以信号形式送回GUI线程"""
+    finished = pyqtSignal(object)  # {roi_id: 纹理特征字典}
+
+
+class _TextureJob(QRunnable):
+    """后台纹理特征计算任务，一次处理一批ROI区域"""
+    def __init__(self, regions: Dict[int, np.ndarray], signals: _TextureSignals):
+        super().__init__()
+        self.regions = regions
+        self.signals = signals
+
+    def run(self) -> None:
+        # 无论计算是否出错都要为每个ROI发回结果，否则TexturePool会一直认为它们在计算中
+        results = {roi_id: {k: 0.0 for k in TEXTURE_KEYS} for roi_id in self.regions}
+        try:
+            try:
+                results.update(texture_features_batch(self.regions))
+            except Exception:
+                # 批量计算出错时逐个重算，只有出错的ROI按0处理
+                for roi_id, region in self.regions.items():
+                    try:
+                        results.update(texture_features_batch({roi_id: region}))
+                    except Exception as e:
+                        print(f"ROI {roi_id} 纹理特征计算失败，按0处理: {e}")
+        finally:
+            self.signals.finished.emit(results)
+
+
+class TexturePool(QtCore.QObject):
+    """
+    GLCM纹理特征的后台线程池。
+    每个ROI同一时刻最多只有一个任务在算；计算期间再次提交的区域只保留最新的一份，
+    任务结束后再统一提交，这样拖动时只计算最后的几何位置。
+    """
+    texture_ready = pyqtSignal(int, object)  # (roi_id, 纹理特征字典)
+
+    def __init__(self, parent: Optional[QtCore.QObject] = None):
+        super().__init__(parent)
+        self.pool = QThreadPool.globalInstance()
+        self._running: set = set()  # 正在计算的ROI ID
+        self._pending: Dict[int, np.ndarray] = {}  # 等待计算的最新区域
+        self._signals = _TextureSignals()
+        self._signals.finished.connect(self._on_finished)  # 跨线程信号，自动排队到GUI线程
+
+    def submit(self, regions: Dict[int, np.ndarray]) -> None:
+        """提交一批ROI区域，正在计算中的ROI只更新其待算区域"""
+        self._pending.update(regions)
+        self._flush()
+
+    def cancel(self, roi_id: int) -> None:
+        """丢弃ROI尚未开始的计算（ROI被删除时调用）"""
+        self._pending.pop(roi_id, None)
+
+    def _flush(self) -> None:
+        """把所有不在计算中的待算区域打包成一个任务"""
+        ready = {roi_id: region for roi_id, region in self._pending.items() if roi_id not in self._running}
+        if not ready:
+            return
+        for roi_id in ready:
+            del self._pending[roi_id]
+        self._running.update(ready)
+        self.pool.start(_TextureJob(ready, self._signals))
+
+    def _on_finished(self, results: Dict[int, Dict[str, float]]) -> None:
+        self._running.difference_update(results)
+        for roi_id, features in results.items():
+            self.texture_ready.emit(roi_id, features)
+        self._flush()
+
+
 class ROIManager(QtCore.QObject):
     """ROI管理器，负责ROI的创建、删除和状态跟踪"""
     roi_selected = pyqtSignal(object)  # 当ROI被选中时发射信号
     group_selected = pyqtSignal(object) # 当Group被选中时发射信号，修改为object以允许None
 
-    def __init__(self, plot_widget: pg.PlotWidget, tree_model: QStandardItemModel, image_item: pg.ImageItem):
+    def __init__(self, plot_widget: pg.PlotWidget, tree_model: QStandardItemModel, image_item: pg.ImageItem,
+                 profiler: Optional[StageProfiler] = None):
         super().__init__()
         self.plot = plot_widget  # 绘图区域
         self.tree_model = tree_model  # ROI列表的数据模型 (现在是QTreeView的模型)
         self.image_item = image_item  # 图像项
-        self.current_image: Optional[np.ndarray] = None  # 当前显示的图像 (已校正方向的图像)
-        self.active_roi: Optional['RectROI'] = None  # 当前活动的ROI对象
-        self.rois: Dict[int, 'RectROI'] = {}  # 存储所有ROI的字典，键是ROI的ID
+        self.current_image: Optional[np.ndarray] = None  # 当前显示的图像 (与image_item的axisOrder一致)
+        self.active_roi: Optional['RoiBase'] = None  # 当前活动的ROI对象
+        self.rois: Dict[int, 'RoiBase'] = {}  # 存储所有ROI的字典，键是ROI的ID
         self.active_group_item: Optional[QStandardItem] = None # 当前选中的QStandardItem (组项)
+        # 树模型索引：增删ROI时同步维护，选中和删除不再遍历整棵树
+        self._roi_index: Dict[int, QPersistentModelIndex] = {}  # roi_id -> ROI名称项的持久索引
+        self._roi_group: Dict[int, QPersistentModelIndex] = {}  # roi_id -> 所属组项的持久索引
+        self._group_rois: Dict[QPersistentModelIndex, set] = {}  # 组项的持久索引 -> ROI ID集合
+        self.stats_engine = BatchRoiStats(axis_order=image_item.axisOrder)  # 整帧共享的批量统计引擎
+        self.texture_pool = TexturePool(self)  # GLCM纹理特征在后台线程计算
+        self.texture_pool.texture_ready.connect(self._on_texture_ready)
+        self.frame_diff = TileChangeTracker()  # 帧间变化检测，画面静止的ROI沿用上次结果
+        self.rois_skipped = 0  # 因所在块未变化而跳过统计的ROI次数
+        self.rois_updated = 0  # 重新统计的ROI次数
+        self.profiler = profiler if profiler is not None else StageProfiler()  # 分阶段耗时
+        self.history = RoiHistory()  # 摄像头模式下每帧的统计量历史
+        self.recorder: Optional[SessionWriter] = None  # 正在录制的会话，记录帧和ROI操作事件
+        self.spatial = GridIndex()  # ROI外接矩形的网格索引，用于点选和重叠查询
+        self.plot.scene().sigMouseClicked.connect(self._on_plot_clicked)  # 点选经空间索引，不再由各ROI自己响应
+
+    def _record(self, event: str, /, **data) -> None:
+        """录制会话时写入一个ROI事件"""
+        if self.recorder is not None:
+            self.recorder.write_event(event, **data)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """按树视图顺序导出当前的组、ROI及其完整状态，作为会话录制的起点"""
+        groups, ids, states = [], [], []
+        for group_row in range(self.tree_model.rowCount()):
+            group_item = self.tree_model.item(group_row, 0)
+            rois = []
+            for roi_id in self._ordered_group_ids(group_item):
+                roi = self.rois[roi_id]
+                pos, size = roi.pos(), roi.size()
+                rois.append((roi.name, pos.x(), pos.y(), size.x(), size.y(), roi.shape_spec()))
+                ids.append(roi_id)
+                states.append(roi.saveState())
+            groups.append({"name": group_item.text(),
+                           "model_type": group_item.data(CustomRoles.GroupModelTypeRole),
+                           "model_name": group_item.data(CustomRoles.GroupModelNameRole),
+                           "rois": rois})
+        selected = self.active_roi.unique_id if self.active_roi is not None else None
+        return {"groups": groups, "ids": ids, "states": states, "selected": selected}
+
+    def _ordered_group_ids(self, group_item: QStandardItem) -> List[int]:
+        """组下ROI的ID，按树视图中的行顺序"""
+        ids = [group_item.child(row, 0).data(CustomRoles.RoiIdRole) for row in range(group_item.rowCount())]
+        return [roi_id for roi_id in ids if roi_id in self.rois]
+
+    def start_session(self, writer: SessionWriter) -> None:
+        """开始录制会话：先写入当前状态快照"""
+        self.recorder = writer
+        self._record("snapshot", **self.snapshot())
+
+    def stop_session(self) -> None:
+        """停止录制并关闭文件"""
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
 
     def set_active_group_item(self, item: Optional[QStandardItem]) -> None:
         """设置当前激活的组节点"""
@@ -52,70 +189,221 @@ class ROIManager(QtCore.QObject):
                 i += 1
             group_name = f"Group {i}"
 
+        group_item = self._make_group_item(group_name, model_type, model_name)
+        self.tree_model.appendRow(group_item)
+        self._group_rois[QPersistentModelIndex(group_item.index())] = set()
+        self._record("group", name=group_name, model_type=model_type, model_name=model_name)
+        return group_item
+
+    def _make_group_item(self, group_name: str, model_type: str, model_name: str) -> QStandardItem:
+        """创建组节点（尚未加入模型）"""
         group_item = QStandardItem(group_name)
         group_item.setEditable(True) 
         # 将模型类型和名称存储到自定义角色中
         group_item.setData(model_type, CustomRoles.GroupModelTypeRole)
         group_item.setData(model_name, CustomRoles.GroupModelNameRole)
-        self.tree_model.appendRow(group_item)
         return group_item
 
-    def add_roi(self, x=50, y=50, w=100, h=100, unique_id: Optional[int] = None, name: Optional[str] = None) -> Optional['RectROI']:
-        """添加新的ROI到当前选中的组下"""
+    def add_groups_bulk(self, groups: List[Dict[str, Any]]) -> List[QStandardItem]:
+        """
+        批量添加组和ROI，用于加载大型配置。
+        groups: [{"name", "model_type", "model_name", "rois": [(roi_name, x, y, w, h, spec), ...]}, ...]
+        组和ROI的树节点先在模型外组装好，每个组连同其下全部ROI行只插入模型一次；
+        ROI批量加入场景期间暂停自动缩放和重绘；最后统一做一次批量统计。
+        """
+        group_items: List[QStandardItem] = []
+        created: List[Tuple[QStandardItem, List[Tuple['RoiBase', QStandardItem]]]] = []
+        for group in groups:
+            group_item = self._make_group_item(group["name"], group["model_type"], group["model_name"])
+            rows = []
+            for roi, name_item, id_item in self._create_rois_bulk(group["rois"]):
+                group_item.appendRow([name_item, id_item])  # 组节点尚未加入模型，不会触发模型信号
+                rows.append((roi, name_item))
+            group_items.append(group_item)
+            created.append((group_item, rows))
+
+        for group_item, rows in created:
+            # 注意: QStandardItem.insertRows(row, items) 不会把模型传递给孙节点，导致其索引无效，
+            # 因此按组用appendRow插入，每个组只触发一次rowsInserted
+            self.tree_model.appendRow(group_item)
+            group_key = QPersistentModelIndex(group_item.index())
+            self._group_rois[group_key] = set()
+            for roi, name_item in rows:
+                self._register_roi(roi, name_item, group_key)
+        self._record("groups", groups=groups, ids=[roi.unique_id for _, rows in created for roi, _ in rows])
+
+        if self.current_image is not None:
+            self.update_image_data(self.current_image)  # 所有ROI一次批量统计
+        return group_items
+
+    def _create_rois_bulk(self, rois: List[Tuple[str, float, float, float, float, Optional[Dict[str, Any]]]]
+                          ) -> List[Tuple['RoiBase', QStandardItem, QStandardItem]]:
+        """
+        批量创建ROI并加入场景，期间暂停自动缩放和重绘。
+        返回 [(roi, 名称项, ID项), ...]，树节点由调用方插入模型后再用 _register_roi 登记。
+        """
+        created = []
+        view_box = self.plot.getPlotItem().getViewBox()
+        auto_range = view_box.autoRangeEnabled()
+        view_box.disableAutoRange()
+        self.plot.setUpdatesEnabled(False)
+        try:
+            for roi_name, x, y, w, h, spec in rois:
+                roi = self._create_roi(x, y, w, h, name=roi_name, spec=spec)
+                self._setup_roi_handles(roi)  # 加入场景前设置控制点，避免每个控制点触发视图更新
+                self.plot.addItem(roi)  # 将ROI添加到绘图区域
+                self._connect_roi_signals(roi)  # 连接信号槽
+                self.rois[roi.unique_id] = roi
+                created.append((roi,) + self._make_roi_row(roi))
+        finally:
+            view_box.enableAutoRange(x=auto_range[0], y=auto_range[1])
+            self.plot.setUpdatesEnabled(True)
+        return created
+
+    def add_roi_grid(self, seed: 'RoiBase', rows: int, cols: int, pitch: Tuple[float, float],
+                     group_item: Optional[QStandardItem] = None) -> List['RoiBase']:
+        """
+        以 seed 为第1行第1列，按间距 pitch=(dx, dy) 生成 rows x cols 的ROI阵列（托盘、PCB等），
+        形状和尺寸与 seed 相同，名称为 "<seed名称>_<行>_<列>"。
+        group_item: 保存到的组，默认为 seed 所在的组；与 seed 同组时跳过 seed 占据的格子。
+        生成的名称与组内已有ROI重名时（如同一seed再次生成阵列）抛出ValueError，不创建任何ROI。
+        ROI经批量路径一次创建，统计量一次批量计算（已有ROI的结果沿用缓存）。
+        """
+        seed_group = self._roi_group.get(seed.unique_id)
+        if group_item is None:
+            if seed_group is None or not seed_group.isValid():
+                raise ValueError(f"ROI {seed.unique_id} 不属于任何组")
+            group_item = self.tree_model.itemFromIndex(QModelIndex(seed_group))
+        group_key = QPersistentModelIndex(group_item.index())
+        pos, size = seed.pos(), seed.size()
+        existing = {self.rois[roi_id].name for roi_id in self._group_rois.get(group_key, ()) if roi_id in self.rois}
+        layout = roi_config.grid_layout((seed.name, pos.x(), pos.y(), size.x(), size.y(), seed.shape_spec()),
+                                        rows, cols, pitch, skip_seed=group_key == seed_group, existing=existing)
+        created = self._create_rois_bulk(layout)
+        for roi, name_item, id_item in created:
+            group_item.appendRow([name_item, id_item])
+            self._register_roi(roi, name_item, group_key)
+        rois = [roi for roi, _, _ in created]
+        self._record("grid", group=group_item.row(), seed=seed.unique_id, rows=rows, cols=cols,
+                     pitch=list(pitch), ids=[roi.unique_id for roi in rois])
+
+        if self.current_image is not None:
+            self.update_image_data(self.current_image)  # 只有新ROI需要统计，一次批量算完
+        return rois
+
+    def group_roi_ids(self, group_item: QStandardItem) -> List[int]:
+        """组下所有ROI的ID"""
+        return list(self._group_rois.get(QPersistentModelIndex(group_item.index()), ()))
+
+    def roi_model_index(self, roi_id: int) -> QModelIndex:
+        """ROI名称项在树模型中的索引，O(1)查找；不存在时返回无效索引"""
+        index = self._roi_index.get(roi_id)
+        return QModelIndex(index) if index is not None and index.isValid() else QModelIndex()
+
+    def remove_group(self, group_item: QStandardItem) -> None:
+        """删除组及其下所有ROI"""
+        for roi_id in self.group_roi_ids(group_item):
+            self.remove_roi_by_id(roi_id)
+        self._record("remove_group", group=group_item.row())
+        group_key = QPersistentModelIndex(group_item.index())
+        self._group_rois.pop(group_key, None)
+        self.tree_model.removeRow(group_item.row())
+
+    def add_roi(self, x=50, y=50, w=100, h=100, unique_id: Optional[int] = None, name: Optional[str] = None,
+                spec: Optional[Dict[str, Any]] = None) -> Optional['RoiBase']:
+        """添加新的ROI到当前选中的组下，spec 为形状参数 (见 roi_config.parse_roi)，None 表示轴对齐矩形"""
         if self.active_group_item is None:
             QtWidgets.QMessageBox.warning(None, "提示", "请先选中一个分组再添加ROI！")
             return None
 
-        roi = RectROI(
-            image_item=self.image_item,  # 传递图像项引用
-            pos=[x, y],  # 初始位置
-            size=[w, h],  # 初始大小
-            unique_id=unique_id, # 传递 unique_id 给 RectROI
-            name=name,           # 传递 name 给 RectROI
+        roi = self._create_roi(x, y, w, h, unique_id=unique_id, name=name, spec=spec)
+        self.plot.addItem(roi)  # 将ROI添加到绘图区域
+        self._setup_roi_handles(roi)  # 设置ROI的控制点
+        self._connect_roi_signals(roi)  # 连接信号槽
+        self._update_roi_list(roi, self.active_group_item)  # 更新ROI列表，添加到当前组下
+        self._record("add", group=self.active_group_item.row(), id=roi.unique_id, name=roi.name,
+                     rect=[x, y, w, h], spec=spec, state=roi.saveState())
+        return roi
+
+    def _create_roi(self, x, y, w, h, unique_id: Optional[int] = None, name: Optional[str] = None,
+                    spec: Optional[Dict[str, Any]] = None) -> 'RoiBase':
+        """创建ROI对象（尚未加入绘图区域），按 spec 的形状选择ROI类"""
+        options = dict(
+            unique_id=unique_id, # 传递 unique_id 给 ROI
+            name=name,           # 传递 name 给 ROI
             pen={'color': 'r', 'width': 1},  # 红色边框
             movable=True,  # 可移动
-            rotatable=False,  # 不可旋转
             removable=True  # 可移除
         )
+        shape = spec['shape'] if spec is not None else 'rect'
+        if shape == 'polygon':
+            roi = PolygonROI(self.image_item, spec['points'], **options)
+        elif shape == 'ellipse':
+            roi = EllipseROI(self.image_item, [x, y], [w, h], angle=spec.get('angle', 0.0), **options)
+        else:
+            roi = RectROI(
+                image_item=self.image_item,  # 传递图像项引用
+                pos=[x, y],  # 初始位置
+                size=[w, h],  # 初始大小
+                rotatable=spec is not None,  # 只有旋转矩形可旋转
+                angle=spec.get('angle', 0.0) if spec is not None else 0.0,
+                **options
+            )
         roi.setAcceptedMouseButtons(QtCore.Qt.MouseButton.LeftButton) # 设置接受鼠标左键事件
-        self.plot.addItem(roi)  # 将ROI添加到绘图区域
-        self._setup_roi_handles(roi)  # 设置ROI的控制点
-        self._connect_roi_signals(roi)  # 连接信号槽
-        self._update_roi_list(roi, self.active_group_item)  # 更新ROI列表，添加到当前组下
         return roi
 
-    def _setup_roi_handles(self, roi: pg.RectROI) -> None:
-        """配置ROI的缩放控制点"""
+    def _setup_roi_handles(self, roi: 'RoiBase') -> None:
+        """配置ROI的缩放控制点；椭圆和多边形使用pyqtgraph自带的控制点"""
+        if not isinstance(roi, RectROI):
+            return
+        if roi.rotatable:
+            roi.addRotateHandle((1, 1), (0.5, 0.5))  # 右下角旋转控制点，绕中心旋转
         roi.addScaleHandle((1, 0), (0, 1))  # 右上角控制点
         roi.addScaleHandle((0, 1), (1, 0))  # 左上角控制点
         roi.addScaleHandle((0, 0), (1, 1))  # 左下角控制点
 
-    def _connect_roi_signals(self, roi: 'RectROI') -> None:
+    def _connect_roi_signals(self, roi: 'RoiBase') -> None:
         """连接ROI的信号槽"""
         roi.sigRegionChanged.connect(lambda: self._on_roi_changed(roi))  # ROI区域变化信号
         roi.sigRemoveRequested.connect(lambda: self.remove_roi_obj(roi))  # ROI移除请求信号 (从UI右键菜单触发)
-        roi.sigClicked.connect(lambda: self._on_roi_clicked(roi))  # ROI点击信号 (为了在UI中激活选中)
         
 
-    def _update_roi_list(self, roi: 'RectROI', parent_item: QStandardItem) -> None:
+    def _update_roi_list(self, roi: 'RoiBase', parent_item: QStandardItem) -> None:
         """更新ROI列表 (QTreeView)"""
         self.rois[roi.unique_id] = roi  # 将ROI对象添加到字典
 
-        # 创建ROI名称和ID的QStandardItem
+        roi_name_item, roi_id_item = self._make_roi_row(roi)
+        # 将ROI添加到父组项下
+        parent_item.appendRow([roi_name_item, roi_id_item])
+        self._register_roi(roi, roi_name_item, QPersistentModelIndex(parent_item.index()))
+
+    def _make_roi_row(self, roi: 'RoiBase') -> Tuple[QStandardItem, QStandardItem]:
+        """创建ROI名称和ID的QStandardItem"""
         roi_name_item = QStandardItem(roi.name)
         roi_name_item.setEditable(True) # ROI名称可编辑
         roi_id_item = QStandardItem(str(roi.unique_id))
         roi_id_item.setEditable(False) # ROI ID不可编辑
 
-        # 将ROI对象本身存储在roi_name_item的UserRole中，方便查找
+        # 将ROI的ID存储在roi_name_item的自定义角色中，方便查找
         roi_name_item.setData(roi.unique_id, CustomRoles.RoiIdRole)
-        
-        # 将ROI添加到父组项下
-        parent_item.appendRow([roi_name_item, roi_id_item])
+        return roi_name_item, roi_id_item
+
+    def _register_roi(self, roi: 'RoiBase', roi_name_item: QStandardItem, group_key: QPersistentModelIndex) -> None:
+        """ROI节点加入模型后登记到索引"""
+        self._roi_index[roi.unique_id] = QPersistentModelIndex(roi_name_item.index())
+        self._roi_group[roi.unique_id] = group_key
+        self._group_rois.setdefault(group_key, set()).add(roi.unique_id)
+        self.spatial.insert(roi.unique_id, roi.bounds())
 
-    def remove_roi_obj(self, roi: 'RectROI') -> None:
+    def remove_roi_obj(self, roi: 'RoiBase') -> None:
         """从绘图区域和内部数据结构中删除指定ROI对象"""
         self.plot.removeItem(roi)  # 从绘图区域移除
+        self.texture_pool.cancel(roi.unique_id)
+        self.history.remove(roi.unique_id)
+        self._record("remove", id=roi.unique_id)
+        self.spatial.remove(roi.unique_id)
+        if self.active_roi is roi:
+            self.active_roi = None
         if roi.unique_id in self.rois:
             del self.rois[roi.unique_id]  # 从字典中删除
             self._remove_from_tree_model(roi.unique_id) # 从QTreeView模型中删除
@@ -130,69 +418,216 @@ class ROIManager(QtCore.QObject):
 
     def _remove_from_tree_model(self, roi_id: int) -> None:
         """从QTreeView模型中移除指定ROI的QStandardItem"""
-        # 遍历所有顶级项 (组)
-        for group_row in range(self.tree_model.rowCount()):
-            group_item = self.tree_model.item(group_row, 0)
-            if group_item:
-                # 遍历组下的所有子项 (ROI)
-                for roi_row in range(group_item.rowCount()):
-                    roi_name_item = group_item.child(roi_row, 0)
-                    if roi_name_item and roi_name_item.data(CustomRoles.RoiIdRole) == roi_id:
-                        group_item.removeRow(roi_row)
-                        return # 找到并删除后即可返回
+        index = self._roi_index.pop(roi_id, None)
+        group_key = self._roi_group.pop(roi_id, None)
+        if group_key is not None and group_key in self._group_rois:
+            self._group_rois[group_key].discard(roi_id)
+        if index is not None and index.isValid():
+            self.tree_model.removeRow(index.row(), index.parent())
 
     def clear_all_items(self) -> None:
         """清除所有组和ROI"""
+        self._record("clear")
         for roi in list(self.rois.values()):
             self.plot.removeItem(roi)  # 逐个移除绘图区域的ROI
         self.rois.clear()  # 清空ROI字典
+        self.history.clear()  # 已写盘的记录不受影响
+        self._roi_index.clear()
+        self._roi_group.clear()
+        self._group_rois.clear()
+        self.spatial.clear()
         self.tree_model.clear()  # 清空QTreeView模型
         self.tree_model.setHorizontalHeaderLabels(["名称", "ID"]) # 重新设置表头
         self.active_group_item = None
         self.active_roi = None
 
-    def _on_roi_changed(self, roi: 'RectROI') -> None:
+    def _on_roi_changed(self, roi: 'RoiBase') -> None:
         """处理ROI区域变化事件"""
+        self._record("geometry", id=roi.unique_id, state=roi.saveState())
+        if roi.unique_id in self.spatial:
+            self.spatial.insert(roi.unique_id, roi.bounds())
         if self.current_image is not None:
-            roi.update_image_stats(self.current_image)  # 更新ROI内的图像统计信息
+            # GUI线程只算灰度统计，纹理特征提交到后台
+            region = roi.update_image_stats(self.current_image, self.stats_engine)
+            if region is not None:
+                self.texture_pool.submit({roi.unique_id: region})
         
         # 如果当前活动的ROI就是这个ROI，则更新属性表
         if self.active_roi == roi:
             self.roi_selected.emit(roi) 
+
+    def _on_texture_ready(self, roi_id: int, features: Dict[str, float]) -> None:
+        """后台纹理特征计算完成，合并到ROI统计信息中"""
+        roi = self.rois.get(roi_id)
+        if roi is None:
+            return  # 结果返回前ROI已被删除
+        roi.image_stats.update(features)
+        if self.active_roi is roi:
+            self.roi_selected.emit(roi)
         
-    def _on_roi_clicked(self, roi: 'RectROI') -> None:
+    def _on_plot_clicked(self, ev) -> None:
+        """
+        图像区域的左键单击：用 rois_at 找出点击处的ROI并选中。
+        先选中最上层 (ID最大) 的ROI；点击处已有选中的ROI时，依次切换到其下重叠的ROI。
+        """
+        if ev.button() != QtCore.Qt.MouseButton.LeftButton or ev.double():
+            return
+        view_box = self.plot.getPlotItem().getViewBox()
+        if not view_box.sceneBoundingRect().contains(ev.scenePos()):
+            return
+        point = view_box.mapSceneToView(ev.scenePos())
+        hits = self.rois_at(point.x(), point.y())
+        if not hits:
+            return
+        index = hits.index(self.active_roi) - 1 if self.active_roi in hits else -1
+        self._on_roi_clicked(hits[index])
+
+    def _on_roi_clicked(self, roi: 'RoiBase') -> None:
         """处理ROI在PlotWidget中被点击的事件"""
         self._update_selection(roi) # 更新选中状态
         self.roi_selected.emit(roi) # 重新发射信号以触发主窗口的UI更新
 
-    def _update_selection(self, selected_roi: 'RectROI') -> None:
+    def _update_selection(self, selected_roi: 'RoiBase') -> None:
         """更新ROI选中状态（边框颜色）"""
+        previous = self.active_roi
         self.active_roi = selected_roi  # 设置当前活动ROI
-        # 遍历所有ROI，设置边框颜色（选中为绿色，未选中为红色）
-        for roi in self.rois.values():
-            roi.setPen('g' if roi == selected_roi else 'r')
+        self._record("select", id=selected_roi.unique_id if selected_roi is not None else None)
+        # 只重设前后两个ROI的边框颜色（选中为绿色，未选中为红色），其余ROI保持红色
+        if previous is not None and previous is not selected_roi:
+            previous.setPen('r')
+        if selected_roi is not None and previous is not selected_roi:
+            selected_roi.setPen('g')
+
+    def rois_at(self, x: float, y: float) -> List['RoiBase']:
+        """图像坐标 (x, y) 处的ROI，旋转矩形、椭圆和多边形按实际形状判断"""
+        found = []
+        for roi_id in self.spatial.query_point(x, y):
+            roi = self.rois[roi_id]
+            if roi.integer_rect() is None and roi.shape_spec() is not None:
+                vertices = roi.image_vertices().astype(np.float32)
+                if cv2.pointPolygonTest(vertices, (float(x), float(y)), False) < 0:
+                    continue
+            found.append(roi)
+        return found
+
+    def overlapping_rois(self, roi: 'RoiBase') -> List['RoiBase']:
+        """外接矩形与该ROI相交的其他ROI，用于检查布局"""
+        return [self.rois[roi_id] for roi_id in self.spatial.overlapping(roi.unique_id)]
 
     def update_image_data(self, image: np.ndarray) -> None:
         """更新当前图像数据
-        image: 已经经过方向校正的NumPy数组
+        image: 与image_item的axisOrder一致的NumPy数组 (row-major时即相机/OpenCV原始缓冲区)
         """
-        self.current_image = image
-        # 更新所有ROI的图像统计信息
-        for roi in self.rois.values():
-            roi.update_image_stats(image)
+        # 整帧只做一次灰度转换和量化，整数对齐的矩形ROI一次批量算完；
+        # 没有ROI时也要缓存，之后新建并拖动的ROI直接复用积分图
+        profiler = self.profiler
+        if image is not self.current_image:
+            self.frame_diff.reset()  # 新载入的图像不是上一帧的重复，所有ROI重新统计；同一图像再次统计时才沿用结果
+        engine = BatchRoiStats(axis_order=self.image_item.axisOrder)
+        with profiler.measure("stats.set_frame"):
+            engine.set_frame(image)
+        with profiler.measure("stats.change_detect"):
+            self.frame_diff.update(engine)
+            rects = self.roi_rects()
+            dirty = {roi_id: rect for roi_id, rect in rects.items() if not self._is_clean(self.rois[roi_id], rect)}
+        with profiler.measure("stats.compute"):
+            results = engine.compute(dirty)
+        with profiler.measure("stats.apply"):
+            self.apply_frame(engine, rects, results)
+
+    def record_history(self, timestamp: float) -> None:
+        """把所有ROI当前的统计量记入历史"""
+        self.history.append(timestamp, {roi_id: roi.image_stats for roi_id, roi in self.rois.items()})
 
-
-class RectROI(pg.RectROI):
-    """自定义矩形ROI, 支持图像统计功能"""
-    _counter = 0  # 类变量，用于生成唯一ID
-
-    def __init__(self, image_item: pg.ImageItem, unique_id: Optional[int] = None, name: Optional[str] = None, *args, **kwargs):
-        super().__init__(*args,**kwargs)
+    @property
+    def skip_rate(self) -> float:
+        """跳过统计的ROI占比"""
+        total = self.rois_skipped + self.rois_updated
+        return self.rois_skipped / total if total else 0.0
+
+    def reset_skip_counters(self) -> None:
+        """清零跳过率计数"""
+        self.rois_skipped = self.rois_updated = 0
+
+    def _is_clean(self, roi: 'RoiBase', rect: Optional[Tuple[int, int, int, int]]) -> bool:
+        """ROI几何未变且覆盖的块在本帧没有变化时，可以沿用缓存的统计结果"""
+        return rect is not None and rect == roi.stats_rect and \
+            self.frame_diff.engine is not None and \
+            self.frame_diff.engine.contains(rect) and not self.frame_diff.is_dirty(rect)
+
+    def roi_rects(self) -> Dict[int, Tuple[int, int, int, int]]:
+        """所有整数对齐ROI的几何快照 {roi_id: (x, y, w, h)}，可交给采集线程批量统计"""
+        rects = {}
+        for roi_id, roi in self.rois.items():
+            roi.sync_geometry()
+            rect = roi.integer_rect()
+            if rect is not None:
+                rects[roi_id] = rect
+        return rects
+
+    def apply_frame(self, engine: BatchRoiStats, rects: Dict[int, Tuple[int, int, int, int]],
+                    results: Dict[int, Dict[str, float]], tracked: bool = False) -> None:
+        """
+        应用一帧的批量统计结果 (可能在采集线程中算好)。
+        engine: 已set_frame的统计引擎，之后拖动ROI时复用它的积分图
+        rects: 计算results时使用的几何快照，ROI在此之后移动过则按当前几何重新计算
+        tracked: 采集线程已做过帧间变化检测，results 之外几何未变的ROI直接沿用上次结果
+        """
+        self.stats_engine = engine
+        self.current_image = engine.image
+        if tracked:
+            self.frame_diff.reset()  # 参考帧由采集线程维护，之后回到静态图像时全部重新统计
+        else:
+            self.frame_diff.update(engine)
+        regions = {}
+        masks: Dict[int, Optional[Mask]] = {}
+        for roi_id, roi in self.rois.items():
+            rect = roi.integer_rect()
+            if tracked:
+                clean = roi_id not in results and rect is not None and rect == roi.stats_rect == rects.get(roi_id)
+            else:
+                clean = self._is_clean(roi, rect)
+            if clean:
+                self.rois_skipped += 1
+                continue
+            self.rois_updated += 1
+            if roi_id in results and rect == rects.get(roi_id):
+                roi.image_stats.update(results[roi_id])
+                roi.stats_rect = rect
+                regions[roi_id] = engine.crop(rect)
+            elif rect is None and roi.shape_spec() is not None:
+                # 形状ROI收集缓存的掩码，循环结束后一次归约
+                roi.sync_geometry()
+                roi.stats_rect = None
+                masks[roi_id] = roi.cached_mask(engine)
+            else:
+                # 快照之后移动过的ROI走快速路径；非整数对齐或越界的ROI仍走getArrayRegion
+                region = roi.update_image_stats(engine.image, engine)
+                if region is not None:
+                    regions[roi_id] = region
+        inside = {roi_id: mask for roi_id, mask in masks.items() if mask is not None}
+        for roi_id, stats in engine.compute_masked(inside).items():
+            self.rois[roi_id].image_stats.update(stats)
+            regions[roi_id] = engine.masked_crop(inside[roi_id])
+        for roi_id in masks.keys() - inside.keys():
+            self.rois[roi_id].image_stats.update({k: 0 for k in GRAY_KEYS})  # 完全在图像外
+        self.texture_pool.submit(regions)  # 纹理特征在后台计算，结果经texture_ready返回
+
+
+class RoiBase:
+    """
+    各形状ROI共用的ID、名称、统计信息和掩码缓存。
+    与 pg.ROI 的子类一起继承：RectROI / EllipseROI / PolygonROI。
+    """
+    _counter = 0  # 类变量，用于生成唯一ID（所有形状共用）
+    shape_name = 'rect'  # 形状名，与TOML中的 shape 一致；不能叫shape，会覆盖QGraphicsItem.shape()
+
+    def _init_roi(self, image_item: pg.ImageItem, unique_id: Optional[int], name: Optional[str]) -> None:
         self.image_item = image_item  # 关联的图像项
 
         if unique_id is not None:
             self.unique_id = unique_id
-            RectROI._counter = max(RectROI._counter, unique_id) 
+            RoiBase._counter = max(RoiBase._counter, unique_id) 
         else:
             self.unique_id = self._generate_id()  
         if name is not None: 
@@ -206,41 +641,112 @@ class RectROI(pg.RectROI):
             'GrayMean': 0,  
             'GrayRange': 0  
         }
+        self.stats_rect: Optional[Tuple[int, int, int, int]] = None  # 当前统计结果对应的整数几何，None表示需重新统计
         self._position = (0.0, 0.0)  # ROI位置 (这里我们希望存储左上角为原点的坐标)
         self._dimensions = (0.0, 0.0)  # ROI尺寸
+        self._mask_key: Optional[Tuple[bytes, Tuple[int, int]]] = None  # 缓存掩码对应的 (顶点, 帧尺寸)
+        self._mask = None  # 缓存的 (x0, y0, mask)，几何或帧尺寸变化时才重新栅格化
 
     @classmethod
     def _generate_id(cls) -> int:
         """生成唯一ID"""
-        cls._counter += 1
-        return cls._counter
+        RoiBase._counter += 1
+        return RoiBase._counter
 
     @classmethod
     def reset_counter(cls, start_value: int = 0) -> None:
         """重置计数器，用于加载数据时避免ID冲突"""
-        cls._counter = start_value
+        RoiBase._counter = start_value
+
+    def shape_spec(self) -> Optional[Dict[str, Any]]:
+        """形状参数 (见 roi_config.parse_roi)；轴对齐矩形返回None"""
+        return {'shape': self.shape_name, 'angle': round(self.angle(), 2)}
+
+    def image_vertices(self) -> np.ndarray:
+        """图像坐标下的多边形顶点，ImageItem位于原点且未缩放，ROI的父坐标即图像坐标"""
+        pos, size = self.pos(), self.size()
+        return shape_vertices(pos.x(), pos.y(), size.x(), size.y(), self.shape_spec())
+
+    def cached_mask(self, engine: BatchRoiStats) -> Optional[Mask]:
+        """当前几何在该帧尺寸下的掩码，只在几何或帧尺寸变化时重新计算"""
+        vertices = self.image_vertices()
+        key = (vertices.tobytes(), engine.size())
+        if key != self._mask_key:
+            self._mask = polygon_mask(vertices, *engine.size())
+            self._mask_key = key
+        return self._mask
+
+    def sync_geometry(self) -> None:
+        """同步位置和尺寸信息，PlotWidget的Y轴已颠倒 (Y向下)"""
+        # self.pos() 返回 ROI 的左下角在 PlotWidget 坐标系中的位置 (Y向下, 0,0在左上角)
+        current_pos_pg = self.pos() 
+        current_size_pg = self.size() 
+        
+        # 在 Y 轴向下、0,0在左上角的坐标系中：
+        x_display_top_left_origin = current_pos_pg.x()
+        y_display_top_left_origin = current_pos_pg.y()
+        
+        self._position = (round(x_display_top_left_origin, 2), round(y_display_top_left_origin, 2))
+        self._dimensions = (round(current_size_pg.x(), 2), round(current_size_pg.y(), 2))
+
+    def bounds(self) -> Tuple[float, float, float, float]:
+        """图像坐标下的外接矩形 (x0, y0, x1, y1)，供ROIManager的空间索引使用"""
+        if self.shape_name == 'rect' and self.angle() == 0:
+            pos, size = self.pos(), self.size()
+            return normalize(pos.x(), pos.y(), size.x(), size.y())
+        vertices = self.image_vertices()
+        x0, y0 = vertices.min(axis=0)
+        x1, y1 = vertices.max(axis=0)
+        return float(x0), float(y0), float(x1), float(y1)
+
+    def integer_rect(self) -> Optional[Tuple[int, int, int, int]]:
+        """
+        未旋转且位置、尺寸都落在整数像素上时返回 (x, y, w, h)，
+        此时getArrayRegion的结果就是图像切片，可以走批量统计；否则返回None。
+        """
+        if self.shape_name != 'rect' or self.angle() != 0:
+            return None
+        pos, size = self.pos(), self.size()
+        values = (pos.x(), pos.y(), size.x(), size.y())
+        rounded = tuple(int(round(v)) for v in values)
+        if any(abs(v - r) > 1e-6 for v, r in zip(values, rounded)):
+            return None
+        return rounded
 
-    def update_image_stats(self, image: np.ndarray) -> None:
-        """更新图像统计信息"""
+    def update_image_stats(self, image: np.ndarray, engine: Optional[BatchRoiStats] = None) -> Optional[np.ndarray]:
+        """
+        更新灰度统计信息，返回用于计算纹理特征的uint8灰度区域（区域无效时返回None）。
+        纹理特征 (Energy/Correlation/Homogeneity/Contrast) 由ROIManager交给TexturePool在后台计算。
+        engine 已缓存同一帧且ROI未旋转、整数对齐时走快速路径：
+        均值查积分图，最大/最小值查块稀疏表，不再经过getArrayRegion的仿射拷贝。
+        旋转矩形、椭圆和多边形用缓存的掩码直接在整帧灰度图上归约，返回带掩码的区域。
+        """
+        if engine is not None and engine.image is image:
+            rect = self.integer_rect()
+            if rect is not None and engine.contains(rect):
+                self.sync_geometry()
+                self.image_stats.update(engine.compute({self.unique_id: rect})[self.unique_id])
+                self.stats_rect = rect
+                return engine.crop(rect)
+            if rect is None and self.shape_spec() is not None:
+                self.sync_geometry()
+                self.stats_rect = None
+                mask = self.cached_mask(engine)
+                if mask is None:
+                    self.image_stats.update({k: 0 for k in GRAY_KEYS})  # 完全在图像外
+                    return None
+                self.image_stats.update(engine.compute_masked({self.unique_id: mask})[self.unique_id])
+                return engine.masked_crop(mask)
+
+        self.stats_rect = None  # getArrayRegion路径不参与帧间跳过
         try:
-            # --- 核心修正：更新位置和尺寸信息，PlotWidget的Y轴已颠倒 (Y向下) ---
-            # self.pos() 返回 ROI 的左下角在 PlotWidget 坐标系中的位置 (Y向下, 0,0在左上角)
-            current_pos_pg = self.pos() 
-            current_size_pg = super().size() 
-            
-            # 在 Y 轴向下、0,0在左上角的坐标系中：
-            x_display_top_left_origin = current_pos_pg.x()
-            y_display_top_left_origin = current_pos_pg.y()
-            
-            self._position = (round(x_display_top_left_origin, 2), round(y_display_top_left_origin, 2))
-            self._dimensions = (round(current_size_pg.x(), 2), round(current_size_pg.y(), 2))
-            # ----------------------------------------------------------------------
+            self.sync_geometry()
             
             region = self.getArrayRegion(image, self.image_item)
             
             if region is None or region.size == 0 or region.shape[0] == 0 or region.shape[1] == 0:
                 self.image_stats = {k: 0 for k in self.image_stats}
-                return 
+                return None
             
             if region.dtype != np.uint8:
                 region = region.astype(np.uint8)
@@ -248,44 +754,35 @@ class RectROI(pg.RectROI):
             if len(region.shape) == 3:
                 region = cv2.cvtColor(region, cv2.COLOR_RGB2GRAY)
 
-            if region.shape[0] >= 2 and region.shape[1] >= 2 and np.std(region) > 0:
-                levels = 32  
-                quantized_region = (region // (256 // levels)).astype(np.uint8)
-                
-                if len(np.unique(quantized_region)) > 1:
-                    glcm = graycomatrix(quantized_region, distances=[1], angles=[0], levels=levels, symmetric=True, normed=True)
-                    energy = graycoprops(glcm, 'energy')[0, 0]
-                    correlation = graycoprops(glcm, 'correlation')[0, 0]
-                    homogeneity = graycoprops(glcm, 'homogeneity')[0, 0]
-                    contrast = graycoprops(glcm, 'contrast')[0, 0]
-                else: 
-                    energy, correlation, homogeneity, contrast = 0.0, 0.0, 0.0, 0.0
-            else: 
-                energy, correlation, homogeneity, contrast = 0.0, 0.0, 0.0, 0.0
-                
+            if self.image_item.axisOrder == 'row-major':
+                # row-major时getArrayRegion返回(y, x)，转回(x, y)视图，保持GLCM的配对方向不变
+                region = region.T
 
-            self.image_stats = {
+            self.image_stats.update({
                 'GrayMax': np.max(region),
                 'GrayMin': np.min(region),
                 'GrayMean': np.mean(region),
-                'GrayRange': np.max(region)-np.min(region),
-                'Energy': energy,
-                'Correlation': correlation,
-                'Homogeneity': homogeneity,
-                'Contrast': contrast
-                }
+                'GrayRange': np.max(region)-np.min(region)
+                })
+            return region
             
         except Exception as e:
             self.image_stats = {k: 0 for k in self.image_stats} 
+            return None
 
-    def get_toml_format_coords(self) -> List[int]:
+    def get_toml_format_coords(self) -> Any:
         """
-        返回 ROI 坐标的列表表示 [x, y, w, h]，符合 TOML 模板。
+        返回 ROI 在TOML中的值：轴对齐矩形为 [x, y, w, h]，符合 TOML 模板；
+        形状ROI为 {shape, pos, size, angle} 或 {shape, points} 内联表 (见 roi_config.format_roi)。
         这里使用 self.position 和 self.dimensions，它们已经是左上角为原点、Y轴向下的坐标。
         """
+        self.sync_geometry()  # 未加载图像时几何信息不会随统计更新，保存前先同步
         x, y = self.position
         w, h = self.dimensions
-        return [int(x), int(y), int(w), int(h)]
+        spec = self.shape_spec()
+        if spec is None:
+            return [int(x), int(y), int(w), int(h)]
+        return roi_config.format_roi(x, y, w, h, spec)
 
 
     @property
@@ -304,13 +801,164 @@ class RectROI(pg.RectROI):
         return self._dimensions
 
 
+class RectROI(RoiBase, pg.RectROI):
+    """自定义矩形ROI, 支持图像统计功能；rotatable=True 时为旋转矩形"""
+
+    def __init__(self, image_item: pg.ImageItem, unique_id: Optional[int] = None, name: Optional[str] = None, *args, **kwargs):
+        super().__init__(*args,**kwargs)
+        self._init_roi(image_item, unique_id, name)
+
+    def shape_spec(self) -> Optional[Dict[str, Any]]:
+        if not self.rotatable:
+            return None  # 轴对齐矩形，按 [x, y, w, h] 保存
+        return super().shape_spec()
+
+
+class EllipseROI(RoiBase, pg.EllipseROI):
+    """椭圆ROI（内切于 pos/size 矩形，可旋转），按掩码统计"""
+    shape_name = 'ellipse'
+
+    def __init__(self, image_item: pg.ImageItem, pos, size, unique_id: Optional[int] = None, name: Optional[str] = None, **kwargs):
+        super().__init__(pos, size, **kwargs)
+        self._init_roi(image_item, unique_id, name)
+
+
+class PolygonROI(RoiBase, pg.PolyLineROI):
+    """闭合多边形ROI，按掩码统计；顶点以图像坐标保存"""
+    shape_name = 'polygon'
+
+    def __init__(self, image_item: pg.ImageItem, points, unique_id: Optional[int] = None, name: Optional[str] = None, **kwargs):
+        super().__init__(points, closed=True, **kwargs)
+        self._init_roi(image_item, unique_id, name)
+
+    def shape_spec(self) -> Optional[Dict[str, Any]]:
+        pos = self.pos()
+        points = [[round(pos.x() + p.x(), 2), round(pos.y() + p.y(), 2)] for p in self.getState()['points']]
+        return {'shape': 'polygon', 'points': points}
+
+    def setPoints(self, points, closed=None) -> None:
+        """重建顶点期间不发出区域变化信号（中途没有顶点），完成后只发一次"""
+        blocked = self.blockSignals(True)
+        try:
+            super().setPoints(points, closed)
+        finally:
+            self.blockSignals(blocked)
+        if not blocked:
+            self.sigRegionChanged.emit(self)
+
+    def sync_geometry(self) -> None:
+        """多边形的位置和尺寸取顶点的外接框"""
+        vertices = self.image_vertices()
+        x0, y0 = vertices.min(axis=0)
+        x1, y1 = vertices.max(axis=0)
+        self._position = (round(float(x0), 2), round(float(y0), 2))
+        self._dimensions = (round(float(x1 - x0), 2), round(float(y1 - y0), 2))
+
+
+class CaptureThread(QtCore.QThread):
+    """
+    摄像头采集线程：读帧、BGR转RGB、帧间变化检测和ROI灰度统计都在此线程完成。
+    只有几何变化或覆盖了变化块的ROI才重新统计，results 只含这些ROI，其余ROI由GUI沿用上次结果。
+    结果放入长度为1的有界队列，GUI来不及取时新帧直接覆盖旧帧 (latest-frame-wins)，
+    被覆盖帧中新算的结果并入新帧，不会因丢帧而漏掉更新；
+    GUI按屏幕刷新率用 take_latest() 取最新一帧显示，与采集帧率无关。
+    """
+    open_failed = pyqtSignal(str)  # 摄像头打开失败
+
+    def __init__(self, source=0, axis_order: str = 'row-major', parent: Optional[QtCore.QObject] = None,
+                 profiler: Optional[StageProfiler] = None, change_threshold: float = CHANGE_THRESHOLD):
+        super().__init__(parent)
+        self.source = source  # 摄像头编号或视频地址
+        self.axis_order = axis_order  # 与ImageViewer一致
+        self.rects: Dict[int, Tuple[int, int, int, int]] = {}  # GUI线程写入的ROI几何快照
+        self.running = False
+        self.frames_captured = 0  # 已采集帧数
+        self.frames_dropped = 0  # 未被显示就被覆盖的帧数
+        self._queue = deque(maxlen=1)  # (engine, rects, results, 读帧完成时间)，append/popleft线程安全
+        self.profiler = profiler if profiler is not None else StageProfiler()
+        # 帧间变化检测，只在本线程使用；change_threshold 大于0时容忍噪声但会漏掉小变化，需显式指定
+        self.frame_diff = TileChangeTracker(threshold=change_threshold)
+        self._computed: Dict[int, Tuple[int, int, int, int]] = {}  # roi_id -> 最近一次统计时的几何
+
+    def run(self) -> None:
+        cap = cv2.VideoCapture(self.source)
+        if not cap.isOpened():
+            self.open_failed.emit("无法打开摄像头")
+            return
+        self.running = True
+        profiler = self.profiler
+        while self.running:
+            with profiler.measure("capture.read"):
+                ret, frame = cap.read()
+            if not ret:
+                self.msleep(5)
+                continue
+            captured_at = time.perf_counter()
+            with profiler.measure("capture.cvtColor"):
+                image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            if self.axis_order == 'col-major':
+                with profiler.measure("capture.orient"):
+                    image = np.flip(np.rot90(image, k=-1), axis=1)
+            rects = self.rects  # 取引用即可，GUI线程每次整体替换字典
+            with profiler.measure("capture.stats"):
+                engine = BatchRoiStats(axis_order=self.axis_order)
+                engine.set_frame(image)
+            with profiler.measure("capture.change_detect"):
+                self.frame_diff.update(engine)
+                dirty = {roi_id: rect for roi_id, rect in rects.items()
+                         if rect != self._computed.get(roi_id) or not engine.contains(rect)
+                         or self.frame_diff.is_dirty(rect)}
+            with profiler.measure("capture.compute"):
+                results = engine.compute(dirty)
+            self._computed = {roi_id: rect for roi_id, rect in self._computed.items() if roi_id in rects}
+            self._computed.update((roi_id, rects[roi_id]) for roi_id in results)
+            try:
+                _, old_rects, old_results, _ = self._queue.popleft()
+            except IndexError:
+                pass  # GUI已取走上一帧
+            else:
+                self.frames_dropped += 1
+                for roi_id, stats in old_results.items():
+                    if roi_id not in results and old_rects.get(roi_id) == rects.get(roi_id):
+                        results[roi_id] = stats
+            self._queue.append((engine, rects, results, captured_at))
+            self.frames_captured += 1
+        cap.release()
+
+    def take_latest(self) -> Optional[Tuple[BatchRoiStats, Dict[int, Tuple[int, int, int, int]], Dict[int, Dict[str, float]], float]]:
+        """取出最新一帧的处理结果 (engine, rects, results, 读帧完成时间)，没有新帧时返回None"""
+        try:
+            return self._queue.popleft()
+        except IndexError:
+            return None
+
+    def stop(self) -> None:
+        """停止采集并等待线程退出"""
+        self.running = False
+        self.wait()
+
+
 class ImageViewer(pg.PlotWidget):
-    """图像显示组件"""
-    def __init__(self):
+    """
+    图像显示组件
+    axis_order='row-major' 时 ImageItem 直接按 image[y, x] 解释相机/OpenCV原始缓冲区，
+    无需逐帧 rot90/flip；'col-major' 为pyqtgraph默认方式，需要先把图像转置成 image[x, y]。
+    超过 TILED_PIXELS 的大图改用 show_tiled()：按视图缩放只显示可见的金字塔块。
+    """
+    def __init__(self, axis_order: str = 'row-major'):
         super().__init__()
+        self.axis_order = axis_order
         self._setup_view()  # 初始化视图设置
-        self.image_item = pg.ImageItem()  # 创建图像项
+        self.image_item = pg.ImageItem(axisOrder=axis_order)  # 创建图像项
         self.addItem(self.image_item)  # 添加到绘图区域
+        self.tiles: Optional[TiledImageLayer] = None  # 大图的分块显示层
+        # 帧率/耗时叠加层：固定在视图左上角，不随图像缩放平移
+        self.overlay = QtWidgets.QLabel(self)
+        self.overlay.setStyleSheet(
+            "background-color: rgba(0, 0, 0, 160); color: white; font-family: monospace; padding: 4px;")
+        self.overlay.setAttribute(QtCore.Qt.WA_TransparentForMouseEvents)
+        self.overlay.move(8, 8)
+        self.overlay.hide()
 
     def _setup_view(self) -> None:
         """初始化视图设置"""
@@ -326,18 +974,184 @@ class ImageViewer(pg.PlotWidget):
 
     def update_image(self, image: np.ndarray) -> None:
         """更新显示图像。
-        这里的'image'已经是经过方向校正的NumPy数组。
+        这里的'image'已经与axis_order一致，不再做方向变换。
         """
+        self.close_tiles()
         self.image_item.setImage(image)  # 设置图像数据
         # 设置显示范围匹配图像尺寸
         # 现在PlotWidget的(0,0)是左上角，Y向下增加。
-        # 所以setRange的y范围应该是(0, image.shape[0])
-        self.setRange(xRange=[0, image.shape[1]], yRange=[0, image.shape[0]])
+        width, height = self.image_size(image)
+        self.setRange(xRange=[0, width], yRange=[0, height])
+
+    @staticmethod
+    def use_tiles(image: np.ndarray) -> bool:
+        """image[y, x] 原始缓冲区是否大到需要分块显示"""
+        return image.shape[0] * image.shape[1] >= TILED_PIXELS
+
+    def show_tiled(self, source: np.ndarray, convert: Convert = to_display) -> None:
+        """
+        分块显示大图。source 为 image[y, x] 原始缓冲区（可以是内存映射），
+        与 axis_order 无关；convert 只作用于实际读取的块。
+        金字塔只构建一次，之后平移缩放只读取可见的块。
+        """
+        self.close_tiles()
+        self.image_item.clear()
+        self.tiles = TiledImageLayer(self.getPlotItem().getViewBox(), ImagePyramid(source, convert))
+        height, width = source.shape[:2]
+        self.setRange(xRange=[0, width], yRange=[0, height])
+        self.tiles.refresh()
+
+    def close_tiles(self) -> None:
+        """移除分块显示层并删除金字塔的临时文件"""
+        if self.tiles is not None:
+            self.tiles.close()
+            self.tiles = None
+
+    def set_overlay_text(self, text: Optional[str]) -> None:
+        """显示叠加层文字，None时隐藏"""
+        if text is None:
+            self.overlay.hide()
+            return
+        self.overlay.setText(text)
+        self.overlay.adjustSize()
+        self.overlay.show()
+        self.overlay.raise_()
+
+    def image_size(self, image: np.ndarray) -> Tuple[int, int]:
+        """按axis_order返回图像的 (宽, 高)"""
+        if self.axis_order == 'row-major':
+            return image.shape[1], image.shape[0]
+        return image.shape[0], image.shape[1]
  
 
 
+class TrendView(QtWidgets.QDockWidget):
+    """
+    ROI统计量趋势图（可停靠窗口）。
+    显示选中ROI（或选中组内所有ROI）的某个统计量随时间的变化；
+    曲线开启clipToView和自动降采样，只有记录数变化的曲线才重新setData。
+    """
+    def __init__(self, parent: Optional[QtWidgets.QWidget] = None):
+        super().__init__("趋势", parent)
+        self.setObjectName("trendDock")
+        widget = QtWidgets.QWidget()
+        layout = QtWidgets.QVBoxLayout(widget)
+        layout.setContentsMargins(2, 2, 2, 2)
+        self.key_box = QtWidgets.QComboBox()
+        self.key_box.addItems(STAT_KEYS)
+        self.key_box.setCurrentText('GrayMean')
+        self.key_box.currentTextChanged.connect(self._on_key_changed)
+        layout.addWidget(self.key_box)
+        self.plot = pg.PlotWidget()
+        self.plot.setBackground('w')
+        self.plot.setLabel('bottom', '时间', units='s')
+        self.plot.addLegend()
+        layout.addWidget(self.plot)
+        self.setWidget(widget)
+        self.history: Optional[RoiHistory] = None
+        self._curves: Dict[int, Tuple[pg.PlotDataItem, int]] = {}  # roi_id -> (曲线, 上次绘制时的记录数)
+
+    def set_rois(self, history: RoiHistory, rois: List[Tuple[int, str]]) -> None:
+        """设置要显示的ROI [(roi_id, 名称)]，已有的曲线保留"""
+        if history is not self.history:
+            self._remove_curves(list(self._curves))
+            self.history = history
+        wanted = dict(rois)
+        self._remove_curves([roi_id for roi_id in self._curves if roi_id not in wanted])
+        for k, (roi_id, name) in enumerate(rois):
+            if roi_id not in self._curves:
+                curve = self.plot.plot(pen=pg.intColor(roi_id, hues=9), name=name)
+                curve.setClipToView(True)
+                curve.setDownsampling(auto=True, method='peak')
+                self._curves[roi_id] = (curve, -1)
+        self.refresh()
+
+    def _remove_curves(self, roi_ids: List[int]) -> None:
+        for roi_id in roi_ids:
+            curve, _ = self._curves.pop(roi_id)
+            self.plot.removeItem(curve)
+
+    def _on_key_changed(self, key: str) -> None:
+        self._curves = {roi_id: (curve, -1) for roi_id, (curve, _) in self._curves.items()}  # 全部重画
+        self.refresh()
+
+    def refresh(self) -> None:
+        """只更新有新记录的曲线"""
+        if self.history is None or not self.isVisible():
+            return
+        key = self.key_box.currentText()
+        for roi_id, (curve, drawn) in self._curves.items():
+            count = self.history.count(roi_id)
+            if count == drawn:
+                continue
+            curve.setData(*self.history.series(roi_id, key))
+            self._curves[roi_id] = (curve, count)
+
+
+class CameraView:
+    """
+    单个摄像头的显示与ROI管理：一个ImageViewer、一棵ROI树和一个ROIManager，
+    对应配置文件中的一个 [cameraN] 段，打开摄像头时各自拥有独立的采集线程。
+    """
+    PLACEHOLDER_ADDRESS = "DEFAULT_CAMERA_ADDRESS_PLACEHOLDER"  # 未配置地址时的占位符
+
+    def __init__(self, name: str, address: str = PLACEHOLDER_ADDRESS):
+        self.name = name  # 配置中的段名，如 camera1
+        self.address = address  # 摄像头地址
+        self.image_viewer = ImageViewer()
+        self.tree_model = QStandardItemModel()
+        self.tree_model.setHorizontalHeaderLabels(["名称", "ID"])
+        self.profiler = StageProfiler()  # 该摄像头采集、显示和统计各阶段的耗时
+        self.roi_manager = ROIManager(self.image_viewer, self.tree_model, self.image_viewer.image_item, self.profiler)
+        self.capture_thread: Optional[CaptureThread] = None
+        self._last_count = 0  # 上次统计吞吐量时的已采集帧数
+        self.fps = 0.0  # 最近一个统计周期的采集帧率
+
+    @property
+    def source(self):
+        """
+        传给 cv2.VideoCapture 的源：纯数字地址按设备编号处理，
+        空地址或占位符按段名编号 (camera1 -> 0)，其余按视频流地址处理。
+        """
+        address = self.address.strip()
+        if address.isdigit():
+            return int(address)
+        if not address or address == self.PLACEHOLDER_ADDRESS:
+            suffix = self.name[len("camera"):]
+            return int(suffix) - 1 if suffix.isdigit() and int(suffix) > 0 else 0
+        return address
+
+    def update_fps(self, elapsed: float) -> float:
+        """根据已采集帧数的增量更新帧率"""
+        count = self.capture_thread.frames_captured if self.capture_thread else self._last_count
+        self.fps = (count - self._last_count) / elapsed if elapsed > 0 else 0.0
+        self._last_count = count
+        return self.fps
+
+    def overlay_text(self) -> str:
+        """叠加层内容：显示帧率、端到端延迟和各阶段耗时分位数"""
+        profiler = self.profiler
+        lines = [f"显示 {profiler.rate('display.frame'):.1f} fps"]
+        for stage in profiler.stages():
+            if stage == "display.frame":
+                continue
+            p50, p90, p99 = profiler.percentiles(stage)
+            lines.append(f"{stage:<20} p50 {p50:7.2f}  p90 {p90:7.2f}  p99 {p99:7.2f} ms")
+        return "\n".join(lines)
+
+    def stop_capture(self) -> None:
+        """停止该摄像头的采集线程"""
+        if self.capture_thread is not None:
+            self.capture_thread.stop()  # 线程退出前会释放摄像头资源
+            self.capture_thread = None
+        self._last_count = 0
+        self.fps = 0.0
+
+
 class MainWindow(QtWidgets.QMainWindow):
     """主窗口"""
+    # 工具栏形状选择框的选项 -> roi_config 中的形状名 (None 为轴对齐矩形)
+    NEW_ROI_SHAPES = {"矩形": None, "旋转矩形": 'rect', "椭圆": 'ellipse', "多边形": 'polygon'}
     # 定义一个字典来存储属性名和它们的提示文本
     PROPERTY_TOOLTIPS = {
         "ID": "ROI的唯一标识符，系统自动生成。",
@@ -351,9 +1165,12 @@ class MainWindow(QtWidgets.QMainWindow):
         "能量": "衡量图像纹理的均匀性和局部秩序。能量值越大，表示纹理越均匀、越细致，变化越小。",
         "相关性": "衡量像素灰度级之间空间依赖关系的线性度。值越大，表示灰度级之间相关性越强，纹理越粗糙、规律性越强。",
         "均匀性": "衡量图像纹理的局部均匀性。值越大，表示灰度级差异越小，纹理越均匀、越平坦。",
-        "对比度": "反映图像纹理的对比度或局部灰度级差异的大小。值越大，表示纹理越深、越粗糙，灰度变化越剧烈。"
+        "对比度": "反映图像纹理的对比度或局部灰度级差异的大小。值越大，表示纹理越深、越粗糙，灰度变化越剧烈。",
+        "重叠ROI": "外接矩形与该ROI相交的其他ROI的ID，用于检查ROI布局是否重叠。"
     }
 
+    PROPERTY_REFRESH_MS = 50  # 属性表格最短刷新间隔（毫秒），即最高20Hz
+
     def __init__(self):
         super().__init__()
         loadUi('form.ui', self)  # 加载UI文件
@@ -364,42 +1181,150 @@ class MainWindow(QtWidgets.QMainWindow):
 
     def _setup_ui(self) -> None:
         """初始化界面组件"""
-        self.image_viewer = ImageViewer()  # 创建图像显示组件
-        self.horizontalLayout.addWidget(self.image_viewer)  # 添加到布局
+        # 性能分析：开启后记录各阶段耗时，并在图像上叠加帧率/延迟
+        self.actionProfiler = QtWidgets.QAction("Profiler", self)
+        self.actionProfiler.setToolTip("显示帧率和各阶段耗时")
+        self.actionProfiler.setCheckable(True)
+        self.actionDumpProfile = QtWidgets.QAction("DumpProfile", self)
+        self.actionDumpProfile.setToolTip("导出各阶段耗时CSV")
+        self.toolBar.addAction(self.actionProfiler)
+        self.toolBar.addAction(self.actionDumpProfile)
+        self.overlay_timer = QTimer()  # 叠加层刷新定时器，与帧率无关
+        self.overlay_timer.timeout.connect(self._update_overlay)
+
+        # 统计量趋势图（默认隐藏），以及把历史写盘的开关
+        self.trend_view = TrendView(self)
+        self.addDockWidget(QtCore.Qt.BottomDockWidgetArea, self.trend_view)
+        self.trend_view.hide()
+        trend_action = self.trend_view.toggleViewAction()
+        trend_action.setText("Trend")
+        self.toolBar.addAction(trend_action)
+        self.actionRecordStats = QtWidgets.QAction("RecordStats", self)
+        self.actionRecordStats.setToolTip("把摄像头模式下的ROI统计量历史追加写入文件")
+        self.actionRecordStats.setCheckable(True)
+        self.toolBar.addAction(self.actionRecordStats)
+        self.actionRecordSession = QtWidgets.QAction("RecordSession", self)
+        self.actionRecordSession.setToolTip("录制显示的帧和ROI操作，可用 session_replay.py 无界面回放")
+        self.actionRecordSession.setCheckable(True)
+        self.toolBar.addAction(self.actionRecordSession)
+        self.trend_timer = QTimer()  # 趋势图刷新定时器
+        self.trend_timer.timeout.connect(self.trend_view.refresh)
+        self.trend_timer.start(100)
+
+        # 新建ROI的形状
+        self.shape_box = QtWidgets.QComboBox()
+        self.shape_box.addItems(self.NEW_ROI_SHAPES)
+        self.shape_box.setToolTip("添加ROI时使用的形状")
+        self.toolBar.addWidget(self.shape_box)
+        self.actionRoiGrid = QtWidgets.QAction("RoiGrid", self)
+        self.actionRoiGrid.setToolTip("以选中的ROI为模板，按行列和间距生成ROI阵列")
+        self.toolBar.addAction(self.actionRoiGrid)
+        self._raw_format_text = "4096x3000 mono8"  # 上次输入的RAW格式
+        self._grid_text = ""  # 上次输入的阵列参数，为空时按模板尺寸给出默认值
+
+        # 每个摄像头一个标签页，左侧树视图显示当前标签页摄像头的ROI
+        self.cameras: List[CameraView] = []
+        self._tree_selection: Optional[QtCore.QItemSelectionModel] = None  # 已连接选中信号的选择模型
+        self.camera_tabs = QtWidgets.QTabWidget()
+        self.horizontalLayout.addWidget(self.camera_tabs)  # 添加到布局
         self.horizontalLayout.setStretch(1, 4)  # 设置布局拉伸因子
+        self.camera_tabs.currentChanged.connect(self._on_camera_tab_changed)
 
-        # 初始化ROI列表模型 (现在是QTreeView)
-        self.tree_model = QStandardItemModel()
-        self.tree_model.setHorizontalHeaderLabels(["名称", "ID"]) 
-        self.treeView.setModel(self.tree_model)
-
-        # 初始化属性表格模型
+        # 初始化属性表格模型：行固定为 PROPERTY_TOOLTIPS 中的属性，之后只原地更新值
         self.property_model = QStandardItemModel()
         self.property_model.setHorizontalHeaderLabels(["属性", "值"])
+        for row, (key, tooltip_text) in enumerate(self.PROPERTY_TOOLTIPS.items()):
+            key_item = QStandardItem(key)
+            key_item.setToolTip(tooltip_text)
+            self.property_model.setItem(row, 0, key_item)
+            self.property_model.setItem(row, 1, QStandardItem(""))
         self.tableView.setModel(self.property_model)
+        self._property_values: List[str] = [""] * len(self.PROPERTY_TOOLTIPS)  # 当前显示的值，用于跳过未变化的单元格
+        self._property_roi: Optional[RoiBase] = None  # 下次刷新要显示的ROI
+        self._property_refreshed_at = 0.0  # 上次刷新时间
+        self._property_rows_hidden = False
+        self._property_timer = QTimer()  # 合并刷新请求，最高 1000 / PROPERTY_REFRESH_MS Hz
+        self._property_timer.setSingleShot(True)
+        self._property_timer.timeout.connect(self._refresh_property_table)
         # 调整表格列宽，使第一列拉伸以适应内容，第二列内容自适应
         self.tableView.horizontalHeader().setSectionResizeMode(0, QtWidgets.QHeaderView.Stretch)
         self.tableView.horizontalHeader().setSectionResizeMode(1, QtWidgets.QHeaderView.ResizeToContents)
 
 
-        # 初始化ROI管理器
-        self.roi_manager = ROIManager(
-            self.image_viewer,
-            self.tree_model,
-            self.image_viewer.image_item
-        )
-        self.roi_manager.roi_selected.connect(self._on_roi_selected_update_ui)
-        self.roi_manager.group_selected.connect(self._on_group_selected_update_ui)
+        self._add_camera_view("camera1")  # 默认一个摄像头，加载配置时按 [cameraN] 段重建
 
         # 设置“添加ROI”按钮初始状态 (未选中分组时禁用)
         self.pushButton_1.setEnabled(False) 
         self.delGroupButton.setEnabled(False) # 初始时，“删除组/ROI”按钮也禁用
 
+    @property
+    def current_camera(self) -> CameraView:
+        """当前标签页对应的摄像头"""
+        return self.cameras[max(0, self.camera_tabs.currentIndex())]
+
+    @property
+    def image_viewer(self) -> ImageViewer:
+        return self.current_camera.image_viewer
+
+    @property
+    def tree_model(self) -> QStandardItemModel:
+        return self.current_camera.tree_model
+
+    @property
+    def roi_manager(self) -> ROIManager:
+        return self.current_camera.roi_manager
+
+    def _add_camera_view(self, name: str, address: str = CameraView.PLACEHOLDER_ADDRESS) -> CameraView:
+        """新建一个摄像头标签页"""
+        view = CameraView(name, address)
+        view.profiler.enabled = self.actionProfiler.isChecked()
+        view.roi_manager.roi_selected.connect(self._on_roi_selected_update_ui)
+        view.roi_manager.group_selected.connect(self._on_group_selected_update_ui)
+        view.tree_model.itemChanged.connect(self._on_item_name_changed)  # 树视图项数据变化（用于修改名称）
+        self.cameras.append(view)
+        self.camera_tabs.addTab(view.image_viewer, name)
+        return view
+
+    def _clear_camera_views(self) -> None:
+        """停止采集并移除所有摄像头标签页"""
+        self._stop_camera()
+        self.camera_tabs.blockSignals(True)  # 移除过程中不触发标签页切换
+        self.camera_tabs.clear()
+        self.camera_tabs.blockSignals(False)
+        for view in self.cameras:
+            view.roi_manager.history.stop_recording()
+            view.roi_manager.stop_session()
+            view.roi_manager.clear_all_items()
+            view.image_viewer.close_tiles()
+            view.image_viewer.deleteLater()
+        self.actionRecordStats.setChecked(False)
+        self.actionRecordSession.setChecked(False)
+        self.cameras = []
+
+    def _on_camera_tab_changed(self, index: int) -> None:
+        """切换摄像头标签页时，树视图改为显示该摄像头的ROI"""
+        if index < 0 or index >= len(self.cameras):
+            return
+        self.treeView.setModel(self.tree_model)  # 模型不变时不做任何事
+        # setModel换模型时会新建选择模型：断开旧选择模型，每个选择模型只连接一次
+        selection = self.treeView.selectionModel()
+        if selection is not self._tree_selection:
+            if self._tree_selection is not None:
+                self._tree_selection.currentChanged.disconnect(self._on_tree_selection_changed)
+            selection.currentChanged.connect(self._on_tree_selection_changed)
+            self._tree_selection = selection
+        self._update_property_table(self.roi_manager.active_roi)
+        self.pushButton_1.setEnabled(self.roi_manager.active_group_item is not None)
+        self.delGroupButton.setEnabled(self.treeView.currentIndex().isValid())
+        if self.actionProfiler.isChecked():
+            self._update_overlay()
+        self._update_trend_rois()
+
     def _setup_camera(self) -> None:
         """初始化摄像头相关组件"""
-        self.capture = cv2.VideoCapture()  # 创建视频捕获对象
-        self.timer = QTimer()  # 创建定时器
+        self.timer = QTimer()  # 显示定时器，按屏幕刷新率取各摄像头的最新帧
         self.timer.timeout.connect(self._update_camera_frame)  # 定时器超时信号
+        self._fps_time = 0.0  # 上次统计吞吐量的时间
 
     def _connect_signals(self) -> None:
         """连接信号槽"""
@@ -407,32 +1332,39 @@ class MainWindow(QtWidgets.QMainWindow):
         self.actionOpenCamera.triggered.connect(self.toggle_camera)  # 打开摄像头菜单
         self.actionSaveRoi.triggered.connect(self.save_config)  # 保存ROI配置菜单
         self.actionLoadRoi.triggered.connect(self.load_config)  # 加载ROI配置菜单
+        self.actionProfiler.toggled.connect(self.toggle_profiler)  # 性能分析开关
+        self.actionDumpProfile.triggered.connect(self.dump_profile)  # 导出耗时CSV
+        self.actionRecordStats.toggled.connect(self.toggle_recording)  # 统计量历史写盘开关
+        self.actionRecordSession.toggled.connect(self.toggle_session_recording)  # 会话录制开关
         
         self.addGroupButton.clicked.connect(self._add_group) # 添加组按钮
         self.delGroupButton.clicked.connect(self._del_selected_item) # 删除组/ROI按钮
         
         self.pushButton_1.clicked.connect(self._add_roi_to_selected_group)  # 添加ROI按钮
-        self.pushButton_2.clicked.connect(self.roi_manager.clear_all_items)  # 清除所有组和ROI按钮
-        
-        # 树视图选中项变化信号
-        self.treeView.selectionModel().currentChanged.connect(self._on_tree_selection_changed)
-        # 树视图项数据变化信号（用于修改名称）
-        self.tree_model.itemChanged.connect(self._on_item_name_changed)
+        self.actionRoiGrid.triggered.connect(self._add_roi_grid)  # 生成ROI阵列
+        self.pushButton_2.clicked.connect(lambda: self.roi_manager.clear_all_items())  # 清除当前摄像头所有组和ROI按钮
 
     def _on_item_name_changed(self, item: QStandardItem) -> None:
         """处理QTreeView中项目名称被手动修改的事件"""
         if item.column() == 0:
             new_name = item.text()
             roi_id = item.data(CustomRoles.RoiIdRole)
-            if roi_id is not None and roi_id in self.roi_manager.rois:
-                self.roi_manager.rois[roi_id].name = new_name
-            # 如果是组名，暂时不处理
+            if roi_id is None:
+                return  # 如果是组名，暂时不处理
+            for view in self.cameras:  # ROI ID在所有摄像头间唯一
+                if roi_id in view.roi_manager.rois:
+                    view.roi_manager.rois[roi_id].name = new_name
+                    break
             
     def _on_tree_selection_changed(self, current: QModelIndex, previous: QModelIndex) -> None:
         """
         处理QTreeView中选中项的变化。
-        根据选中项是组还是ROI，更新按钮状态和属性表格。
+        根据选中项是组还是ROI，更新按钮状态、属性表格和趋势图。
         """
+        self._select_tree_index(current)
+        self._update_trend_rois()
+
+    def _select_tree_index(self, current: QModelIndex) -> None:
         self._update_property_table(None) # 首先清空属性表
 
         if not current.isValid():
@@ -470,22 +1402,28 @@ class MainWindow(QtWidgets.QMainWindow):
                 self.pushButton_1.setEnabled(False)
                 self.delGroupButton.setEnabled(False)
     
-    def _on_roi_selected_update_ui(self, roi: Optional['RectROI']) -> None:
+    def _update_trend_rois(self) -> None:
+        """趋势图显示当前选中的ROI；选中组时显示组内所有ROI"""
+        manager = self.roi_manager
+        if manager.active_roi is not None:
+            roi_ids = [manager.active_roi.unique_id]
+        elif manager.active_group_item is not None:
+            roi_ids = sorted(manager.group_roi_ids(manager.active_group_item))
+        else:
+            roi_ids = []
+        self.trend_view.set_rois(manager.history, [(i, manager.rois[i].name) for i in roi_ids if i in manager.rois])
+
+    def _on_roi_selected_update_ui(self, roi: Optional['RoiBase']) -> None:
         """当ROIManager发出roi_selected信号时，更新属性表并选中树视图中的对应项"""
+        if self.sender() is not self.roi_manager:
+            return  # 非当前标签页的摄像头，切换标签页时再刷新
         self._update_property_table(roi)
         if roi:
-            for group_row in range(self.tree_model.rowCount()):
-                group_item = self.tree_model.item(group_row, 0)
-                if group_item:
-                    for roi_row in range(group_item.rowCount()):
-                        roi_name_item = group_item.child(roi_row, 0)
-                        if roi_name_item and roi_name_item.data(CustomRoles.RoiIdRole) == roi.unique_id:
-                            index = self.tree_model.indexFromItem(roi_name_item)
-                            if index != self.treeView.currentIndex(): # 避免不必要的递归选中
-                                self.treeView.selectionModel().setCurrentIndex(
-                                    index, QtCore.QItemSelectionModel.ClearAndSelect
-                                )
-                            return
+            index = self.roi_manager.roi_model_index(roi.unique_id)
+            if index.isValid() and index != self.treeView.currentIndex(): # 避免不必要的递归选中
+                self.treeView.selectionModel().setCurrentIndex(
+                    index, QtCore.QItemSelectionModel.ClearAndSelect
+                )
         else:
             self.treeView.selectionModel().clearSelection()
 
@@ -505,6 +1443,12 @@ class MainWindow(QtWidgets.QMainWindow):
 
     def _del_selected_item(self) -> None:
         """删除QTreeView中当前选中的组或ROI"""
+        try:
+            self._delete_tree_item()
+        finally:
+            self._update_trend_rois()
+
+    def _delete_tree_item(self) -> None:
         current_index = self.treeView.currentIndex()
         if not current_index.isValid():
             QtWidgets.QMessageBox.warning(self, "删除失败", "请先选中一个组或ROI节点！")
@@ -520,22 +1464,12 @@ class MainWindow(QtWidgets.QMainWindow):
                 QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No, QtWidgets.QMessageBox.No
             )
             if reply == QtWidgets.QMessageBox.Yes:
-                rois_to_delete = []
-                for row in range(item.rowCount()):
-                    roi_name_item = item.child(row, 0)
-                    if roi_name_item:
-                        roi_id = roi_name_item.data(CustomRoles.RoiIdRole)
-                        if roi_id is not None:
-                            rois_to_delete.append(roi_id)
-                
-                for roi_id in rois_to_delete:
-                    self.roi_manager.remove_roi_by_id(roi_id) # 会从PlotWidget和树模型中删除
-                
-                self.tree_model.removeRow(current_index.row()) # 最后删除组本身
+                group_name = item.text()
+                self.roi_manager.remove_group(item) # 从PlotWidget和树模型中删除组下ROI及组本身
                 self.roi_manager.set_active_group_item(None) 
                 self.roi_manager._update_selection(None) 
                 self._update_property_table(None) 
-                QtWidgets.QMessageBox.information(self, "删除成功", f"分组 '{item.text()}' 及其下的ROI已删除。")
+                QtWidgets.QMessageBox.information(self, "删除成功", f"分组 '{group_name}' 及其下的ROI已删除。")
 
         else: # 是ROI节点
             reply = QtWidgets.QMessageBox.question(
@@ -555,11 +1489,55 @@ class MainWindow(QtWidgets.QMainWindow):
     def _add_roi_to_selected_group(self) -> None:
         """添加ROI到当前选中的组"""
         if self.roi_manager.active_group_item:
-            self.roi_manager.add_roi()
+            x, y, w, h = 50, 50, 100, 100
+            shape = self.NEW_ROI_SHAPES[self.shape_box.currentText()]
+            spec = None
+            if shape == 'polygon':
+                # 默认五边形，内接于与矩形相同的区域
+                t = np.deg2rad(np.arange(5) * 72.0 - 90.0)
+                points = np.column_stack((x + w / 2 * (1 + np.cos(t)), y + h / 2 * (1 + np.sin(t))))
+                spec = {'shape': 'polygon', 'points': points.round(2).tolist()}
+            elif shape is not None:
+                spec = {'shape': shape, 'angle': 0.0}
+            self.roi_manager.add_roi(x, y, w, h, spec=spec)
+            self._update_trend_rois()
         else:
             QtWidgets.QMessageBox.warning(self, "添加ROI失败", "请先在左侧树视图中选中一个分组，再添加ROI。")
 
 
+    def _add_roi_grid(self) -> None:
+        """以选中的ROI为模板生成阵列，输入行列数和间距，再选择保存到的组"""
+        manager = self.roi_manager
+        seed = manager.active_roi
+        if seed is None:
+            QtWidgets.QMessageBox.warning(self, "生成ROI阵列失败", "请先选中一个ROI作为模板。")
+            return
+        size = seed.size()
+        default = self._grid_text or f"3 4 {round(size.x() * 1.5, 2)} {round(size.y() * 1.5, 2)}"
+        text, ok = QtWidgets.QInputDialog.getText(self, "ROI阵列", "行数 列数 X间距 Y间距", text=default)
+        if not ok:
+            return
+        try:
+            rows, cols, dx, dy = text.split()
+            rows, cols, pitch = int(rows), int(cols), (float(dx), float(dy))
+        except ValueError:
+            self._show_error(f"阵列参数应为 '行数 列数 X间距 Y间距'：{text!r}")
+            return
+
+        groups = [self.tree_model.item(row, 0) for row in range(self.tree_model.rowCount())]
+        current = manager.active_group_item if manager.active_group_item in groups else groups[0]
+        name, ok = QtWidgets.QInputDialog.getItem(self, "ROI阵列", "保存到组", [g.text() for g in groups],
+                                                  groups.index(current), False)
+        if not ok:
+            return
+        try:
+            manager.add_roi_grid(seed, rows, cols, pitch, groups[[g.text() for g in groups].index(name)])
+        except ValueError as e:
+            self._show_error(f"生成ROI阵列失败: {e}")
+            return
+        self._grid_text = text
+        self._update_trend_rois()
+
     def save_config(self) -> None:
         """保存ROI配置到文件 (符合 step1.toml 模板格式)"""
         path, _ = QtWidgets.QFileDialog.getSaveFileName(
@@ -571,14 +1549,24 @@ class MainWindow(QtWidgets.QMainWindow):
         # 构建TOML模板中的静态部分
         config_data = {}
         
-        # 由于当前只有一个ImageViewer，我们将所有ROI保存到假定的 "camera1" 下。
-        camera_section_name = "camera1" 
-        config_data[camera_section_name] = {"address": "DEFAULT_CAMERA_ADDRESS_PLACEHOLDER"} # 摄像头地址占位符
-        config_data[camera_section_name]["ROI"] = {} # 初始化ROI字典
+        # 每个摄像头标签页保存为一个 [cameraN] 段
+        for view in self.cameras:
+            config_data[view.name] = {"address": view.address, "ROI": self._camera_roi_config(view)}
 
+        try:
+            roi_config.save_config(path, config_data) # 同时写出列式缓存，下次加载走快速路径
+            QtWidgets.QMessageBox.information(self, "保存成功", "ROI配置已成功保存！")
+
+        except Exception as e:
+            QtWidgets.QMessageBox.critical(self, "保存失败", f"保存ROI配置失败: {e}")
+            print(f"ROI配置文件写入失败: {e}")
+
+    def _camera_roi_config(self, view: CameraView) -> Dict[str, Dict[str, Any]]:
+        """按树视图顺序导出一个摄像头的 {组名: {model_type, model_name, ROI名: 坐标}}"""
+        roi_section = {}
         # 遍历QTreeView中的组
-        for group_row in range(self.tree_model.rowCount()):
-            group_item = self.tree_model.item(group_row, 0)
+        for group_row in range(view.tree_model.rowCount()):
+            group_item = view.tree_model.item(group_row, 0)
             if group_item:
                 group_name = group_item.text()
                 model_type = group_item.data(CustomRoles.GroupModelTypeRole) or "shitu" # 获取模型类型，若无则用默认
@@ -592,21 +1580,13 @@ class MainWindow(QtWidgets.QMainWindow):
                     roi_name_item = group_item.child(roi_child_row, 0)
                     if roi_name_item:
                         roi_id = roi_name_item.data(CustomRoles.RoiIdRole)
-                        if roi_id is not None and roi_id in self.roi_manager.rois:
-                            roi_obj = self.roi_manager.rois[roi_id]
+                        if roi_id is not None and roi_id in view.roi_manager.rois:
+                            roi_obj = view.roi_manager.rois[roi_id]
                             # 使用 ROI 的 name 作为键，其坐标列表作为值
                             group_data[roi_obj.name] = roi_obj.get_toml_format_coords()
                             
-                config_data[camera_section_name]["ROI"][group_name] = group_data
-
-        try:
-            with open(path, "w", encoding="utf-8") as f:
-                toml.dump(config_data, f)
-            QtWidgets.QMessageBox.information(self, "保存成功", "ROI配置已成功保存！")
-
-        except Exception as e:
-            QtWidgets.QMessageBox.critical(self, "保存失败", f"保存ROI配置失败: {e}")
-            print(f"ROI配置文件写入失败: {e}")
+                roi_section[group_name] = group_data
+        return roi_section
 
     def load_config(self) -> None:
         """加载ROI配置文件 (符合 step1.toml 模板格式)"""
@@ -618,57 +1598,29 @@ class MainWindow(QtWidgets.QMainWindow):
             return
 
         try:
-            with open(path, "r", encoding="utf-8") as f:
-                config_data = toml.load(f)
+            # 与TOML内容哈希一致时直接读取列式缓存，否则解析TOML并重建缓存
+            camera_list, groups, _ = roi_config.load_cameras(path)
             
-            self.roi_manager.clear_all_items() # 加载新数据前清空现有ROIs和组
-            RectROI.reset_counter(0) # 重置ROI ID计数器
-
-            # 遍历 TOML 文件中的所有顶级 section
-            for section_key, section_data in config_data.items():
-                # 寻找形如 "cameraX" 的 section，且其中包含 "ROI" 子表
-                if section_key.startswith("camera") and isinstance(section_data, dict) and "ROI" in section_data:
-                    camera_roi_sections = section_data["ROI"] # 获取该摄像头下的ROI总数据
-
-                    # 遍历该摄像头下的各个组 (group1, group2...)
-                    for group_name, group_data in camera_roi_sections.items():
-                        if not isinstance(group_data, dict):
-                            print(f"警告: 摄像头 '{section_key}' 下的组 '{group_name}' 格式不正确。跳过。")
-                            continue
-
-                        model_type = group_data.get("model_type", "shitu") # 获取组的模型类型
-                        model_name = group_data.get("model_name", "default_model") # 获取组的模型名称
-                        
-                        # 在UI中创建组。为了避免不同摄像头下有同名组的冲突，可以考虑加前缀。
-                        # 这里为了简化，就直接用组名，如果TOML中有重复组名，UI会显示重复。
-                        # 更好的做法是在这里提供一个对话框让用户选择加载哪个摄像头的ROI配置。
-                        group_ui_item = self.roi_manager.add_group(
-                            group_name=group_name, 
-                            model_type=model_type, 
-                            model_name=model_name
-                        )
-                        self.roi_manager.set_active_group_item(group_ui_item) # 临时设置此组为活动组
-
-                        # 遍历组中的所有 ROI 条目
-                        for roi_key, roi_coords_list in group_data.items():
-                            # 排除 model_type 和 model_name，因为它们是组的属性而不是ROI
-                            if roi_key not in ["model_type", "model_name"] and \
-                               isinstance(roi_coords_list, list) and len(roi_coords_list) == 4:
-                                
-                                x, y, w, h = roi_coords_list
-                                # roi_manager.add_roi 会自动生成 unique_id
-                                self.roi_manager.add_roi(
-                                    x=x, y=y, w=w, h=h, 
-                                    name=roi_key, # 使用 TOML 中的键作为 ROI 的名称
-                                    unique_id=None # 允许 RectROI 自动生成内部唯一ID
-                                )
-                            elif roi_key not in ["model_type", "model_name"]:
-                                print(f"警告: 组 '{group_name}' 下的 '{roi_key}' 不是有效ROI坐标列表。跳过。")
+            self._clear_camera_views() # 加载新数据前清空现有摄像头、ROIs和组
+            RectROI.reset_counter(0) # 重置ROI ID计数器，ID在所有摄像头间保持唯一
+
+            # 每个 [cameraN] 段建立一个标签页（没有ROI表的摄像头也建立），各摄像头的组互不影响
+            camera_groups: Dict[str, List[Dict[str, Any]]] = {name: [] for name, _ in camera_list}
+            for group in groups:
+                camera_groups[group["camera"]].append(group)
+            for camera_name, address in camera_list:
+                view = self._add_camera_view(camera_name, address) # 第一个标签页加入时触发 _on_camera_tab_changed
+                if camera_groups[camera_name]:
+                    view.roi_manager.add_groups_bulk(camera_groups[camera_name]) # 一次插入模型，批量加入场景并统一统计
+            if not self.cameras:
+                self._add_camera_view("camera1")
+            self.camera_tabs.setCurrentIndex(0)
             
             # 加载完成后，清除UI中的任何选中状态，重置按钮状态
             self.treeView.selectionModel().clearSelection()
-            self.roi_manager.set_active_group_item(None) 
-            self.roi_manager._update_selection(None) 
+            for view in self.cameras:
+                view.roi_manager.set_active_group_item(None) 
+                view.roi_manager._update_selection(None) 
             self._update_property_table(None) 
             self.pushButton_1.setEnabled(False) 
             self.delGroupButton.setEnabled(False) 
@@ -684,31 +1636,56 @@ class MainWindow(QtWidgets.QMainWindow):
         """加载图像文件"""
         try:
             path, _ = QtWidgets.QFileDialog.getOpenFileName(
-                self, "打开图像", "", "Images (*.jpg *.png *.bmp)")
+                self, "打开图像", "",
+                "Images (*.jpg *.png *.bmp *.tif *.tiff *.npy *.raw *.bin);;RAW (*.raw *.bin)")
             if not path:
                 return
 
-            image = cv2.imread(path)
-            if image is None:
-                raise ValueError("无法读取图像文件")
-
-            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            self._process_image(image)  
+            raw_format = None
+            if os.path.splitext(path)[1].lower() in image_loader.RAW_EXTENSIONS:
+                text, ok = QtWidgets.QInputDialog.getText(
+                    self, "RAW格式", "宽x高 像素格式 [文件头字节数]\n像素格式: mono8/mono12/mono16, bayer_rggb8/bayer_bggr12 ...",
+                    text=self._raw_format_text)
+                if not ok:
+                    return
+                raw_format = image_loader.parse_raw_format(text)
+                self._raw_format_text = text
+
+            # 未压缩格式内存映射打开，颜色转换推迟到显示的块上，ROI统计直接读映射的灰度缓冲区
+            loaded = image_loader.open_image(path, raw_format)
+            self._process_image(loaded.data, loaded.convert, loaded.gray)  
         except Exception as e:
             self._show_error(f"加载图像失败: {str(e)}")  
 
-    def _process_image(self, image: np.ndarray) -> None:
+    def _process_image(self, image: np.ndarray, convert: Convert = to_display,
+                       gray: Optional[np.ndarray] = None) -> None:
         """
         处理并显示图像。
-        此方法现在包含对图像进行方向校正的逻辑。
+        row-major模式下原始连续缓冲区直接用于显示和ROI统计，不再逐帧转置。
+        convert: 原始数据到uint8显示数据的转换，大图只作用于可见的块
+        gray: ROI统计使用的uint8灰度图 (与image同为 image[y, x])，None时统计直接使用image
         """
-        # pyqtgraph在您的环境中会默认逆时针旋转图片90度，所以需要顺时针90度抵消。
-        corrected_image = np.rot90(image, k=-1)
-        corrected_image = np.flip(corrected_image, axis=1)
-        
-
-        self.image_viewer.update_image(corrected_image)  
-        self.roi_manager.update_image_data(corrected_image)  
+        profiler = self.current_camera.profiler
+        tiled = self.image_viewer.use_tiles(image)
+        if tiled:
+            # 大图按原始 image[y, x] 构建金字塔分块显示，不经过整图的setImage拷贝
+            with profiler.measure("display.pyramid"):
+                self.image_viewer.show_tiled(image, convert)
+        else:
+            image = convert(image)
+        stats_image = image if gray is None else gray
+        if self.image_viewer.axis_order == 'col-major':
+            with profiler.measure("image.orient"):
+                # pyqtgraph默认列优先，会把图片逆时针旋转90度，所以需要顺时针90度并翻转抵消。
+                # 两步都是视图，合起来等价于转置，不拷贝数据
+                image = np.flip(np.rot90(image, k=-1), axis=1)
+                stats_image = np.flip(np.rot90(stats_image, k=-1), axis=1)
+
+        if not tiled:
+            with profiler.measure("display.setImage"):
+                self.image_viewer.update_image(image)  
+        with profiler.measure("stats.update"):
+            self.roi_manager.update_image_data(stats_image)  
 
     def toggle_camera(self) -> None:
         """切换摄像头状态"""
@@ -718,61 +1695,207 @@ class MainWindow(QtWidgets.QMainWindow):
             self._start_camera()  
 
     def _start_camera(self) -> None:
-        """启动摄像头"""
-        if not self.capture.open(0):  
-            self._show_error("无法打开摄像头")
-            return
-        self.timer.start(30)  
+        """
+        为每个摄像头启动一个采集线程，读帧和ROI统计在各自线程中并行完成，
+        显示刷新与采集帧率解耦。
+        """
+        for view in self.cameras:
+            thread = CaptureThread(view.source, view.image_viewer.axis_order, self, view.profiler)
+            thread.rects = view.roi_manager.roi_rects()
+            thread.open_failed.connect(lambda message, v=view: self._on_capture_failed(v, message))
+            view.capture_thread = thread
+            thread.start()
+        self._fps_time = time.perf_counter()
+        refresh_rate = self.screen().refreshRate() or 60.0
+        self.timer.start(max(1, int(1000 / refresh_rate)))
 
     def _stop_camera(self) -> None:
-        """停止摄像头"""
+        """停止所有摄像头"""
         self.timer.stop()  
-        self.capture.release()  
+        for view in self.cameras:
+            view.stop_capture()
+
+    def _on_capture_failed(self, view: CameraView, message: str) -> None:
+        """某个采集线程打开摄像头失败，只停止该摄像头，其余摄像头继续采集"""
+        view.stop_capture()
+        if not any(v.capture_thread is not None for v in self.cameras):
+            self.timer.stop()
+        self._show_error(f"{view.name}: {message}")
 
     def _update_camera_frame(self) -> None:
-        """更新摄像头帧"""
-        ret, frame = self.capture.read()  
-        if ret:
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)  
-            self._process_image(frame)  
+        """显示各采集线程最新处理完的一帧，没有新帧的摄像头跳过"""
+        for view in self.cameras:
+            latest = view.capture_thread.take_latest() if view.capture_thread else None
+            if latest is None:
+                continue
+            self._show_frame(view, latest)
+
+        now = time.perf_counter()
+        elapsed = now - self._fps_time
+        if elapsed >= 1.0:  # 每秒在状态栏报告各摄像头及合计吞吐量
+            self._fps_time = now
+            parts = [f"{view.name}: {view.update_fps(elapsed):.1f} fps"
+                     for view in self.cameras if view.capture_thread is not None]
+            total = sum(view.fps for view in self.cameras)
+            self.statusbar.showMessage("  |  ".join(parts + [f"合计: {total:.1f} fps"]))
+
+    def _show_frame(self, view: CameraView,
+                    latest: Tuple[BatchRoiStats, Dict[int, Tuple[int, int, int, int]], Dict[int, Dict[str, float]], float]) -> None:
+        """显示一帧处理结果 (engine, rects, results, 读帧完成时间)；会话回放也走这里"""
+        engine, rects, results, captured_at = latest
+        profiler = view.profiler
+        recorder = view.roi_manager.recorder
+        if recorder is not None:
+            with profiler.measure("record.frame"):
+                recorder.write_frame(captured_at, engine.image)
+        with profiler.measure("display.setImage"):
+            view.image_viewer.update_image(engine.image)
+        with profiler.measure("display.apply_frame"):
+            view.roi_manager.apply_frame(engine, rects, results, tracked=view.capture_thread is not None)
+        if view.capture_thread is not None:
+            view.capture_thread.rects = view.roi_manager.roi_rects()  # 下一帧使用最新的ROI几何
+        view.roi_manager.record_history(captured_at)
+        if profiler.enabled:
+            shown_at = time.perf_counter()
+            profiler.record("display.latency", shown_at - captured_at, shown_at)  # 读帧到显示的端到端延迟
+            profiler.record("display.frame", 0.0, shown_at)  # 只用时间戳计算显示帧率
+
+    def toggle_profiler(self, enabled: bool) -> None:
+        """开关性能分析：记录各阶段耗时并显示叠加层"""
+        for view in self.cameras:
+            view.profiler.enabled = enabled
+            if not enabled:
+                view.image_viewer.set_overlay_text(None)
+        if enabled:
+            self.overlay_timer.start(250)
+            self._update_overlay()
+        else:
+            self.overlay_timer.stop()
 
-    def _update_property_table(self, roi: Optional[RectROI]) -> None:
-        """更新属性表格"""
-        self.property_model.clear()  
-        self.property_model.setHorizontalHeaderLabels(["属性", "值"]) 
+    def _update_overlay(self) -> None:
+        """刷新当前标签页摄像头的叠加层"""
+        view = self.current_camera
+        view.image_viewer.set_overlay_text(view.overlay_text())
 
-        if roi is None:
+    def dump_profile(self) -> None:
+        """导出各摄像头的原始耗时样本，并在旁边写一份分位数汇总"""
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(self, "导出耗时", "", "CSV (*.csv)")
+        if not path:
             return
+        profilers = {view.name: view.profiler for view in self.cameras}
+        try:
+            stage_profiler.dump_csv(path, profilers)
+            stage_profiler.dump_summary_csv(os.path.splitext(path)[0] + "_summary.csv", profilers)
+        except OSError as e:
+            self._show_error(f"导出耗时失败: {e}")
+
+    def toggle_recording(self, enabled: bool) -> None:
+        """开关统计量历史写盘；每个摄像头写一个文件，文件名追加摄像头段名"""
+        if not enabled:
+            for view in self.cameras:
+                view.roi_manager.history.stop_recording()
+            self.statusbar.showMessage("已停止记录统计量", 3000)
+            return
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(self, "记录统计量", "", "ROI统计量记录 (*.roihist)")
+        if not path:
+            self.actionRecordStats.setChecked(False)
+            return
+        base, ext = os.path.splitext(path)
+        try:
+            for view in self.cameras:
+                view.roi_manager.history.start_recording(f"{base}_{view.name}{ext or '.roihist'}")
+        except (OSError, ValueError) as e:  # ValueError: 已有文件不是同格式的统计量记录
+            for view in self.cameras:
+                view.roi_manager.history.stop_recording()
+            self.actionRecordStats.setChecked(False)
+            self._show_error(f"无法写入统计量记录: {e}")
+
+    def toggle_session_recording(self, enabled: bool) -> None:
+        """开关会话录制；每个摄像头写一个文件，文件名追加摄像头段名"""
+        if not enabled:
+            frames = 0
+            for view in self.cameras:
+                if view.roi_manager.recorder is not None:
+                    frames += view.roi_manager.recorder.frames
+                view.roi_manager.stop_session()
+            self.statusbar.showMessage(f"已停止录制会话，共 {frames} 帧", 3000)
+            return
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(self, "录制会话", "", "ROI会话录制 (*.roirec)")
+        if not path:
+            self.actionRecordSession.setChecked(False)
+            return
+        base, ext = os.path.splitext(path)
+        try:
+            for view in self.cameras:
+                writer = SessionWriter(f"{base}_{view.name}{ext or '.roirec'}", view.image_viewer.axis_order)
+                view.roi_manager.start_session(writer)
+        except OSError as e:
+            for view in self.cameras:
+                view.roi_manager.stop_session()
+            self.actionRecordSession.setChecked(False)
+            self._show_error(f"无法写入会话录制: {e}")
+
+    def _update_property_table(self, roi: Optional[RoiBase]) -> None:
+        """
+        请求刷新属性表格。拖动ROI和摄像头每帧都会调用，这里只记录要显示的ROI，
+        距上次刷新不足 PROPERTY_REFRESH_MS 时合并到定时器中统一刷新。
+        """
+        self._property_roi = roi
+        if self._property_timer.isActive():
+            return
+        elapsed_ms = (time.perf_counter() - self._property_refreshed_at) * 1000.0
+        if elapsed_ms >= self.PROPERTY_REFRESH_MS:
+            self._refresh_property_table()
+        else:
+            self._property_timer.start(int(self.PROPERTY_REFRESH_MS - elapsed_ms) + 1)
 
-        properties = {
-            "ID": roi.unique_id,
-            "名称": roi.name,
-            "位置": f"({roi.position[0]}, {roi.position[1]})", 
-            "尺寸": f"({roi.dimensions[0]}, {roi.dimensions[1]})",
-            "最大灰度值": roi.stats_formatted.get('GrayMax', 'N/A'),
-            "最小灰度值": roi.stats_formatted.get('GrayMin', 'N/A'),
-            "平均灰度值": roi.stats_formatted.get('GrayMean', 'N/A'),
-            "灰度值极差": roi.stats_formatted.get('GrayRange', 'N/A'),
-            "能量": roi.stats_formatted.get('Energy', 'N/A'),
-            "相关性": roi.stats_formatted.get('Correlation', 'N/A'),
-            "均匀性": roi.stats_formatted.get('Homogeneity', 'N/A'),
-            "对比度": roi.stats_formatted.get('Contrast', 'N/A')
-        }
-        x2=round(roi.position[0]+roi.dimensions[0],2)
-        y2=round(roi.position[1]+roi.dimensions[1],2)
-
-        print(f"长宽模式：[{roi.position[0]},{roi.position[1]},{roi.dimensions[0]},{roi.dimensions[1]}]    坐标模式[{roi.position[0]},{roi.position[1]},{x2},{y2}]")
+    def _refresh_property_table(self) -> None:
+        """按最新请求刷新属性表格"""
+        with self.current_camera.profiler.measure("ui.property_table"):
+            self._fill_property_table(self._property_roi)
+        self._property_refreshed_at = time.perf_counter()
 
-        for row, (key, value) in enumerate(properties.items()):
-            key_item = QStandardItem(str(key))
-            tooltip_text = self.PROPERTY_TOOLTIPS.get(key, "") 
-            if tooltip_text: 
-                key_item.setToolTip(tooltip_text)
-            
-            value_item = QStandardItem(str(value))
+    def _fill_property_table(self, roi: Optional[RoiBase]) -> None:
+        """只对显示内容变化的单元格调用setData，行和表头在 _setup_ui 中只创建一次"""
+        if roi is not None and roi.unique_id not in self.roi_manager.rois:
+            roi = None  # 等待刷新期间ROI已被删除或切换了摄像头
 
-            self.property_model.setItem(row, 0, key_item)
-            self.property_model.setItem(row, 1, value_item)
+        if roi is None:
+            values = [""] * len(self._property_values)
+        else:
+            stats = roi.stats_formatted
+            values = [
+                roi.unique_id,
+                roi.name,
+                f"({roi.position[0]}, {roi.position[1]})", 
+                f"({roi.dimensions[0]}, {roi.dimensions[1]})",
+                stats.get('GrayMax', 'N/A'),
+                stats.get('GrayMin', 'N/A'),
+                stats.get('GrayMean', 'N/A'),
+                stats.get('GrayRange', 'N/A'),
+                stats.get('Energy', 'N/A'),
+                stats.get('Correlation', 'N/A'),
+                stats.get('Homogeneity', 'N/A'),
+                stats.get('Contrast', 'N/A'),
+                ", ".join(str(other.unique_id) for other in self.roi_manager.overlapping_rois(roi)) or "无"
+            ]
+            values = [str(value) for value in values]
+
+        # 未选中ROI时隐藏所有行，与之前清空表格的效果一致
+        if (roi is None) != self._property_rows_hidden:
+            self._property_rows_hidden = roi is None
+            for row in range(len(values)):
+                self.tableView.setRowHidden(row, self._property_rows_hidden)
+
+        if roi is not None and values[2:4] != self._property_values[2:4]:
+            x2=round(roi.position[0]+roi.dimensions[0],2)
+            y2=round(roi.position[1]+roi.dimensions[1],2)
+            print(f"长宽模式：[{roi.position[0]},{roi.position[1]},{roi.dimensions[0]},{roi.dimensions[1]}]    坐标模式[{roi.position[0]},{roi.position[1]},{x2},{y2}]")
+
+        for row, value in enumerate(values):
+            if value != self._property_values[row]:
+                self._property_values[row] = value
+                self.property_model.item(row, 1).setData(value, QtCore.Qt.DisplayRole)
 
     def _show_error(self, message: str) -> None:
         """显示错误信息"""
@@ -781,6 +1904,10 @@ class MainWindow(QtWidgets.QMainWindow):
     def closeEvent(self, event: QtGui.QCloseEvent) -> None:
         """窗口关闭事件处理"""
         self._stop_camera()  
+        for view in self.cameras:
+            view.roi_manager.history.stop_recording()  # 写出缓冲中剩余的记录
+            view.roi_manager.stop_session()
+            view.image_viewer.close_tiles()
         super().closeEvent(event)
 
 
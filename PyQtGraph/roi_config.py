@@ -0,0 +1,296 @@
+"""ROI配置读写
+TOML 仍是人工可编辑的主配置；保存时在旁边写一个列式的 .roi.npz 缓存
+(x/y/w/h 数组 + 组名/ROI名字符串表)，加载时 TOML 内容的哈希与缓存一致就直接读缓存，
+不再用纯Python的toml包重新解析。
+
+ROI条目有两种写法，旧配置无需修改：
+    boss1 = [x, y, w, h]                                              # 轴对齐矩形
+    boss2 = { shape = "rect", pos = [x, y], size = [w, h], angle = 30.0 }  # 旋转矩形
+    boss3 = { shape = "ellipse", pos = [x, y], size = [w, h], angle = 0.0 }
+    boss4 = { shape = "polygon", points = [[x1, y1], [x2, y2], [x3, y3]] }
+"""
+import hashlib
+import os
+import numpy as np
+import toml
+from typing import Optional, Tuple, Dict, Any, List, Collection  # 类型提示
+from roi_stats import SHAPES, shape_bounds
+
+SIDECAR_VERSION = 3  # 缓存格式版本，格式变化时递增使旧缓存失效
+GROUP_KEYS = ("model_type", "model_name")  # 组属性，不是ROI
+
+
+def sidecar_path(toml_path: str) -> str:
+    """TOML配置对应的列式缓存路径，例如 setting.toml -> setting.roi.npz"""
+    return os.path.splitext(toml_path)[0] + ".roi.npz"
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_pair(value: Any) -> bool:
+    return isinstance(value, list) and len(value) == 2 and all(_is_number(v) for v in value)
+
+
+def parse_roi(value: Any) -> Optional[Tuple[float, float, float, float, Optional[Dict[str, Any]]]]:
+    """
+    解析一个ROI条目，返回 (x, y, w, h, spec)；格式不正确时返回None。
+    轴对齐矩形的 spec 为None；形状ROI的 spec 为 {"shape", "angle"} 或 {"shape", "points"}，
+    多边形的 (x, y, w, h) 为顶点外接框。
+    """
+    if isinstance(value, list):
+        if len(value) == 4 and all(_is_number(v) for v in value):
+            x, y, w, h = value
+            return x, y, w, h, None
+        return None
+    if not isinstance(value, dict) or value.get("shape") not in SHAPES:
+        return None
+    if value["shape"] == "polygon":
+        points = value.get("points")
+        if not (isinstance(points, list) and len(points) >= 3 and all(_is_pair(p) for p in points)):
+            return None
+        x, y, w, h = shape_bounds(np.asarray(points, dtype=np.float64))
+        return x, y, w, h, {"shape": "polygon", "points": [list(p) for p in points]}
+    angle = value.get("angle", 0.0)
+    if not (_is_pair(value.get("pos")) and _is_pair(value.get("size")) and _is_number(angle)):
+        return None
+    (x, y), (w, h) = value["pos"], value["size"]
+    return x, y, w, h, {"shape": value["shape"], "angle": float(angle)}
+
+
+def format_roi(x: float, y: float, w: float, h: float, spec: Optional[Dict[str, Any]] = None) -> Any:
+    """parse_roi 的逆过程，得到写入TOML的值"""
+    if spec is None:
+        return [x, y, w, h]
+    if spec["shape"] == "polygon":
+        return {"shape": "polygon", "points": [list(p) for p in spec["points"]]}
+    return {"shape": spec["shape"], "pos": [x, y], "size": [w, h], "angle": spec.get("angle", 0.0)}
+
+
+def grid_layout(seed: Tuple[str, float, float, float, float, Optional[Dict[str, Any]]], rows: int, cols: int,
+                pitch: Tuple[float, float], skip_seed: bool = False, existing: Collection[str] = ()
+                ) -> List[Tuple[str, float, float, float, float, Optional[Dict[str, Any]]]]:
+    """
+    以 seed (roi_name, x, y, w, h, spec) 为第1行第1列，按间距 pitch=(dx, dy) 排成 rows 行 cols 列，
+    返回 add_groups_bulk 使用的ROI元组，名称为 "<seed名称>_<行>_<列>"。
+    所有格子的偏移一次算出，多边形的顶点整体平移；skip_seed 为True时不生成seed所在的格子。
+    existing 为目标组中已有的ROI名称：组内ROI按名称保存，生成的名称与其重复时抛出ValueError，
+    避免同一seed重复生成阵列后保存时互相覆盖。
+    """
+    if rows < 1 or cols < 1:
+        raise ValueError(f"行数和列数至少为1: {rows} x {cols}")
+    name, x, y, w, h, spec = seed
+    row, col = np.divmod(np.arange(rows * cols), cols)
+    if skip_seed:
+        row, col = row[1:], col[1:]
+    names = [f"{name}_{r + 1}_{c + 1}" for r, c in zip(row.tolist(), col.tolist())]
+    duplicated = [n for n in names if n in existing]
+    if duplicated:
+        more = f" 等{len(duplicated)}个" if len(duplicated) > 3 else ""
+        raise ValueError(f"目标组中已有同名ROI: {', '.join(duplicated[:3])}{more}")
+    dx = col * float(pitch[0])
+    dy = row * float(pitch[1])
+    xs, ys = (x + dx).tolist(), (y + dy).tolist()
+    if spec is not None and spec["shape"] == "polygon":
+        points = np.asarray(spec["points"], dtype=np.float64)
+        shifted = points[None] + np.stack((dx, dy), axis=1)[:, None]  # (格子数, 顶点数, 2)
+        specs = [{"shape": "polygon", "points": p} for p in shifted.tolist()]
+    else:
+        specs = [None if spec is None else dict(spec) for _ in xs]
+    return [(cell_name, cx, cy, w, h, cell_spec) for cell_name, cx, cy, cell_spec in zip(names, xs, ys, specs)]
+
+
+def _is_camera_section(section_key: str, section_data: Any) -> bool:
+    return section_key.startswith("camera") and isinstance(section_data, dict)
+
+
+def _camera_address(section_key: str, section_data: Dict[str, Any]) -> str:
+    address = section_data.get("address", "")
+    if not isinstance(address, str):
+        print(f"警告: 摄像头 '{section_key}' 的 address 不是字符串，按空地址处理。")
+        address = ""
+    return address
+
+
+def cameras_from_config(config_data: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """
+    列出TOML配置中所有形如 [cameraX] 的段，返回 [(摄像头名, 地址), ...]。
+    与 groups_from_config 分开：只有地址、还没有ROI表的摄像头也会列出。
+    """
+    return [(section_key, _camera_address(section_key, section_data))
+            for section_key, section_data in config_data.items()
+            if _is_camera_section(section_key, section_data)]
+
+
+def groups_from_config(config_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    校验TOML配置结构并展开为组列表，格式与 ROIManager.add_groups_bulk 的参数一致：
+    [{"camera", "address", "name", "model_type", "model_name", "rois": [(roi_name, x, y, w, h, spec), ...]}, ...]
+    spec 的含义见 parse_roi。不符合结构的组或ROI打印警告后跳过。
+    """
+    groups = []
+    # 遍历 TOML 文件中的所有顶级 section
+    for section_key, section_data in config_data.items():
+        # 寻找形如 "cameraX" 的 section，且其中包含 "ROI" 子表
+        if not (_is_camera_section(section_key, section_data) and "ROI" in section_data):
+            continue
+        address = _camera_address(section_key, section_data)
+        if not isinstance(section_data["ROI"], dict):
+            print(f"警告: 摄像头 '{section_key}' 的 ROI 不是表。跳过。")
+            continue
+
+        # 遍历该摄像头下的各个组 (group1, group2...)
+        for group_name, group_data in section_data["ROI"].items():
+            if not isinstance(group_data, dict):
+                print(f"警告: 摄像头 '{section_key}' 下的组 '{group_name}' 格式不正确。跳过。")
+                continue
+
+            rois = []
+            # 遍历组中的所有 ROI 条目，排除 model_type 和 model_name
+            for roi_key, roi_value in group_data.items():
+                if roi_key in GROUP_KEYS:
+                    continue
+                parsed = parse_roi(roi_value)
+                if parsed is not None:
+                    rois.append((roi_key,) + parsed)
+                else:
+                    print(f"警告: 组 '{group_name}' 下的 '{roi_key}' 不是有效ROI坐标列表或形状。跳过。")
+            groups.append({
+                "camera": section_key,
+                "address": address,
+                "name": group_name,
+                "model_type": str(group_data.get("model_type", "shitu")),
+                "model_name": str(group_data.get("model_name", "default_model")),
+                "rois": rois
+            })
+    return groups
+
+
+def write_sidecar(toml_path: str, groups: List[Dict[str, Any]], toml_bytes: Optional[bytes] = None,
+                  camera_list: Optional[List[Tuple[str, str]]] = None) -> None:
+    """
+    把摄像头列表和组列表写成列式缓存，并记录对应TOML内容的哈希。
+    camera_list 为 cameras_from_config 的结果，省略时从组列表中收集（不含没有ROI表的摄像头）。
+    """
+    if toml_bytes is None:
+        with open(toml_path, "rb") as f:
+            toml_bytes = f.read()
+    if camera_list is None:
+        camera_list = list(dict.fromkeys((group["camera"], group["address"]) for group in groups))
+    cameras = [name for name, _ in camera_list]
+    addresses = [address for _, address in camera_list]
+    rois = [roi for group in groups for roi in group["rois"]]
+    roi_names = [roi[0] for roi in rois]
+    coords = np.array([roi[1:5] for roi in rois], dtype=np.float64).reshape(-1, 4)
+    roi_group = np.repeat(np.arange(len(groups), dtype=np.int32), [len(group["rois"]) for group in groups])
+    # 形状列：轴对齐矩形的形状为空串；多边形顶点拼接存放，roi_point_start 为各ROI的起止位置
+    specs = [roi[5] or {} for roi in rois]
+    points = [np.asarray(spec.get("points", ()), dtype=np.float64).reshape(-1, 2) for spec in specs]
+
+    with open(sidecar_path(toml_path), "wb") as f:  # 传文件对象，避免np.savez自动追加扩展名
+        np.savez(
+            f,
+            version=np.int32(SIDECAR_VERSION),
+            toml_sha256=np.array(_digest(toml_bytes)),
+            camera_names=np.array(cameras, dtype=str),
+            camera_addresses=np.array(addresses, dtype=str),
+            group_camera=np.array([cameras.index(g["camera"]) for g in groups], dtype=np.int32),
+            group_names=np.array([g["name"] for g in groups], dtype=str),
+            group_model_type=np.array([g["model_type"] for g in groups], dtype=str),
+            group_model_name=np.array([g["model_name"] for g in groups], dtype=str),
+            roi_names=np.array(roi_names, dtype=str),
+            roi_group=roi_group,
+            roi_coords=coords,
+            roi_shape=np.array([spec.get("shape", "") for spec in specs], dtype=str),
+            roi_angle=np.array([spec.get("angle", 0.0) for spec in specs], dtype=np.float64),
+            roi_point_start=np.r_[0, np.cumsum([len(p) for p in points])].astype(np.int64),
+            roi_points=np.concatenate(points) if points else np.empty((0, 2))
+        )
+
+
+def read_sidecar(toml_path: str, toml_bytes: bytes
+                 ) -> Optional[Tuple[List[Tuple[str, str]], List[Dict[str, Any]]]]:
+    """哈希与TOML内容一致时从列式缓存读出 (摄像头列表, 组列表)，否则返回None"""
+    path = sidecar_path(toml_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["version"]) != SIDECAR_VERSION or str(data["toml_sha256"]) != _digest(toml_bytes):
+                return None
+            cameras = data["camera_names"].tolist()
+            addresses = data["camera_addresses"].tolist()
+            group_camera = data["group_camera"].tolist()
+            roi_names = data["roi_names"].tolist()
+            coords = data["roi_coords"].tolist()
+            shapes = data["roi_shape"].tolist()
+            angles = data["roi_angle"].tolist()
+            point_start = data["roi_point_start"].tolist()
+            all_points = data["roi_points"]
+            specs: List[Optional[Dict[str, Any]]] = []
+            for i, shape in enumerate(shapes):
+                if not shape:
+                    specs.append(None)
+                elif shape == "polygon":
+                    specs.append({"shape": shape, "points": all_points[point_start[i]:point_start[i + 1]].tolist()})
+                else:
+                    specs.append({"shape": shape, "angle": angles[i]})
+            # roi_group 按组有序，切分点即每组ROI的起止位置
+            bounds = np.searchsorted(data["roi_group"], np.arange(len(group_camera) + 1)).tolist()
+            groups = []
+            for g, (name, model_type, model_name) in enumerate(zip(
+                    data["group_names"].tolist(), data["group_model_type"].tolist(), data["group_model_name"].tolist())):
+                start, stop = bounds[g], bounds[g + 1]
+                groups.append({
+                    "camera": cameras[group_camera[g]],
+                    "address": addresses[group_camera[g]],
+                    "name": name,
+                    "model_type": model_type,
+                    "model_name": model_name,
+                    "rois": [(roi_names[i], *coords[i], specs[i]) for i in range(start, stop)]
+                })
+            return list(zip(cameras, addresses)), groups
+    except (OSError, KeyError, ValueError) as e:
+        print(f"ROI缓存读取失败，改为解析TOML: {e}")
+        return None
+
+
+def load_cameras(toml_path: str) -> Tuple[List[Tuple[str, str]], List[Dict[str, Any]], bool]:
+    """
+    加载ROI配置，返回 (摄像头列表 [(名称, 地址), ...], 组列表, 是否命中缓存)。
+    缓存缺失或与TOML不一致时解析TOML，并重新生成缓存。
+    """
+    with open(toml_path, "rb") as f:
+        toml_bytes = f.read()
+    cached = read_sidecar(toml_path, toml_bytes)
+    if cached is not None:
+        return cached[0], cached[1], True
+
+    config_data = toml.loads(toml_bytes.decode("utf-8"))
+    camera_list = cameras_from_config(config_data)
+    groups = groups_from_config(config_data)
+    try:
+        write_sidecar(toml_path, groups, toml_bytes, camera_list)
+    except OSError as e:
+        print(f"ROI缓存写入失败: {e}")  # 只读目录等情况不影响加载
+    return camera_list, groups, False
+
+
+def load_groups(toml_path: str) -> Tuple[List[Dict[str, Any]], bool]:
+    """加载ROI配置，返回 (组列表, 是否命中缓存)，见 load_cameras"""
+    _, groups, cached = load_cameras(toml_path)
+    return groups, cached
+
+
+def save_config(toml_path: str, config_data: Dict[str, Any]) -> None:
+    """保存TOML配置，并同步写出列式缓存"""
+    text = toml.dumps(config_data)
+    toml_bytes = text.encode("utf-8")
+    with open(toml_path, "wb") as f:
+        f.write(toml_bytes)
+    write_sidecar(toml_path, groups_from_config(config_data), toml_bytes, cameras_from_config(config_data))
@@ -0,0 +1,169 @@
+"""ROI统计量的时间序列
+每个ROI一个预分配的环形缓冲区 (时间戳 + 每个统计量一列)，内存占用固定；
+可选地把每次记录按块追加写入磁盘文件，长时间运行也不会增长内存。
+磁盘文件以文件头开始：MAGIC、(格式版本, JSON长度) 和JSON {"keys": [统计量...]}，JSON用空格补齐到8字节对齐；
+之后是连续的 float64 记录，每条记录依次为 (Unix时间戳, ROI ID, *keys)，用 load_recording() 读回。
+"""
+import json
+import math
+import os
+import struct
+import time
+import numpy as np
+from typing import Optional, Tuple, Dict, List, Sequence  # 类型提示
+from roi_stats import STAT_KEYS
+
+HISTORY_SIZE = 4096  # 每个ROI保留的最近记录数
+CHUNK_ROWS = 4096  # 写盘缓冲的记录数，攒满一块写一次
+MAGIC = b"ROIHIST\n"
+FORMAT_VERSION = 1  # 磁盘格式版本，格式变化时递增
+_HEADER = struct.Struct("<II")  # 格式版本, JSON字节数
+
+
+def _encode_header(keys: Sequence[str]) -> bytes:
+    """文件头，总长度为8的倍数，使记录可以直接内存映射"""
+    meta = json.dumps({"keys": list(keys)}, ensure_ascii=False).encode("utf-8")
+    meta += b" " * (-(len(MAGIC) + _HEADER.size + len(meta)) % 8)
+    return MAGIC + _HEADER.pack(FORMAT_VERSION, len(meta)) + meta
+
+
+def read_header(f) -> Tuple[List[str], int]:
+    """从文件开头读出 (统计量列名, 记录起始偏移)；不是统计量记录或版本不支持时抛出ValueError"""
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError(f"不是统计量记录文件: {getattr(f, 'name', f)}")
+    head = f.read(_HEADER.size)
+    if len(head) < _HEADER.size:
+        raise ValueError("统计量记录的文件头被截断")
+    version, size = _HEADER.unpack(head)
+    if version != FORMAT_VERSION:
+        raise ValueError(f"不支持的统计量记录版本: {version}")
+    meta = f.read(size)
+    if len(meta) < size:
+        raise ValueError("统计量记录的文件头被截断")
+    return list(json.loads(meta.decode("utf-8"))["keys"]), len(MAGIC) + _HEADER.size + size
+
+
+class RoiHistory:
+    """
+    按ROI保存统计量历史，时间戳单位为秒 (time.perf_counter)。
+    写盘时换算为Unix时间：开始记录时取一次 time.time() 与 time.perf_counter() 的差作为锚点，
+    不同次运行、追加到同一文件的记录可以直接比较。
+    """
+
+    def __init__(self, capacity: int = HISTORY_SIZE, keys: Sequence[str] = STAT_KEYS, chunk_rows: int = CHUNK_ROWS):
+        self.capacity = capacity
+        self.keys = tuple(keys)
+        self.t0: Optional[float] = None  # 第一次记录的时间，绘图时作为横轴零点
+        self._times: Dict[int, np.ndarray] = {}  # roi_id -> (capacity,) 时间戳
+        self._values: Dict[int, np.ndarray] = {}  # roi_id -> (capacity, len(keys)) 统计量
+        self._counts: Dict[int, int] = {}  # roi_id -> 累计记录数，取模即写入位置
+        self._chunk = np.empty((chunk_rows, 2 + len(self.keys)), dtype=np.float64)  # 写盘缓冲
+        self._chunk_len = 0
+        self._file = None  # 正在写入的磁盘文件
+        self._wall_offset = 0.0  # perf_counter 时间 + 该值 = Unix时间
+        self.recording_path: Optional[str] = None
+
+    def append(self, timestamp: float, stats: Dict[int, Dict[str, float]]) -> None:
+        """记录同一时刻若干ROI的统计量，缺失的统计量记为NaN"""
+        if self.t0 is None:
+            self.t0 = timestamp
+        for roi_id, roi_stats in stats.items():
+            values = self._values.get(roi_id)
+            if values is None:
+                self._times[roi_id] = np.zeros(self.capacity, dtype=np.float64)
+                values = self._values[roi_id] = np.zeros((self.capacity, len(self.keys)), dtype=np.float64)
+                self._counts[roi_id] = 0
+            pos = self._counts[roi_id] % self.capacity
+            row = [float(roi_stats.get(key, math.nan)) for key in self.keys]
+            self._times[roi_id][pos] = timestamp
+            values[pos] = row
+            self._counts[roi_id] += 1
+            if self._file is not None:
+                self._chunk[self._chunk_len] = [timestamp + self._wall_offset, roi_id] + row
+                self._chunk_len += 1
+                if self._chunk_len == len(self._chunk):
+                    self._flush_chunk()
+
+    def count(self, roi_id: int) -> int:
+        """某ROI的累计记录数（包括已被覆盖的），用于判断曲线是否需要刷新"""
+        return self._counts.get(roi_id, 0)
+
+    def series(self, roi_id: int, key: str) -> Tuple[np.ndarray, np.ndarray]:
+        """某ROI某统计量在缓冲区内的 (相对t0的时间, 数值)，按时间先后排列"""
+        if roi_id not in self._values:
+            return np.empty(0), np.empty(0)
+        column = self.keys.index(key)
+        count = self._counts[roi_id]
+        times, values = self._times[roi_id], self._values[roi_id][:, column]
+        if count <= self.capacity:
+            return times[:count] - self.t0, values[:count].copy()
+        start = count % self.capacity
+        order = np.r_[start:self.capacity, 0:start]
+        return times[order] - self.t0, values[order]
+
+    def remove(self, roi_id: int) -> None:
+        """ROI被删除时释放其缓冲区"""
+        self._times.pop(roi_id, None)
+        self._values.pop(roi_id, None)
+        self._counts.pop(roi_id, None)
+
+    def clear(self) -> None:
+        """清空所有内存中的历史（不影响已写盘的记录）"""
+        self._times.clear()
+        self._values.clear()
+        self._counts.clear()
+        self.t0 = None
+
+    def start_recording(self, path: str) -> None:
+        """
+        之后的每条记录都按块追加写入 path。
+        文件不存在或为空时写入文件头；已有记录时要求统计量列一致，并丢弃被截断的最后一条后接着写。
+        """
+        self.stop_recording()
+        f = open(path, "a+b")
+        try:
+            f.seek(0)
+            if os.path.getsize(path) == 0:
+                f.write(_encode_header(self.keys))
+            else:
+                keys, offset = read_header(f)
+                if tuple(keys) != self.keys:
+                    raise ValueError(f"{path} 中的统计量列与当前不一致: {keys}")
+                width = 8 * (2 + len(keys))
+                f.truncate(offset + (os.path.getsize(path) - offset) // width * width)
+        except BaseException:
+            f.close()
+            raise
+        self._file = f
+        self._wall_offset = time.time() - time.perf_counter()
+        self.recording_path = path
+
+    def stop_recording(self) -> None:
+        """写出缓冲中剩余的记录并关闭文件"""
+        if self._file is None:
+            return
+        self._flush_chunk()
+        self._file.close()
+        self._file = None
+        self.recording_path = None
+
+    def _flush_chunk(self) -> None:
+        if self._chunk_len:
+            self._file.write(self._chunk[:self._chunk_len].astype('<f8', copy=False).tobytes())
+            self._file.flush()
+            self._chunk_len = 0
+
+
+def load_recording(path: str) -> Tuple[np.ndarray, np.ndarray, Dict[str, np.ndarray]]:
+    """
+    读回磁盘记录，返回 (Unix时间戳, ROI ID, {统计量: 数值数组})，统计量列按文件头；
+    文件很大时用内存映射，不整体读入
+    """
+    with open(path, "rb") as f:
+        keys, offset = read_header(f)
+    width = 2 + len(keys)
+    rows = (os.path.getsize(path) - offset) // (width * 8)  # 忽略被截断的最后一条
+    if rows == 0:
+        return np.empty(0), np.empty(0, dtype=np.int64), {key: np.empty(0) for key in keys}
+    records = np.memmap(path, dtype='<f8', mode='r', offset=offset, shape=(rows, width))
+    return records[:, 0], records[:, 1].astype(np.int64), {key: records[:, 2 + k] for k, key in enumerate(keys)}
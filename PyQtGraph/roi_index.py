@@ -0,0 +1,118 @@
+"""ROI外接矩形的空间索引
+GridIndex 把平面划分为边长 cell 的均匀网格，每个ROI的外接矩形登记到它覆盖的格子中。
+点、矩形和重叠查询只检查查询范围覆盖的格子，ROI移动时只更新新旧格子的差集，
+与ROI总数无关；ROI大小相近的检测布局（托盘、PCB）下网格比R树更简单且同样高效。
+"""
+from typing import Optional, Tuple, Dict, List, Set, Hashable, Iterator  # 类型提示
+
+Bounds = Tuple[float, float, float, float]  # 外接矩形 (x0, y0, x1, y1)，x0 <= x1, y0 <= y1
+Cell = Tuple[int, int]
+
+DEFAULT_CELL = 128.0  # 格子边长，取常见ROI尺寸的量级
+
+
+def normalize(x: float, y: float, w: float, h: float) -> Bounds:
+    """(x, y, w, h) 转为 (x0, y0, x1, y1)，宽高为负时（向左/上拖出的ROI）交换端点"""
+    x0, x1 = (x, x + w) if w >= 0 else (x + w, x)
+    y0, y1 = (y, y + h) if h >= 0 else (y + h, y)
+    return x0, y0, x1, y1
+
+
+def intersects(a: Bounds, b: Bounds) -> bool:
+    """两个闭矩形是否相交；只接触边界不算重叠"""
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+class GridIndex:
+    """
+    均匀网格空间索引，键是任意可哈希的ID (这里为ROI的unique_id)。
+    查询结果按键排序，便于比较和测试。
+    """
+
+    def __init__(self, cell: float = DEFAULT_CELL):
+        self.cell = float(cell)
+        self._bounds: Dict[Hashable, Bounds] = {}  # 键 -> 外接矩形
+        self._cells: Dict[Cell, Set[Hashable]] = {}  # 格子 -> 键集合
+
+    def __len__(self) -> int:
+        return len(self._bounds)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._bounds
+
+    def bounds(self, key: Hashable) -> Optional[Bounds]:
+        return self._bounds.get(key)
+
+    def _cell_range(self, bounds: Bounds) -> Tuple[int, int, int, int]:
+        """外接矩形覆盖的格子范围 (列0, 行0, 列1, 行1)，含两端"""
+        c = self.cell
+        return int(bounds[0] // c), int(bounds[1] // c), int(bounds[2] // c), int(bounds[3] // c)
+
+    @staticmethod
+    def _iter_cells(c0: int, r0: int, c1: int, r1: int) -> Iterator[Cell]:
+        for r in range(r0, r1 + 1):
+            for c in range(c0, c1 + 1):
+                yield c, r
+
+    def insert(self, key: Hashable, bounds: Bounds) -> None:
+        """登记或更新一个键的外接矩形，覆盖的格子不变时不做任何改动"""
+        old = self._bounds.get(key)
+        self._bounds[key] = bounds
+        new_range = self._cell_range(bounds)
+        if old is not None:
+            old_range = self._cell_range(old)
+            if old_range == new_range:
+                return
+            new_cells = set(self._iter_cells(*new_range))
+            for cell in self._iter_cells(*old_range):
+                if cell not in new_cells:
+                    self._discard(cell, key)
+        for cell in self._iter_cells(*new_range):
+            self._cells.setdefault(cell, set()).add(key)
+
+    def _discard(self, cell: Cell, key: Hashable) -> None:
+        keys = self._cells.get(cell)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._cells[cell]
+
+    def remove(self, key: Hashable) -> None:
+        bounds = self._bounds.pop(key, None)
+        if bounds is not None:
+            for cell in self._iter_cells(*self._cell_range(bounds)):
+                self._discard(cell, key)
+
+    def clear(self) -> None:
+        self._bounds.clear()
+        self._cells.clear()
+
+    def _candidates(self, bounds: Bounds) -> Set[Hashable]:
+        c0, r0, c1, r1 = self._cell_range(bounds)
+        if (c1 - c0 + 1) * (r1 - r0 + 1) > len(self._cells):
+            # 查询范围比已占用的格子还多（如框选整幅图），直接遍历已占用的格子
+            return set().union(*(keys for (c, r), keys in self._cells.items()
+                                 if c0 <= c <= c1 and r0 <= r <= r1))
+        found: Set[Hashable] = set()
+        for cell in self._iter_cells(c0, r0, c1, r1):
+            keys = self._cells.get(cell)
+            if keys:
+                found |= keys
+        return found
+
+    def query_point(self, x: float, y: float) -> List[Hashable]:
+        """外接矩形包含点 (x, y) 的键（含边界）"""
+        keys = self._cells.get((int(x // self.cell), int(y // self.cell)), ())
+        return sorted(k for k in keys if self._bounds[k][0] <= x <= self._bounds[k][2]
+                      and self._bounds[k][1] <= y <= self._bounds[k][3])
+
+    def query_rect(self, bounds: Bounds) -> List[Hashable]:
+        """外接矩形与 bounds 相交的键"""
+        return sorted(k for k in self._candidates(bounds) if intersects(self._bounds[k], bounds))
+
+    def overlapping(self, key: Hashable) -> List[Hashable]:
+        """与某个键的外接矩形相交的其他键"""
+        bounds = self._bounds.get(key)
+        if bounds is None:
+            return []
+        return [k for k in self.query_rect(bounds) if k != key]
@@ -0,0 +1,141 @@
+"""ROI组的模型调度
+setting.toml 中每个组带有 model_type/model_name。ModelDispatcher 把一个组内所有ROI的
+裁剪图缩放到统一尺寸后拼成一个 (N, H, W, C) 数组，每组每批只调用一次模型，
+而不是每个ROI调用一次。可以跨多帧攒批 (batch_size)，并用 max_latency 限制等待时间。
+模型是普通的可调用对象 model(batch) -> 长度为N的结果数组，通过 register_model 注册。
+"""
+import time
+import cv2  # OpenCV库，用于裁剪图缩放
+import numpy as np
+from typing import Optional, Tuple, Dict, Any, List, Callable  # 类型提示
+from roi_stats import shape_vertices, shape_bounds
+
+Model = Callable[[np.ndarray], np.ndarray]  # (N, H, W, C) uint8 -> (N, ...) 结果
+WILDCARD = "*"  # 注册时匹配任意 model_type 或 model_name
+DEFAULT_INPUT_SIZE = (64, 64)  # 送入模型的裁剪图尺寸 (宽, 高)
+
+_registry: Dict[Tuple[str, str], Model] = {}
+
+
+def register_model(model_type: str, model_name: str = WILDCARD):
+    """
+    注册模型的装饰器，例如:
+        @register_model("shitu", "my_model")
+        def my_model(batch): ...
+    """
+    def decorator(func: Model) -> Model:
+        _registry[(model_type, model_name)] = func
+        return func
+    return decorator
+
+
+def get_model(model_type: str, model_name: str) -> Optional[Model]:
+    """按 (类型, 名称) -> (类型, *) -> (*, 名称) 的顺序查找已注册的模型"""
+    for key in ((model_type, model_name), (model_type, WILDCARD), (WILDCARD, model_name)):
+        if key in _registry:
+            return _registry[key]
+    return None
+
+
+@register_model("dummy")
+@register_model(WILDCARD, "default_model")  # 配置文件中的默认模型名，无需真实模型即可跑通
+def dummy_model(batch: np.ndarray) -> np.ndarray:
+    """NumPy示例模型：返回每张裁剪图归一化到 [0, 1] 的平均亮度"""
+    return batch.reshape(len(batch), -1).mean(axis=1, dtype=np.float64) / 255.0
+
+
+def crop_batch(image: np.ndarray, rects: List[Tuple[int, int, int, int]],
+               size: Tuple[int, int] = DEFAULT_INPUT_SIZE, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    把 image[y, x] 中的矩形 (x, y, w, h) 裁剪并缩放为 (N, 高, 宽, C) 的uint8数组。
+    越界部分补零；out 形状匹配时直接写入，避免每帧重新分配。
+    """
+    width, height = size
+    channels = image.shape[2] if image.ndim == 3 else 1
+    shape = (len(rects), height, width, channels)
+    if out is None or out.shape != shape:
+        out = np.empty(shape, dtype=np.uint8)
+    for k, (x, y, w, h) in enumerate(rects):
+        r0, r1 = max(y, 0), min(y + h, image.shape[0])
+        c0, c1 = max(x, 0), min(x + w, image.shape[1])
+        if w <= 0 or h <= 0 or r1 <= r0 or c1 <= c0:
+            out[k] = 0
+            continue
+        crop = image[r0:r1, c0:c1]
+        if (r0, r1, c0, c1) != (y, y + h, x, x + w):
+            padded = np.zeros((h, w) + image.shape[2:], dtype=image.dtype)
+            padded[r0 - y:r1 - y, c0 - x:c1 - x] = crop
+            crop = padded
+        resized = cv2.resize(crop, (width, height), interpolation=cv2.INTER_AREA)
+        out[k] = resized.reshape(height, width, channels)
+    return out
+
+
+class ModelDispatcher:
+    """
+    按组批量调用模型。
+    groups: roi_config.load_groups 返回的组列表
+    batch_size: 每个组攒够多少帧调用一次模型 (1 表示每帧每组调用一次)
+    max_latency: 组内最早一帧等待超过此秒数时，不足batch_size也立即调用 (0 表示不限制)
+    submit()/flush() 返回已完成的结果 [(帧号, 组下标, 组内ROI下标, 输出), ...]
+    """
+
+    def __init__(self, groups: List[Dict[str, Any]], input_size: Tuple[int, int] = DEFAULT_INPUT_SIZE,
+                 batch_size: int = 1, max_latency: float = 0.0):
+        self.input_size = input_size
+        self.batch_size = max(1, batch_size)
+        self.max_latency = max_latency
+        self.calls = 0  # 模型调用次数
+        self._groups: List[Tuple[int, Model, List[Tuple[int, int, int, int]]]] = []
+        for g, group in enumerate(groups):
+            if not group["rois"]:
+                continue
+            model = get_model(group["model_type"], group["model_name"])
+            if model is None:
+                print(f"警告: 组 '{group['name']}' 的模型 {group['model_type']}/{group['model_name']} 未注册。跳过。")
+                continue
+            # 形状ROI取顶点的外接矩形作为裁剪范围
+            rects = [(int(x), int(y), int(w), int(h)) if spec is None else shape_bounds(shape_vertices(x, y, w, h, spec))
+                     for _, x, y, w, h, spec in group["rois"]]
+            self._groups.append((g, model, rects))
+        # 每个组等待调用的 [(帧号, 裁剪批)]，以及最早一帧的提交时间
+        self._pending: Dict[int, List[Tuple[int, np.ndarray]]] = {g: [] for g, _, _ in self._groups}
+        self._since: Dict[int, float] = {}
+
+    def submit(self, frame: int, image: np.ndarray) -> List[Tuple[int, int, int, Any]]:
+        """提交一帧 image[y, x]，返回本次触发调用的组的结果"""
+        now = time.perf_counter()
+        results = []
+        for g, model, rects in self._groups:
+            pending = self._pending[g]
+            if not pending:
+                self._since[g] = now
+            pending.append((frame, crop_batch(image, rects, self.input_size)))
+            expired = self.max_latency > 0 and now - self._since[g] >= self.max_latency
+            if len(pending) >= self.batch_size or expired:
+                results.extend(self._run(g, model))
+        return results
+
+    def flush(self) -> List[Tuple[int, int, int, Any]]:
+        """调用所有还有待处理帧的组，结束处理时使用"""
+        results = []
+        for g, model, _ in self._groups:
+            if self._pending[g]:
+                results.extend(self._run(g, model))
+        return results
+
+    def _run(self, g: int, model: Model) -> List[Tuple[int, int, int, Any]]:
+        pending = self._pending[g]
+        self._pending[g] = []
+        batch = pending[0][1] if len(pending) == 1 else np.concatenate([crops for _, crops in pending])
+        outputs = model(batch)
+        self.calls += 1
+        if len(outputs) != len(batch):
+            raise ValueError(f"模型输出数量 {len(outputs)} 与输入数量 {len(batch)} 不一致")
+        results = []
+        i = 0
+        for frame, crops in pending:
+            for k in range(len(crops)):
+                results.append((frame, g, k, outputs[i]))
+                i += 1
+        return results
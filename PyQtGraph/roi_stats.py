@@ -0,0 +1,500 @@
+"""ROI批量统计引擎
+整帧只做一次灰度转换，所有ROI共享积分图和块极值索引，一次性算出
+GrayMax/GrayMin/GrayMean/GrayRange；四个GLCM纹理特征由 texture_features_batch
+对一批灰度区域统计共生计数后一次批量得到，可以放到后台线程执行。
+旋转矩形、椭圆和多边形ROI统一转换为图像坐标下的多边形顶点，栅格化为布尔掩码后
+用 compute_masked 批量归约，纹理特征只统计两端都在掩码内的像素对。
+超过 INTEGRAL_MAX_PIXELS 的大图（通常是内存映射的静态图像）不建积分图，
+每个ROI直接在灰度缓冲区上归约，只读取ROI覆盖的部分。
+"""
+import cv2  # OpenCV库，用于灰度转换和分块极值
+import numpy as np
+from typing import Optional, Tuple, Dict, Any, List  # 类型提示
+
+GLCM_LEVELS = 32  # 灰度共生矩阵的量化级数，与RectROI.update_image_stats保持一致
+GRAY_KEYS = ('GrayMax', 'GrayMin', 'GrayMean', 'GrayRange')  # GUI线程上计算的廉价统计量
+TEXTURE_KEYS = ('Energy', 'Correlation', 'Homogeneity', 'Contrast')  # 后台计算的纹理特征
+STAT_KEYS = GRAY_KEYS + TEXTURE_KEYS
+
+Rect = Tuple[int, int, int, int]  # (x, y, w, h)，整数像素坐标
+EXTREMA_BLOCK = 16  # 极值块索引的块边长（像素）
+CHANGE_TILE = 32  # 帧间变化检测的块边长（像素）
+CHANGE_THRESHOLD = 0.0  # 块均值或极值变化超过此灰度值才认为该块变化，0为精确比较
+INTEGRAL_MAX_PIXELS = 16_000_000  # 超过此像素数的帧不建积分图（int64积分图每像素8字节）
+SHAPES = ('rect', 'ellipse', 'polygon')  # 掩码统计支持的ROI形状
+ELLIPSE_SEGMENTS = 64  # 椭圆近似为多边形时的边数
+Mask = Tuple[int, int, np.ndarray]  # (x0, y0, mask)，mask按 [x, y] 索引，与 crop() 的区域同向
+
+
+def to_gray(image: np.ndarray) -> np.ndarray:
+    """转换为uint8灰度图，与RectROI.update_image_stats中的逐ROI转换结果逐像素一致"""
+    if image.dtype != np.uint8:
+        image = image.astype(np.uint8)
+    if image.ndim == 3:
+        # cvtColor要求内存连续，方向校正后的视图在这里只拷贝一次
+        image = cv2.cvtColor(np.ascontiguousarray(image), cv2.COLOR_RGB2GRAY)
+    return image
+
+
+def glcm_props_batch(counts: np.ndarray) -> np.ndarray:
+    """
+    由一批非对称共生计数矩阵计算纹理特征。
+    counts: (N, L, L) 的计数数组
+    返回 (N, 4) 数组，列依次为 Energy, Correlation, Homogeneity, Contrast，
+    公式与 skimage graycomatrix(symmetric=True, normed=True) + graycoprops 相同。
+    """
+    levels = counts.shape[-1]
+    glcm = (counts + counts.transpose(0, 2, 1)).astype(np.float64)  # 对称化
+    sums = glcm.sum(axis=(1, 2), keepdims=True)
+    sums[sums == 0] = 1
+    glcm /= sums  # 归一化
+
+    i, j = np.ogrid[0:levels, 0:levels]
+    diff2 = ((i - j) ** 2).astype(np.float64)
+    contrast = (glcm * diff2).sum(axis=(1, 2))
+    homogeneity = (glcm / (1.0 + diff2)).sum(axis=(1, 2))
+    energy = np.sqrt((glcm ** 2).sum(axis=(1, 2)))
+
+    grid = np.arange(levels, dtype=np.float64)
+    mean_i = (glcm.sum(axis=2) * grid).sum(axis=1)  # 行方向均值
+    mean_j = (glcm.sum(axis=1) * grid).sum(axis=1)  # 列方向均值
+    diff_i = grid[None, :, None] - mean_i[:, None, None]
+    diff_j = grid[None, None, :] - mean_j[:, None, None]
+    std_i = np.sqrt((glcm * diff_i ** 2).sum(axis=(1, 2)))
+    std_j = np.sqrt((glcm * diff_j ** 2).sum(axis=(1, 2)))
+    cov = (glcm * diff_i * diff_j).sum(axis=(1, 2))
+    flat = (std_i < 1e-15) | (std_j < 1e-15)  # 无方差时skimage约定相关性为1
+    correlation = np.ones_like(cov)
+    correlation[~flat] = cov[~flat] / (std_i[~flat] * std_j[~flat])
+
+    return np.stack([energy, correlation, homogeneity, contrast], axis=1)
+
+
+def _pair_codes(quantized: np.ndarray, levels: int) -> np.ndarray:
+    """相邻像素对编码 q[:, c]*L + q[:, c+1]，对应 graycomatrix 的 distances=[1], angles=[0]"""
+    # L*L 不超过65536时用uint16，少一半内存带宽；一次写出乘积，再原地加上右邻像素
+    dtype = np.uint16 if levels * levels <= 1 << 16 else np.int64
+    codes = np.multiply(quantized[:, :-1], levels, dtype=dtype)
+    codes += quantized[:, 1:]
+    return codes
+
+
+def _pair_counts(quantized: np.ndarray, levels: int, valid: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    水平相邻像素对的共生计数 (L, L)，valid 为两端都参与统计的配对掩码 (与配对编码同形)。
+    uint16编码用 cv2.calcHist 统计：np.bincount 要先把编码转成intp再逐个随机写入，
+    大区域时比OpenCV的直方图慢数倍；calcHist输出float32，配对数不超过2^24时计数精确。
+    """
+    codes = _pair_codes(quantized, levels)
+    n_bins = levels * levels
+    if codes.dtype == np.uint16 and codes.size < 1 << 24:
+        mask = None if valid is None else valid.astype(np.uint8)
+        counts = cv2.calcHist([codes], [0], mask, [n_bins], [0, n_bins])
+    else:
+        counts = np.bincount((codes if valid is None else codes[valid]).ravel(), minlength=n_bins)
+    return counts.reshape(levels, levels).astype(np.int64)
+
+
+def glcm_features(quantized: np.ndarray, levels: int = GLCM_LEVELS) -> Dict[str, float]:
+    """
+    单个量化区域的纹理特征，专用的水平相邻GLCM内核。
+    等价于 graycomatrix(quantized, [1], [0], levels, symmetric=True, normed=True)
+    再分别调用四次 graycoprops，但只统计一次共生计数和一次归一化。
+    """
+    features = glcm_props_batch(_pair_counts(quantized, levels)[None])[0]
+    return dict(zip(TEXTURE_KEYS, (float(v) for v in features)))
+
+
+def texture_features_batch(regions: Dict[int, np.ndarray],
+                           levels: int = GLCM_LEVELS) -> Dict[int, Dict[str, float]]:
+    """
+    批量计算GLCM纹理特征。
+    regions: {roi_id: uint8灰度区域}，与 getArrayRegion 的结果同向，沿第二个轴配对 (angles=[0])。
+    区域为 np.ma.MaskedArray 时只统计两端都未被遮盖的像素对（形状ROI）。
+    尺寸不足、无方差或量化后只有一个灰度级的区域，特征按原逻辑记为0。
+    各区域的共生计数分别统计后，特征一次批量计算。
+    """
+    results = {roi_id: {k: 0.0 for k in TEXTURE_KEYS} for roi_id in regions}
+    step = 256 // levels
+    ids: List[int] = []
+    counts: List[np.ndarray] = []
+    for roi_id, region in regions.items():
+        if region.shape[0] < 2 or region.shape[1] < 2:
+            continue
+        valid = None
+        if isinstance(region, np.ma.MaskedArray):
+            valid = ~np.ma.getmaskarray(region)
+            region = region.data
+            values = region[valid]
+            if values.size < 2:
+                continue
+            hi, lo = int(values.max()), int(values.min())
+        else:
+            hi, lo = int(region.max()), int(region.min())
+        if hi == lo or hi // step == lo // step:
+            continue
+        pairs = None if valid is None else valid[:, :-1] & valid[:, 1:]
+        counts.append(_pair_counts(region // step, levels, pairs))
+        ids.append(roi_id)
+    if ids:
+        features = glcm_props_batch(np.stack(counts))
+        for roi_id, row in zip(ids, features):
+            results[roi_id] = dict(zip(TEXTURE_KEYS, (float(v) for v in row)))
+    return results
+
+
+def shape_vertices(x: float, y: float, w: float, h: float, spec: Dict[str, Any]) -> np.ndarray:
+    """
+    形状ROI在图像坐标 (x向右, y向下) 下的多边形顶点 (N, 2)。
+    rect/ellipse: (x, y) 为ROI原点，(w, h) 为尺寸，绕原点旋转 spec["angle"] 度，与pyqtgraph ROI一致；
+    polygon: spec["points"] 为图像坐标下的顶点，忽略 x/y/w/h。
+    """
+    shape = spec["shape"]
+    if shape == 'polygon':
+        return np.asarray(spec["points"], dtype=np.float64).reshape(-1, 2)
+    if shape == 'ellipse':
+        t = np.linspace(0, 2 * np.pi, ELLIPSE_SEGMENTS, endpoint=False)
+        local = np.stack([w / 2 * (1 + np.cos(t)), h / 2 * (1 + np.sin(t))], axis=1)
+    else:
+        local = np.array([[0, 0], [w, 0], [w, h], [0, h]], dtype=np.float64)
+    angle = np.deg2rad(spec.get("angle", 0.0))
+    c, s = np.cos(angle), np.sin(angle)
+    rotated = local @ np.array([[c, s], [-s, c]])  # QTransform.rotate: x' = x*c - y*s, y' = x*s + y*c
+    return rotated + (x, y)
+
+
+def shape_bounds(vertices: np.ndarray) -> Rect:
+    """顶点的外接整数矩形 (x, y, w, h)"""
+    x0, y0 = np.floor(vertices.min(axis=0)).astype(int)
+    x1, y1 = np.ceil(vertices.max(axis=0)).astype(int)
+    return int(x0), int(y0), int(x1 - x0), int(y1 - y0)
+
+
+def polygon_mask(vertices: np.ndarray, width: int, height: int) -> Optional[Mask]:
+    """
+    把图像坐标下的多边形栅格化为布尔掩码，只覆盖多边形外接框与图像的交集。
+    像素 (x, y) 的中心为 (x + 0.5, y + 0.5)，中心落在多边形内即计入 (奇偶规则，左闭右开)，
+    轴对齐的整数矩形因此与 crop() 的区域完全一致。
+    按扫描线向量化：每行中心与所有边求交，交点两两配对后用差分数组填充。
+    多边形完全在图像外或退化时返回None。
+    """
+    x0, y0, w, h = shape_bounds(vertices)
+    x1, y1 = min(x0 + w, width), min(y0 + h, height)
+    x0, y0 = max(x0, 0), max(y0, 0)
+    if x1 <= x0 or y1 <= y0:
+        return None
+    xa, ya = vertices[:, 0], vertices[:, 1]
+    xb, yb = np.roll(xa, -1), np.roll(ya, -1)
+    centers = y0 + 0.5 + np.arange(y1 - y0)[:, None]  # (行, 1)
+    crosses = (ya <= centers) != (yb <= centers)  # (行, 边)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        xs = xa + (centers - ya) * (xb - xa) / (yb - ya)
+    xs = np.sort(np.where(crosses, xs, np.inf), axis=1)
+    n = crosses.sum(axis=1).max() // 2 * 2
+    if n == 0:
+        return None
+    # 交点两两配对为 [左, 右)，像素中心在区间内的列从 ceil(左-0.5) 到 ceil(右-0.5)
+    left = np.clip(np.ceil(xs[:, 0:n:2] - 0.5) - x0, 0, x1 - x0).astype(np.int64)
+    right = np.clip(np.ceil(xs[:, 1:n:2] - 0.5) - x0, 0, x1 - x0).astype(np.int64)
+    valid = np.isfinite(xs[:, 1:n:2]) & (right > left)
+    rows = np.broadcast_to(np.arange(y1 - y0)[:, None], left.shape)
+    diff = np.zeros((y1 - y0, x1 - x0 + 1), dtype=np.int32)
+    np.add.at(diff, (rows[valid], left[valid]), 1)
+    np.add.at(diff, (rows[valid], right[valid]), -1)
+    mask = np.cumsum(diff[:, :-1], axis=1).T > 0  # 转为 [x, y]
+    if not mask.any():
+        return None
+    return x0, y0, mask
+
+
+def _sparse_table(blocks: np.ndarray, reduce) -> List[List[np.ndarray]]:
+    """
+    二维稀疏表：table[a][b][i, j] 是从块(i, j)起 2^a x 2^b 个块的极值，
+    任意块矩形的极值由四个互相重叠的表项合并得到，查询O(1)。
+    """
+    table: List[List[np.ndarray]] = []
+    row = [blocks]
+    for b in range(1, int(blocks.shape[1]).bit_length()):
+        half = 1 << (b - 1)
+        prev = row[-1]
+        row.append(reduce(prev[:, :-half], prev[:, half:]))
+    table.append(row)
+    for a in range(1, int(blocks.shape[0]).bit_length()):
+        half = 1 << (a - 1)
+        table.append([reduce(prev[:-half], prev[half:]) for prev in table[-1]])
+    return table
+
+
+def _query_sparse_table(table: List[List[np.ndarray]], reduce,
+                        bx0: int, by0: int, bx1: int, by1: int) -> int:
+    """查询块范围 [bx0, bx1) x [by0, by1) 的极值"""
+    a = (bx1 - bx0).bit_length() - 1
+    b = (by1 - by0).bit_length() - 1
+    t = table[a][b]
+    xs, ys = bx1 - (1 << a), by1 - (1 << b)
+    return reduce(reduce(t[bx0, by0], t[xs, by0]), reduce(t[bx0, ys], t[xs, ys]))
+
+
+class BatchRoiStats:
+    """
+    整帧共享的ROI统计引擎。
+    set_frame() 每帧调用一次：灰度转换和积分图都只算一次；
+    compute() 对所有整数对齐的矩形ROI一次性算出灰度统计量，按ROI ID返回；
+    crop() 返回灰度视图，交给 texture_features_batch 计算纹理特征。
+    拖动时对同一帧的单个ROI调用 compute() 也很便宜：均值来自缓存的积分图，
+    最大/最小值来自按块构建的稀疏表，只有不足一个块的边缘条带才直接扫描。
+    axis_order 与 pg.ImageItem 的 axisOrder 一致：
+    'col-major' 时图像按 image[x, y] 索引，'row-major' 时直接使用相机/OpenCV的原始
+    image[y, x] 连续缓冲区，ROI坐标在内部换算成数组下标，不再做整帧转置。
+    uint8单通道的帧（包括内存映射）直接作为灰度图使用，不拷贝；
+    超过 INTEGRAL_MAX_PIXELS 时进入直接模式 (direct)，不建积分图和稀疏表。
+    """
+
+    def __init__(self, block: int = EXTREMA_BLOCK, axis_order: str = 'col-major'):
+        self.block = block
+        self.axis_order = axis_order
+        self.image: Optional[np.ndarray] = None  # 当前帧原始数据，用于判断缓存是否对应同一帧
+        self.gray: Optional[np.ndarray] = None  # 当前帧灰度图
+        self._integral: Optional[np.ndarray] = None  # 灰度积分图，比灰度图每个轴多1
+        self._max_table: Optional[List[List[np.ndarray]]] = None  # 块最大值稀疏表，首次查询时构建
+        self._min_table: Optional[List[List[np.ndarray]]] = None  # 块最小值稀疏表
+
+    def set_frame(self, image: np.ndarray) -> None:
+        """载入新帧并预计算所有ROI共享的中间结果"""
+        gray = to_gray(image)
+        self.image = image
+        self.gray = gray
+        self._max_table = self._min_table = None
+        if self.direct:
+            self._integral = None
+            return
+        integral = np.zeros((gray.shape[0] + 1, gray.shape[1] + 1), dtype=np.int64)
+        integral[1:, 1:] = gray.cumsum(axis=0, dtype=np.int64).cumsum(axis=1)
+        self._integral = integral
+
+    @property
+    def direct(self) -> bool:
+        """大图直接模式：逐ROI在灰度缓冲区上归约"""
+        return self.gray is not None and self.gray.size > INTEGRAL_MAX_PIXELS
+
+    def array_box(self, rect: Rect) -> Tuple[int, int, int, int]:
+        """把ROI矩形 (x, y, w, h) 换算成数组下标范围 (r0, c0, r1, c1)"""
+        x, y, w, h = rect
+        if self.axis_order == 'row-major':
+            return y, x, y + h, x + w
+        return x, y, x + w, y + h
+
+    def contains(self, rect: Rect) -> bool:
+        """矩形是否完整位于当前帧内（部分越界的ROI交给getArrayRegion处理补零）"""
+        if self.gray is None:
+            return False
+        r0, c0, r1, c1 = self.array_box(rect)
+        return r0 >= 0 and c0 >= 0 and r1 > r0 and c1 > c0 and \
+            r1 <= self.gray.shape[0] and c1 <= self.gray.shape[1]
+
+    def crop(self, rect: Rect) -> np.ndarray:
+        """
+        矩形区域的灰度视图，方向与 getArrayRegion 的结果一致 (x, y)。
+        不拷贝；帧数据每帧重新分配，后台线程可安全读取。
+        """
+        r0, c0, r1, c1 = self.array_box(rect)
+        region = self.gray[r0:r1, c0:c1]
+        return region.T if self.axis_order == 'row-major' else region
+
+    def size(self) -> Tuple[int, int]:
+        """当前帧的 (宽, 高)"""
+        if self.axis_order == 'row-major':
+            return self.gray.shape[1], self.gray.shape[0]
+        return self.gray.shape[0], self.gray.shape[1]
+
+    def masked_crop(self, mask: Mask) -> np.ma.MaskedArray:
+        """掩码外接框的灰度视图，掩码外的像素被遮盖，可直接交给 texture_features_batch"""
+        x0, y0, m = mask
+        region = self.crop((x0, y0, m.shape[0], m.shape[1]))
+        return np.ma.MaskedArray(region, mask=~m)
+
+    def compute_masked(self, masks: Dict[int, Mask]) -> Dict[int, Dict[str, float]]:
+        """
+        批量计算形状ROI的灰度统计量。
+        masks: {roi_id: (x0, y0, mask)}，由 polygon_mask 得到且位于当前帧内。
+        所有掩码内的像素拼接后用 reduceat 一次求出各ROI的和、最大值、最小值。
+        """
+        ids = list(masks)
+        if not ids:
+            return {}
+        values = [self.crop((x0, y0, m.shape[0], m.shape[1]))[m] for x0, y0, m in masks.values()]
+        counts = np.array([v.size for v in values])
+        starts = np.r_[0, np.cumsum(counts)[:-1]]
+        pixels = np.concatenate(values)
+        sums = np.add.reduceat(pixels, starts, dtype=np.int64)
+        maxs = np.maximum.reduceat(pixels, starts).astype(np.int64)
+        mins = np.minimum.reduceat(pixels, starts).astype(np.int64)
+        results: Dict[int, Dict[str, float]] = {}
+        for k, roi_id in enumerate(ids):
+            results[roi_id] = {
+                'GrayMax': maxs[k],
+                'GrayMin': mins[k],
+                'GrayMean': sums[k] / counts[k],
+                'GrayRange': maxs[k] - mins[k]
+            }
+        return results
+
+    def _build_extrema_index(self) -> None:
+        """按块求最大/最小值并构建稀疏表，每帧最多一次"""
+        B = self.block
+        nx, ny = self.gray.shape[0] // B, self.gray.shape[1] // B
+        if nx == 0 or ny == 0:
+            self._max_table = self._min_table = []
+            return
+        core = self.gray[:nx * B, :ny * B].reshape(nx, B, ny, B)
+        self._max_table = _sparse_table(core.max(axis=(1, 3)), np.maximum)
+        self._min_table = _sparse_table(core.min(axis=(1, 3)), np.minimum)
+
+    def tile_means(self, tile: int) -> np.ndarray:
+        """按 tile x tile 分块的灰度均值（由积分图得到，边缘不足一块的按实际面积）"""
+        rows = np.r_[0:self.gray.shape[0]:tile, self.gray.shape[0]]
+        cols = np.r_[0:self.gray.shape[1]:tile, self.gray.shape[1]]
+        corners = self._integral[np.ix_(rows, cols)]
+        sums = np.diff(np.diff(corners, axis=0), axis=1)
+        return sums / np.outer(np.diff(rows), np.diff(cols))
+
+    def tile_extrema(self, tile: int) -> Tuple[np.ndarray, np.ndarray]:
+        """按 tile x tile 分块的灰度 (最大值, 最小值)，分块与 tile_means 一致；可分离的膨胀/腐蚀后按块起点取样"""
+        gray = np.ascontiguousarray(self.gray)  # 列优先模式下灰度图可能是转置视图
+        along_cols, along_rows = np.ones((1, tile), np.uint8), np.ones((tile, 1), np.uint8)
+        result = []
+        for morph in (cv2.dilate, cv2.erode):
+            strips = np.ascontiguousarray(morph(gray, along_cols, anchor=(0, 0))[:, ::tile])
+            result.append(morph(strips, along_rows, anchor=(0, 0))[::tile].astype(np.float64))
+        return result[0], result[1]
+
+    def range_extrema(self, x0: int, y0: int, x1: int, y1: int) -> Tuple[int, int]:
+        """数组下标矩形 [x0, x1) x [y0, y1) 内的 (最大值, 最小值)"""
+        x0, y0, x1, y1 = int(x0), int(y0), int(x1), int(y1)
+        if self._max_table is None:
+            self._build_extrema_index()
+        B = self.block
+        bx0, by0 = -(-x0 // B), -(-y0 // B)  # 完整块的范围
+        bx1, by1 = x1 // B, y1 // B
+        if bx1 <= bx0 or by1 <= by0 or not self._max_table:
+            block = self.gray[x0:x1, y0:y1]
+            return int(block.max()), int(block.min())
+
+        hi = int(_query_sparse_table(self._max_table, np.maximum, bx0, by0, bx1, by1))
+        lo = int(_query_sparse_table(self._min_table, np.minimum, bx0, by0, bx1, by1))
+        # 四条不足一个块宽的边缘条带直接扫描
+        strips = (self.gray[x0:bx0 * B, y0:y1], self.gray[bx1 * B:x1, y0:y1],
+                  self.gray[bx0 * B:bx1 * B, y0:by0 * B], self.gray[bx0 * B:bx1 * B, by1 * B:y1])
+        for strip in strips:
+            if strip.size:
+                hi = max(hi, int(strip.max()))
+                lo = min(lo, int(strip.min()))
+        return hi, lo
+
+    def compute(self, rects: Dict[int, Rect]) -> Dict[int, Dict[str, float]]:
+        """
+        批量计算ROI灰度统计量。
+        rects: {roi_id: (x, y, w, h)}，只处理完整位于帧内的矩形，其余ID不出现在结果中。
+        """
+        ids = [roi_id for roi_id, rect in rects.items() if self.contains(rect)]
+        if not ids:
+            return {}
+        if self.direct:
+            return self._compute_direct({roi_id: rects[roi_id] for roi_id in ids})
+        boxes = np.array([self.array_box(rects[roi_id]) for roi_id in ids], dtype=np.int64)
+        x0, y0, x1, y1 = boxes.T
+
+        # 积分图：所有ROI的均值一次向量化求出
+        ii = self._integral
+        sums = ii[x1, y1] - ii[x0, y1] - ii[x1, y0] + ii[x0, y0]
+        means = sums / ((x1 - x0) * (y1 - y0))
+
+        maxs = np.empty(len(ids), dtype=np.int64)
+        mins = np.empty(len(ids), dtype=np.int64)
+        for k in range(len(ids)):
+            maxs[k], mins[k] = self.range_extrema(x0[k], y0[k], x1[k], y1[k])
+
+        results: Dict[int, Dict[str, float]] = {}
+        for k, roi_id in enumerate(ids):
+            results[roi_id] = {
+                'GrayMax': maxs[k],
+                'GrayMin': mins[k],
+                'GrayMean': means[k],
+                'GrayRange': maxs[k] - mins[k]
+            }
+        return results
+
+    def _compute_direct(self, rects: Dict[int, Rect]) -> Dict[int, Dict[str, float]]:
+        """直接模式：逐ROI切片归约，内存映射时只有ROI覆盖的页被读入"""
+        results: Dict[int, Dict[str, float]] = {}
+        for roi_id, rect in rects.items():
+            r0, c0, r1, c1 = self.array_box(rect)
+            region = self.gray[r0:r1, c0:c1]
+            hi, lo = int(region.max()), int(region.min())
+            results[roi_id] = {
+                'GrayMax': hi,
+                'GrayMin': lo,
+                'GrayMean': int(region.sum(dtype=np.int64)) / region.size,
+                'GrayRange': hi - lo
+            }
+        return results
+
+
+class TileChangeTracker:
+    """
+    帧间变化检测：比较每个块的灰度均值、最大值和最小值与参考值，任一超过阈值的块记为变化并更新参考值。
+    参考值只在块被判定变化时更新，缓慢漂移累积超过阈值后同样会被检测到。
+    is_dirty() 借助变化掩码的前缀和，O(1) 判断一个矩形是否覆盖了变化块。
+    阈值为0（默认）时灰度统计量不会沿用过期结果，单个像素的尖峰也会使所在块变化；
+    大于0时容忍传感器噪声，但小于阈值的变化会被漏掉，只应在明确需要时使用。
+    块均值和极值都不变、只是内部像素重新排列的变化检测不到（纹理特征可能过期）。
+    直接模式的帧没有积分图，所有块都视为变化。
+    """
+
+    def __init__(self, tile: int = CHANGE_TILE, threshold: float = CHANGE_THRESHOLD):
+        self.tile = tile
+        self.threshold = threshold
+        self.engine: Optional[BatchRoiStats] = None  # 最近一次update的帧
+        self._reference: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None  # 各块的参考 (均值, 最大值, 最小值)
+        self._changed_prefix: Optional[np.ndarray] = None  # 变化掩码的二维前缀和
+
+    def reset(self) -> None:
+        """清除参考帧，下一帧所有块都视为变化"""
+        self.engine = None
+        self._reference = None
+
+    def update(self, engine: BatchRoiStats) -> None:
+        """用新帧更新变化掩码，同一帧重复调用无副作用"""
+        if engine is self.engine:
+            return
+        if engine.direct:
+            rows, cols = (-(-n // self.tile) for n in engine.gray.shape)
+            self._reference = None
+            prefix = np.zeros((rows + 1, cols + 1), dtype=np.int64)
+            prefix[1:, 1:] = np.arange(1, rows + 1)[:, None] * np.arange(1, cols + 1)
+            self._changed_prefix = prefix
+            self.engine = engine
+            return
+        current = (engine.tile_means(self.tile),) + engine.tile_extrema(self.tile)
+        means = current[0]
+        if self._reference is None or self._reference[0].shape != means.shape:
+            changed = np.ones(means.shape, dtype=bool)
+            self._reference = current
+        else:
+            changed = np.zeros(means.shape, dtype=bool)
+            for cur, ref in zip(current, self._reference):
+                changed |= np.abs(cur - ref) > self.threshold
+            for cur, ref in zip(current, self._reference):
+                ref[changed] = cur[changed]
+        prefix = np.zeros((means.shape[0] + 1, means.shape[1] + 1), dtype=np.int64)
+        prefix[1:, 1:] = changed.cumsum(axis=0).cumsum(axis=1)
+        self._changed_prefix = prefix
+        self.engine = engine
+
+    def is_dirty(self, rect: Rect) -> bool:
+        """矩形覆盖的块中是否有变化块"""
+        r0, c0, r1, c1 = self.engine.array_box(rect)
+        t0, u0 = r0 // self.tile, c0 // self.tile
+        t1, u1 = -(-r1 // self.tile), -(-c1 // self.tile)
+        p = self._changed_prefix
+        return bool(p[t1, u1] - p[t0, u1] - p[t1, u0] + p[t0, u0])
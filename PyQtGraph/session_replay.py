@@ -0,0 +1,236 @@
+"""
+摄像头会话的录制与回放。
+录制：MainWindow 把每个摄像头显示的帧和ROI操作事件 (添加/阵列/移动/缩放/选中/删除) 按时间顺序
+写入一个 .roirec 文件，帧用zlib压缩，事件为JSON。
+回放：在无界面环境 (QT_QPA_PLATFORM=offscreen) 中创建 MainWindow，按文件顺序重放事件和帧，
+帧走与摄像头模式相同的统计和显示路径，记录每条记录的处理延迟，可作为 ROIManager/ROI 改动的回归基准。
+用法: python session_replay.py 会话.roirec [-o latency.csv] [--profile stages.csv] [--realtime]
+"""
+import argparse
+import csv
+import json
+import os
+import runpy
+import struct
+import sys
+import time
+import zlib
+import numpy as np
+from typing import Optional, Tuple, Dict, Any, List, Iterator  # 类型提示
+from roi_stats import BatchRoiStats
+
+MAGIC = b"ROIREC1\n"
+FRAME, EVENT = 0, 1  # 记录类型
+_RECORD = struct.Struct("<BdI")  # 类型, 相对录制开始的时间戳(秒), 负载字节数
+_FRAME_HEADER = struct.Struct("<III")  # 高, 宽, 通道数 (单通道为0)
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main-动态加载ui.py")
+
+
+class SessionWriter:
+    """
+    会话文件写入器。时间戳统一用 time.perf_counter，写入时换算为相对录制开始的秒数。
+    level: 帧的zlib压缩级别，1 在GUI线程中开销最小
+    """
+
+    def __init__(self, path: str, axis_order: str = 'row-major', level: int = 1):
+        self.path = path
+        self.level = level
+        self.t0 = time.perf_counter()
+        self.frames = 0
+        self._file = open(path, "wb")
+        self._file.write(MAGIC)
+        self.write_event("header", axis_order=axis_order)
+
+    def _write(self, kind: int, timestamp: float, payload: bytes) -> None:
+        self._file.write(_RECORD.pack(kind, timestamp - self.t0, len(payload)))
+        self._file.write(payload)
+
+    def write_event(self, event: str, /, **data) -> None:
+        """写入一个ROI事件，data 需可JSON序列化"""
+        data["event"] = event
+        self._write(EVENT, time.perf_counter(), json.dumps(data, ensure_ascii=False).encode("utf-8"))
+
+    def write_frame(self, timestamp: float, image: np.ndarray) -> None:
+        """写入一帧uint8图像 (与ImageViewer的axis_order一致)"""
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        channels = image.shape[2] if image.ndim == 3 else 0
+        header = _FRAME_HEADER.pack(image.shape[0], image.shape[1], channels)
+        self._write(FRAME, timestamp, header + zlib.compress(image.data, self.level))
+        self.frames += 1
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self._file.close()
+
+
+def read_session(path: str) -> Iterator[Tuple[str, float, Any]]:
+    """按顺序读出 ("frame", 时间戳, 图像) 或 ("event", 时间戳, 事件字典)，截断的最后一条被忽略"""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"不是会话录制文件: {path}")
+        while True:
+            head = f.read(_RECORD.size)
+            if len(head) < _RECORD.size:
+                return
+            kind, timestamp, size = _RECORD.unpack(head)
+            payload = f.read(size)
+            if len(payload) < size:
+                return
+            if kind == FRAME:
+                h, w, c = _FRAME_HEADER.unpack_from(payload)
+                data = np.frombuffer(zlib.decompress(payload[_FRAME_HEADER.size:]), dtype=np.uint8)
+                yield "frame", timestamp, data.reshape((h, w, c) if c else (h, w))
+            else:
+                yield "event", timestamp, json.loads(payload.decode("utf-8"))
+
+
+class SessionPlayer:
+    """
+    把会话重放到 MainWindow 的当前摄像头。
+    录制时的ROI ID映射到回放时新建的ROI；帧按摄像头模式的路径处理：
+    先做与采集线程相同的批量统计，再交给 MainWindow._show_frame 显示，最后处理事件循环 (含重绘)。
+    """
+
+    def __init__(self, window, app):
+        self.window = window
+        self.app = app
+        self.view = window.current_camera
+        self.manager = self.view.roi_manager
+        self._ids: Dict[int, int] = {}  # 录制时的ROI ID -> 回放时的ROI ID
+
+    def _roi(self, recorded_id: Optional[int]):
+        return self.manager.rois.get(self._ids.get(recorded_id))
+
+    def _track_new(self, before: set, recorded_ids: List[int]) -> None:
+        """把新建的ROI按创建顺序与录制时的ID对应起来"""
+        created = [roi_id for roi_id in self.manager.rois if roi_id not in before]
+        self._ids.update(zip(recorded_ids, created))
+
+    def apply_event(self, event: Dict[str, Any]) -> None:
+        mgr = self.manager
+        name = event["event"]
+        if name == "header":
+            if event["axis_order"] != self.view.image_viewer.axis_order:
+                raise ValueError(f"录制时的axis_order为 {event['axis_order']}，与当前显示不一致")
+        elif name in ("snapshot", "groups"):
+            groups = [dict(group, rois=[tuple(roi) for roi in group["rois"]]) for group in event["groups"]]
+            before = set(mgr.rois)
+            mgr.add_groups_bulk(groups)
+            self._track_new(before, event["ids"])
+            if name == "snapshot":
+                for recorded_id, state in zip(event["ids"], event["states"]):
+                    self._roi(recorded_id).setState(state)
+                self.apply_event({"event": "select", "id": event.get("selected")})
+        elif name == "group":
+            mgr.add_group(event["name"], event["model_type"], event["model_name"])
+        elif name == "add":
+            mgr.set_active_group_item(mgr.tree_model.item(event["group"], 0))
+            before = set(mgr.rois)
+            roi = mgr.add_roi(*event["rect"], name=event["name"], spec=event["spec"])
+            self._track_new(before, [event["id"]])
+            roi.setState(event["state"])
+        elif name == "grid":
+            before = set(mgr.rois)
+            mgr.add_roi_grid(self._roi(event["seed"]), event["rows"], event["cols"], tuple(event["pitch"]),
+                             mgr.tree_model.item(event["group"], 0))
+            self._track_new(before, event["ids"])
+        elif name == "geometry":
+            roi = self._roi(event["id"])
+            if roi is not None:
+                roi.setState(event["state"])  # 触发sigRegionChanged，与拖动时的处理路径相同
+        elif name == "select":
+            roi = self._roi(event["id"])
+            if roi is None:
+                mgr._update_selection(None)
+            else:
+                mgr._on_roi_clicked(roi)
+        elif name == "remove":
+            roi = self._roi(event["id"])
+            if roi is not None:
+                mgr.remove_roi_obj(roi)
+        elif name == "remove_group":
+            mgr.remove_group(mgr.tree_model.item(event["group"], 0))
+        elif name == "clear":
+            mgr.clear_all_items()
+            self._ids.clear()
+
+    def show_frame(self, image: np.ndarray, captured_at: float) -> None:
+        engine = BatchRoiStats(axis_order=self.view.image_viewer.axis_order)
+        with self.view.profiler.measure("capture.stats"):
+            engine.set_frame(image)
+            rects = self.manager.roi_rects()
+            results = engine.compute(rects)
+        self.window._show_frame(self.view, (engine, rects, results, captured_at))
+
+    def run(self, path: str, realtime: bool = False) -> List[Tuple[str, float, float]]:
+        """重放整个文件，返回每条记录的 (类型, 录制时间戳, 处理延迟秒)"""
+        rows = []
+        started = time.perf_counter()
+        for kind, timestamp, payload in read_session(path):
+            if realtime:
+                delay = started + timestamp - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            start = time.perf_counter()
+            if kind == "frame":
+                self.show_frame(payload, start)
+                label = "frame"
+            else:
+                self.apply_event(payload)
+                label = payload["event"]
+            self.app.processEvents()  # 重绘和合并刷新的定时器都计入延迟
+            rows.append((label, timestamp, time.perf_counter() - start))
+        return rows
+
+
+def summarize(rows: List[Tuple[str, float, float]]) -> List[Tuple[str, int, float, float, float, float]]:
+    """按记录类型汇总延迟 [(类型, 次数, p50, p90, p99, 最大)]，单位毫秒"""
+    summary = []
+    for label in sorted({label for label, _, _ in rows}):
+        latencies = np.array([lat for l, _, lat in rows if l == label]) * 1000.0
+        p50, p90, p99 = np.percentile(latencies, (50, 90, 99))
+        summary.append((label, latencies.size, p50, p90, p99, latencies.max()))
+    return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="回放ROI会话录制并测量每帧延迟")
+    parser.add_argument("session", help="录制的会话文件 (.roirec)")
+    parser.add_argument("-o", "--output", default=None, help="逐条记录的延迟CSV")
+    parser.add_argument("--profile", default=None, help="各阶段耗时汇总CSV (与DumpProfile的汇总格式相同)")
+    parser.add_argument("--realtime", action="store_true", help="按录制时的时间间隔回放，默认尽快回放")
+    parser.add_argument("--show", action="store_true", help="显示窗口，默认使用offscreen平台")
+    args = parser.parse_args()
+
+    if not args.show:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    session, output, profile = (os.path.abspath(p) if p else None for p in (args.session, args.output, args.profile))
+    script_dir = os.path.dirname(MAIN_SCRIPT)
+    os.chdir(script_dir)  # 与主程序一致，form.ui 按相对路径加载
+    sys.path.insert(0, script_dir)
+
+    from PyQt5 import QtWidgets
+    import stage_profiler
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv)
+    window = runpy.run_path(MAIN_SCRIPT, run_name="roi_inspector")["MainWindow"]()
+    window.show()
+    player = SessionPlayer(window, app)
+    player.view.profiler.enabled = True
+
+    rows = player.run(session, args.realtime)
+    if output:
+        with open(output, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(("index", "kind", "recorded_s", "latency_ms"))
+            for k, (label, timestamp, latency) in enumerate(rows):
+                writer.writerow((k, label, f"{timestamp:.6f}", f"{latency * 1000.0:.4f}"))
+    if profile:
+        stage_profiler.dump_summary_csv(profile, {player.view.name: player.view.profiler})
+    print(f"{'类型':<12}{'次数':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'最大 ms':>10}")
+    for label, count, p50, p90, p99, peak in summarize(rows):
+        print(f"{label:<12}{count:>8}{p50:>10.2f}{p90:>10.2f}{p99:>10.2f}{peak:>10.2f}")
+    window.close()
+
+
+if __name__ == "__main__":
+    main()
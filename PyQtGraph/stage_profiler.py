@@ -0,0 +1,124 @@
+"""分阶段耗时统计
+每个阶段 (读帧、颜色转换、setImage、ROI统计、属性表刷新等) 的耗时写入固定长度的环形缓冲区，
+随时可以取最近若干次的分位数和帧率；原始样本可导出为CSV离线分析。
+记录只是两次 perf_counter 加一次数组赋值，关闭时 measure() 直接返回。
+"""
+import csv
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+from typing import Optional, Tuple, Dict, List, Iterator  # 类型提示
+
+RING_SIZE = 1024  # 每个阶段保留的最近样本数
+PERCENTILES = (50, 90, 99)
+
+
+class StageProfiler:
+    """
+    分阶段耗时的环形缓冲区。
+    采集线程和GUI线程都可以调用 record()/measure()，内部加锁。
+    """
+
+    def __init__(self, capacity: int = RING_SIZE, enabled: bool = False):
+        self.capacity = capacity
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._rings: Dict[str, np.ndarray] = {}  # 阶段名 -> (capacity, 2) [结束时间戳, 耗时秒]
+        self._counts: Dict[str, int] = {}  # 阶段名 -> 累计样本数，取模即写入位置
+
+    def record(self, stage: str, seconds: float, timestamp: Optional[float] = None) -> None:
+        """记录一次阶段耗时，timestamp 默认为当前时间"""
+        if not self.enabled:
+            return
+        if timestamp is None:
+            timestamp = time.perf_counter()
+        with self._lock:
+            ring = self._rings.get(stage)
+            if ring is None:
+                ring = self._rings[stage] = np.zeros((self.capacity, 2), dtype=np.float64)
+                self._counts[stage] = 0
+            ring[self._counts[stage] % self.capacity] = (timestamp, seconds)
+            self._counts[stage] += 1
+
+    @contextmanager
+    def measure(self, stage: str) -> Iterator[None]:
+        """with profiler.measure("stage"): ... 记录代码块耗时"""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.record(stage, end - start, end)
+
+    def samples(self, stage: str) -> np.ndarray:
+        """某阶段缓冲区内的样本 (n, 2)，按时间先后排列"""
+        with self._lock:
+            ring = self._rings.get(stage)
+            if ring is None:
+                return np.empty((0, 2))
+            count = self._counts[stage]
+            if count <= self.capacity:
+                return ring[:count].copy()
+            start = count % self.capacity
+            return np.concatenate((ring[start:], ring[:start]))
+
+    def stages(self) -> List[str]:
+        with self._lock:
+            return list(self._rings)
+
+    def percentiles(self, stage: str, qs: Tuple[float, ...] = PERCENTILES) -> Optional[np.ndarray]:
+        """最近样本耗时的分位数（毫秒），没有样本时返回None"""
+        durations = self.samples(stage)[:, 1]
+        if durations.size == 0:
+            return None
+        return np.percentile(durations, qs) * 1000.0
+
+    def rate(self, stage: str, window: float = 1.0) -> float:
+        """最近 window 秒内该阶段每秒发生的次数，用作帧率"""
+        timestamps = self.samples(stage)[:, 0]
+        if timestamps.size == 0:
+            return 0.0
+        recent = timestamps[timestamps >= time.perf_counter() - window]
+        return recent.size / window
+
+    def summary(self) -> List[Tuple[str, int, float, float, float, float, float]]:
+        """[(阶段, 样本数, 平均, p50, p90, p99, 最大)]，耗时单位毫秒"""
+        rows = []
+        for stage in self.stages():
+            durations = self.samples(stage)[:, 1] * 1000.0
+            if durations.size == 0:
+                continue
+            p50, p90, p99 = np.percentile(durations, PERCENTILES)
+            rows.append((stage, durations.size, durations.mean(), p50, p90, p99, durations.max()))
+        return rows
+
+    def reset(self) -> None:
+        """清空所有样本"""
+        with self._lock:
+            self._rings.clear()
+            self._counts.clear()
+
+
+def dump_csv(path: str, profilers: Dict[str, StageProfiler]) -> None:
+    """导出原始样本 (来源, 阶段, 时间戳秒, 耗时毫秒)，按来源和阶段分组、时间先后排列"""
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(("source", "stage", "timestamp_s", "duration_ms"))
+        for source, profiler in profilers.items():
+            for stage in profiler.stages():
+                for timestamp, seconds in profiler.samples(stage).tolist():
+                    writer.writerow((source, stage, f"{timestamp:.6f}", f"{seconds * 1000.0:.4f}"))
+
+
+def dump_summary_csv(path: str, profilers: Dict[str, StageProfiler]) -> None:
+    """导出各阶段的分位数汇总，数值与叠加层显示的一致"""
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(("source", "stage", "count", "mean_ms", "p50_ms", "p90_ms", "p99_ms", "max_ms"))
+        for source, profiler in profilers.items():
+            for stage, count, *values in profiler.summary():
+                writer.writerow((source, stage, count) + tuple(f"{v:.4f}" for v in values))
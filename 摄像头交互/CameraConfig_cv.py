@@ -140,8 +140,9 @@ class CamSetting(QtWidgets.QMainWindow):
 
         
 
-    def update_image(self, q_img):
-        pixmap = QPixmap.fromImage(q_img)
+    def update_image(self, index, q_img):
+        pixmap = QPixmap.fromImage(q_img)  # 像素已拷贝到pixmap，立即归还采集线程的缓冲区
+        self.camera_thread.release(index)
         ratio = max(q_img.width() / self.label.width(), q_img.height() / self.label.height())
         #pixmap.setDevicePixelRatio(ratio)
         self.label_17.setAlignment(Qt.AlignCenter)
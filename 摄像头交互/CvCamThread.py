@@ -3,11 +3,15 @@ from PyQt5.QtGui import QImage
 from PyQt5.QtCore import QCoreApplication
 import traceback
 from threading import Lock #在设置参数和读取帧时，使用线程锁确保同一时间只有一个线程访问摄像头
+from collections import deque
 import sys
 import cv2
+import numpy as np
 import time
 from pathlib import Path
 
+RING_SIZE = 3  # RGB帧缓冲区个数：采集线程写一个、界面持有一个、再留一个余量
+
 
 def excepthook(exc_type, exc_value, exc_tb):
     traceback.print_exception(exc_type, exc_value, exc_tb)
@@ -17,7 +21,13 @@ sys.excepthook = excepthook  # 重写异常钩子
 
 
 class CameraThread(QThread):
-    change_pixmap = pyqtSignal(QImage)  # 自定义信号，用于传递图像
+    """
+    采集线程。RGB帧写入预先分配的环形缓冲区，change_pixmap 发出 (缓冲区序号, 指向该缓冲区的QImage)，
+    QImage 不拷贝像素，接收方用完 (如 QPixmap.fromImage 之后) 必须调用 release(序号) 归还缓冲区，
+    归还前采集线程不会改写它。缓冲区全被占用时丢弃新帧 (计入 frames_dropped)，不会覆盖正在显示的图像。
+    分辨率不变时每帧不分配新的图像内存。
+    """
+    change_pixmap = pyqtSignal(int, QImage)  # 自定义信号，传递 (缓冲区序号, 图像)
     cap_initialized = pyqtSignal(int)  # 摄像头初始化信号
     recording=False  #录像状态
     img_save_path=str(Path(__file__).parent/"snap")  #拍照保存路径
@@ -30,6 +40,16 @@ class CameraThread(QThread):
         self.running = False
         self.cap = None
         self.lock = Lock()  # 创建线程锁
+        self.img = None  # 最新一帧BGR图像，cap.read 每帧复用这块内存
+        self.frames_dropped = 0  # 因缓冲区未归还而丢弃的帧数
+        # 环形缓冲区：序号只增不减，分辨率变化时追加一组新缓冲区，旧缓冲区在归还后释放
+        self._ring_lock = Lock()  # release 在界面线程调用，与采集线程分开加锁
+        self._buffers = []  # 序号 -> RGB数组 (已释放为None)
+        self._images = []  # 序号 -> 指向对应数组的QImage
+        self._free = deque()  # 当前这组中可写入的序号
+        self._outstanding = set()  # 已发出、尚未归还的序号
+        self._first_active = 0  # 当前这组缓冲区的起始序号
+        self._shape = None  # 当前这组缓冲区对应的BGR帧形状
 
     def run(self):
         self.cap = cv2.VideoCapture(self.cam_num)
@@ -41,17 +61,60 @@ class CameraThread(QThread):
         self.running = True
         while self.running:
             with self.lock:  # 加锁
-                ret, self.img = self.cap.read()
+                ret, frame = self.cap.read(self.img)  # 尺寸不变时读入原缓冲区
+                if ret:
+                    self.img = frame
             if ret:
-                rgb_image = cv2.cvtColor(self.img, cv2.COLOR_BGR2RGB)
-                h, w, ch = rgb_image.shape
-                bytes_per_line = ch * w
-                q_img = QImage(rgb_image.data, w, h, bytes_per_line, QImage.Format_RGB888)
-                self.change_pixmap.emit(q_img)  # 发送图像信号
                 if self.recording:
                     self.video.write(self.img)
+                index = self._acquire(self.img.shape)
+                if index is None:
+                    self.frames_dropped += 1
+                    continue
+                cv2.cvtColor(self.img, cv2.COLOR_BGR2RGB, dst=self._buffers[index])
+                self.change_pixmap.emit(index, self._images[index])  # 发送图像信号
         self.cap.release()
 
+    def _acquire(self, shape):
+        """取一个可写的缓冲区序号，帧形状变化时先分配新的一组；没有空闲缓冲区时返回None"""
+        with self._ring_lock:
+            if shape != self._shape:
+                self._allocate(shape)
+            if not self._free:
+                return None
+            index = self._free.popleft()
+            self._outstanding.add(index)
+            return index
+
+    def _allocate(self, shape):
+        """按新的帧形状分配一组缓冲区，旧组中空闲的立即释放，被占用的等归还时释放"""
+        for index in self._free:
+            self._buffers[index] = self._images[index] = None
+        self._free.clear()
+        self._first_active = len(self._buffers)
+        self._shape = shape
+        h, w = shape[:2]
+        for _ in range(RING_SIZE):
+            buffer = np.empty((h, w, 3), dtype=np.uint8)
+            self._free.append(len(self._buffers))
+            self._buffers.append(buffer)
+            self._images.append(QImage(buffer.data, w, h, 3 * w, QImage.Format_RGB888))
+
+    def release(self, index):
+        """
+        归还 change_pixmap 发出的缓冲区，之后不能再使用对应的QImage。
+        只接受已发出且未归还的序号，重复归还或不存在的序号被忽略，不会让同一缓冲区被发出两次。
+        """
+        with self._ring_lock:
+            if index not in self._outstanding:
+                print(f"忽略无效的缓冲区归还: {index}")
+                return
+            self._outstanding.remove(index)
+            if index >= self._first_active:
+                self._free.append(index)
+            else:
+                self._buffers[index] = self._images[index] = None  # 分辨率变化前的旧缓冲区
+
     def stop(self):
         self.running = False
         # 立即释放摄像头资源